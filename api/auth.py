@@ -0,0 +1,140 @@
+# auth.py
+"""
+共用的登入驗證 dependency，並以記憶體快取減少重複的 Token 簽章驗證與 Teachers 查詢。
+
+    @app.get("/get_my_classes")
+    async def get_my_classes(teacher_id: str = Depends(get_teacher_id), db: Session = Depends(get_db)):
+        ...
+
+- 已驗證的 Token 快取 AUTH_CACHE_TTL 秒 (不會超過 Token 本身的有效期限)
+- 老師的公開資料快取 AUTH_CACHE_TTL 秒
+- 登出時呼叫 invalidate_session() 立即失效
+- 快取在各個行程 (worker) 的記憶體中，不會共用：invalidate_session() 只清除處理該請求的 worker，
+  其他 worker 中的快取最多再保留 AUTH_CACHE_TTL 秒 (需要立即在所有 worker 失效時請設定 AUTH_CACHE_TTL=0)
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Request, status
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from security import load_session_token
+from sql.database import get_db
+
+# 快取的存活時間 (秒) 與筆數上限，AUTH_CACHE_TTL=0 表示不快取
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+SESSION_COOKIE = "session_token"
+
+
+class TTLCache:
+    """有筆數上限 (LRU 淘汰) 且每筆各自有過期時間的 thread-safe 快取"""
+
+    def __init__(self, max_items: int = AUTH_CACHE_SIZE):
+        self.max_items = max_items
+        self._items = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value, expires_at: float):
+        if self.max_items <= 0 or expires_at <= time.time():
+            return
+        with self._lock:
+            self._items[key] = (value, expires_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+# Token -> session 資料、老師 ID -> 公開資料
+SESSIONS = TTLCache()
+TEACHERS = TTLCache()
+
+
+def verify_session(token: Optional[str]) -> Optional[dict]:
+    """驗證 Token (先查快取)，有效時回傳 session 資料，否則回傳 None"""
+    if not token:
+        return None
+    session_data = SESSIONS.get(token)
+    if session_data is not None:
+        return session_data
+    loaded = load_session_token(token)
+    if loaded is None:
+        return None
+    session_data, token_expires_at = loaded
+    SESSIONS.put(token, session_data, min(time.time() + AUTH_CACHE_TTL, token_expires_at))
+    return session_data
+
+
+def get_session(request: Request) -> dict:
+    """Dependency：目前登入的 session 資料，未登入或 Token 無效時回應 401"""
+    session_token = request.cookies.get(SESSION_COOKIE)
+    if not session_token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="未驗證")
+    session_data = verify_session(session_token)
+    if not session_data:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session 過期或無效")
+    return session_data
+
+
+def get_teacher_id(session_data: dict = Depends(get_session)) -> str:
+    """Dependency：目前登入老師的 ID"""
+    teacher_id = session_data.get("user_id")
+    if not teacher_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session 資料無效")
+    return teacher_id
+
+
+def get_current_teacher(teacher_id: str = Depends(get_teacher_id), db: Session = Depends(get_db)) -> dict:
+    """Dependency：目前登入老師的公開資料 (id / name / office / account)，老師不存在時回應 401"""
+    teacher = TEACHERS.get(teacher_id)
+    if teacher is not None:
+        return teacher
+    result = db.execute(
+        text("SELECT id, name, office, account FROM Teachers WHERE id = :user_id LIMIT 1"),
+        {"user_id": teacher_id}
+    ).first()
+    if not result:
+        # Token 雖然有效但使用者不存在
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    teacher = {"id": result.id, "name": result.name, "office": result.office, "account": result.account}
+    TEACHERS.put(teacher_id, teacher, time.time() + AUTH_CACHE_TTL)
+    return teacher
+
+
+def invalidate_session(token: Optional[str]):
+    """登出時移除此 Token 的快取 (只影響目前的行程)"""
+    if token:
+        SESSIONS.pop(token)
+
+
+def clear():
+    SESSIONS.clear()
+    TEACHERS.clear()
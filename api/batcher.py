@@ -0,0 +1,101 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+from metrics import StageTimer
+
+# 動態 micro-batching：收集同時進行中的工作，最多等待 MICRO_BATCH_WAIT_MS 毫秒或湊滿上限後合併執行
+# (設為 0 表示關閉，每個呼叫直接執行)
+MICRO_BATCH_WAIT_MS = float(os.getenv("MICRO_BATCH_WAIT_MS", "5"))
+# 合併後的頁數上限即一次 forward 的 batch 大小，預設與 DETECT_BATCH_SIZE (GPU 記憶體上限) 相同
+MICRO_BATCH_MAX_PAGES = int(os.getenv("MICRO_BATCH_MAX_PAGES", os.getenv("DETECT_BATCH_SIZE", "8")))
+MICRO_BATCH_MAX_CROPS = int(os.getenv("MICRO_BATCH_MAX_CROPS", "256"))
+
+
+class _Request:
+    __slots__ = ("items", "future", "enqueued_at")
+
+    def __init__(self, items):
+        self.items = items
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    將多個 thread 同時送出的小批次合併成一個大批次執行，再把結果依原順序分回各呼叫端。
+
+    - fn(items, timer) 一次處理整個批次，回傳與 items 等長的結果列表；timer 為此批次的 StageTimer
+    - 第一個請求到達後最多等待 max_wait_ms，或累積到 max_items 個項目就開始執行；
+      加入後會超過 max_items 的請求留到下一批，合併的批次不會超過 max_items
+      (單一請求超過 max_items 時單獨成為一批，由 fn 自行分段)
+    - 只有一個 thread 執行 fn，模型不需要支援同時呼叫
+    """
+
+    def __init__(self, fn: Callable, max_items: int, max_wait_ms: float, name: str = "batcher"):
+        self.fn = fn
+        self.max_items = max(1, max_items)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=f"microbatch-{name}", daemon=True)
+        self._thread.start()
+
+    def run(self, items: List, timer: Optional[StageTimer] = None) -> List:
+        """
+        送出 items 並等待結果。timer 會記錄等待合併的時間 (batch_wait)，
+        以及所屬批次各階段耗時中依項目數比例分攤的部分。
+        """
+        if not items:
+            return []
+        request = _Request(list(items))
+        self._queue.put(request)
+        results, batch_timer, share, wait = request.future.result()
+        if timer is not None:
+            timer.add("batch_wait", wait)
+            for name, seconds in batch_timer.totals.items():
+                timer.add(name, seconds * share)
+        return results
+
+    def _loop(self):
+        held = None  # 上一批放不下、留到這一批的請求
+        while True:
+            batch = [held if held is not None else self._queue.get()]
+            held = None
+            count = len(batch[0].items)
+            deadline = time.perf_counter() + self.max_wait
+            while count < self.max_items:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if count + len(request.items) > self.max_items:
+                    held = request
+                    break
+                batch.append(request)
+                count += len(request.items)
+            self._execute(batch, count)
+
+    def _execute(self, batch: List[_Request], count: int):
+        started = time.perf_counter()
+        items = [item for request in batch for item in request.items]
+        batch_timer = StageTimer()
+        try:
+            results = self.fn(items, batch_timer)
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        offset = 0
+        for request in batch:
+            n = len(request.items)
+            request.future.set_result(
+                (results[offset:offset + n], batch_timer, n / count, started - request.enqueued_at)
+            )
+            offset += n
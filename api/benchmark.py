@@ -0,0 +1,270 @@
+# benchmark.py
+"""
+批改流程的端對端效能測試 (不需要資料庫，可在只有 CPU 的機器上執行)。
+
+產生合成考卷 (已知位置的題號與手寫風格作答)，以不同解析度與頁數執行完整的
+detect_images_v2 流程，輸出 pages/sec、各階段 p50 / p95 延遲與 peak RSS。
+每組 (解析度, 頁數) 在獨立的子行程中執行 (載入模型 + 暖機 + 測試)，peak RSS 為該組自己的峰值。
+
+    python benchmark.py --resolutions 827x1169,1240x1754 --pages 1,8,32
+    python benchmark.py --backend onnxruntime --onnx weights/yolobest.onnx --json bench.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+try:
+    import resource  # Linux / macOS
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+LETTERS = ["A", "B", "C", "D"]
+
+# A4 於 100 / 150 / 200 DPI
+DEFAULT_RESOLUTIONS = "827x1169,1240x1754,1654x2339"
+DEFAULT_PAGES = "1,8,32"
+
+
+def render_exam_page(width, height, answers, rng):
+    """
+    繪製一頁合成考卷：每題一列「( 作答 ) 題號. 題目文字」。
+    - answers: {題號: 作答字母}，作答以手寫風格字型、隨機偏移 / 旋轉 / 粗細繪製在括號內
+    回傳 BGR 影像。
+    """
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    scale = width / 827  # 以 100 DPI 的版面為基準等比例放大
+    margin = int(60 * scale)
+    row_height = (height - 2 * margin) // max(len(answers), 1)
+    box = int(min(row_height * 0.7, 70 * scale))
+
+    for row, (number, letter) in enumerate(answers.items()):
+        top = margin + row * row_height + (row_height - box) // 2
+        left = margin
+
+        # 作答括號
+        cv2.putText(img, "(", (left, top + int(box * 0.85)), cv2.FONT_HERSHEY_SIMPLEX, box / 40, (0, 0, 0), 2)
+        cv2.putText(img, ")", (left + int(box * 1.6), top + int(box * 0.85)), cv2.FONT_HERSHEY_SIMPLEX,
+                    box / 40, (0, 0, 0), 2)
+
+        # 手寫風格作答：先畫在小圖上再旋轉，模擬筆跡的傾斜
+        patch = np.full((box, box), 255, dtype=np.uint8)
+        thickness = int(rng.integers(2, 5))
+        font_scale = box / 35 * rng.uniform(0.8, 1.0)
+        (text_w, text_h), _ = cv2.getTextSize(letter, cv2.FONT_HERSHEY_SCRIPT_SIMPLEX, font_scale, thickness)
+        origin = ((box - text_w) // 2 + int(rng.integers(-3, 4)), (box + text_h) // 2 + int(rng.integers(-3, 4)))
+        cv2.putText(patch, letter, origin, cv2.FONT_HERSHEY_SCRIPT_SIMPLEX, font_scale, 0, thickness, cv2.LINE_AA)
+        rotation = cv2.getRotationMatrix2D((box / 2, box / 2), rng.uniform(-12, 12), 1.0)
+        patch = cv2.warpAffine(patch, rotation, (box, box), borderValue=255)
+        x0 = left + int(box * 0.45)
+        img[top:top + box, x0:x0 + box] = np.minimum(img[top:top + box, x0:x0 + box], patch[..., None])
+
+        # 題號與題目文字
+        text_x = left + int(box * 2.4)
+        baseline = top + int(box * 0.8)
+        cv2.putText(img, f"{number}.", (text_x, baseline), cv2.FONT_HERSHEY_SIMPLEX, box / 45, (0, 0, 0), 2)
+        filler_x = text_x + int(box * 1.3)
+        for _ in range(int(rng.integers(3, 7))):
+            word_w = int(rng.integers(2, 6) * box * 0.35)
+            if filler_x + word_w > width - margin:
+                break
+            cv2.rectangle(img, (filler_x, baseline - int(box * 0.35)), (filler_x + word_w, baseline),
+                          (90, 90, 90), -1)
+            filler_x += word_w + int(box * 0.25)
+
+    return img
+
+
+def generate_exam(out_dir, width, height, pages, questions, seed=0):
+    """
+    產生 pages 頁合成考卷，回傳 (圖片路徑列表, correct_answers)。
+    所有頁面使用同一份答案，correct_answers 格式與 grade_results 相同。
+    """
+    rng = np.random.default_rng(seed)
+    answers = {str(n): LETTERS[int(rng.integers(len(LETTERS)))] for n in range(1, questions + 1)}
+    correct_answers = {number: {"answer": letter, "score": 1} for number, letter in answers.items()}
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for n in range(pages):
+        path = out_dir / f"page_{width}x{height}_{n:04d}.jpg"
+        cv2.imwrite(str(path), render_exam_page(width, height, answers, rng), [cv2.IMWRITE_JPEG_QUALITY, 90])
+        paths.append(str(path))
+    return paths, correct_answers
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def peak_rss_mb():
+    """目前行程 (開始執行至今) 的 peak RSS (MB)"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 單位為 KB，macOS 為 bytes
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 1024 / 1024
+    return None
+
+
+def run_case(detector, width, height, pages, questions, batch_size, work_dir):
+    """以一組 (解析度, 頁數) 執行完整流程，回傳統計結果"""
+    from detect import detect_images_v2
+
+    photo_dir = Path(work_dir) / f"{width}x{height}_{pages}"
+    paths, correct_answers = generate_exam(photo_dir, width, height, pages, questions)
+    page_ids = [f"bench-{n}" for n in range(pages)]
+    exam_id = f"_bench_{os.getpid()}_{width}x{height}_{pages}"
+
+    try:
+        t0 = time.perf_counter()
+        results = detect_images_v2(paths, page_ids, detector, exam_id, correct_answers, batch_size=batch_size)
+        elapsed = time.perf_counter() - t0
+    finally:
+        # detect_images_v2 將結果圖寫在 data/<exam_id>
+        shutil.rmtree(Path("data") / exam_id, ignore_errors=True)
+
+    stage_values = {}
+    page_totals = []
+    for result in results:
+        for stage, seconds in result["timings"].items():
+            stage_values.setdefault(stage, []).append(seconds)
+        page_totals.append(sum(result["timings"].values()))
+
+    max_score = sum(entry["score"] for entry in correct_answers.values())
+    scores = [result["grading_results"]["total_score"] / max_score for result in results]
+
+    return {
+        "resolution": f"{width}x{height}",
+        "pages": pages,
+        "graded_pages": len(results),
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(pages / elapsed, 3) if elapsed else None,
+        "page_p50": round(percentile(page_totals, 50), 4),
+        "page_p95": round(percentile(page_totals, 95), 4),
+        "stages": {
+            stage: {"p50": round(percentile(values, 50), 4), "p95": round(percentile(values, 95), 4)}
+            for stage, values in stage_values.items()
+        },
+        "accuracy": round(float(np.mean(scores)), 4) if scores else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def print_report(report):
+    print(f"backend={report['backend']} batch_size={report['batch_size']} "
+          f"questions={report['questions']} load_seconds={report['load_seconds']}")
+    header = f"{'resolution':>11} {'pages':>5} {'graded':>6} {'pages/s':>8} {'p50':>7} {'p95':>7} " \
+             f"{'acc':>5} {'rss MB':>7}"
+    print(header)
+    for case in report["cases"]:
+        print(f"{case['resolution']:>11} {case['pages']:>5} {case['graded_pages']:>6} {case['pages_per_sec']:>8} "
+              f"{case['page_p50']:>7} {case['page_p95']:>7} {case['accuracy']:>5} {case['peak_rss_mb'] or 0:>7.0f}")
+        for stage, stats in case["stages"].items():
+            print(f"{'':>11}   {stage:<10} p50={stats['p50']:<8} p95={stats['p95']}")
+
+
+def run_isolated(opt, width, height, pages, work_dir):
+    """在子行程中執行一組測試 (見 main 的 --case)，回傳該組的統計結果"""
+    out = Path(work_dir) / f"case_{width}x{height}_{pages}.json"
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "--case", f"{width}x{height}:{pages}", "--case-json", str(out),
+        "--weights", opt.weights, "--backend", opt.backend, "--questions", str(opt.questions),
+        "--batch-size", str(opt.batch_size),
+    ]
+    if opt.onnx:
+        cmd += ["--onnx", opt.onnx]
+    if opt.gpu:
+        cmd.append("--gpu")
+    subprocess.run(cmd, check=True)
+    return json.loads(out.read_text())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批改流程效能測試 (合成考卷，不需資料庫)")
+    parser.add_argument("--weights", type=str, default="weights/yolobest.pt")
+    parser.add_argument("--backend", type=str, default="torchscript", help="torch / torchscript / onnxruntime")
+    parser.add_argument("--onnx", type=str, default=None, help="onnxruntime 後端使用的 ONNX 模型")
+    parser.add_argument("--resolutions", type=str, default=DEFAULT_RESOLUTIONS, help="WxH，以逗號分隔")
+    parser.add_argument("--pages", type=str, default=DEFAULT_PAGES, help="每組測試的頁數，以逗號分隔")
+    parser.add_argument("--questions", type=int, default=10, help="每頁題數")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--gpu", action="store_true", help="允許使用 GPU (預設只用 CPU)")
+    parser.add_argument("--json", type=str, default=None, help="將結果另存為 JSON")
+    # 內部使用：子行程只執行一組 WxH:pages，結果寫到 --case-json
+    parser.add_argument("--case", type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--case-json", type=str, default=None, help=argparse.SUPPRESS)
+    opt = parser.parse_args()
+
+    if not opt.gpu:
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    # 只量測批改流程：結果圖縮圖不在背景預先產生 (避免與下一組測試搶 CPU，或在資料夾刪除後才寫入)
+    os.environ.setdefault("OVERLAY_PRERENDER", "0")
+
+    if opt.case:
+        run_child(opt)
+        return
+
+    resolutions = [tuple(int(v) for v in r.lower().split("x")) for r in opt.resolutions.split(",")]
+    page_counts = [int(n) for n in opt.pages.split(",")]
+
+    with tempfile.TemporaryDirectory(prefix="grading_bench_") as work_dir:
+        cases = [
+            run_isolated(opt, width, height, pages, work_dir)
+            for width, height in resolutions
+            for pages in page_counts
+        ]
+
+    report = {
+        "backend": opt.backend,
+        "batch_size": opt.batch_size,
+        "questions": opt.questions,
+        "load_seconds": cases[0]["load_seconds"] if cases else None,
+        "cases": cases,
+    }
+    print_report(report)
+    if opt.json:
+        Path(opt.json).write_text(json.dumps(report, indent=2))
+
+
+def run_child(opt):
+    """子行程：載入模型、暖機後執行一組測試，結果 (含本行程的 peak RSS) 寫到 opt.case_json"""
+    from logs import setup_logging
+    from model_loader import initialize_model
+
+    setup_logging(level="WARNING")
+
+    resolution, pages = opt.case.split(":")
+    width, height = (int(v) for v in resolution.lower().split("x"))
+
+    t0 = time.perf_counter()
+    detector = initialize_model(opt.weights, backend=opt.backend, onnx_path=opt.onnx)["detector"]
+    load_seconds = round(time.perf_counter() - t0, 3)
+
+    with tempfile.TemporaryDirectory(prefix="grading_bench_") as work_dir:
+        # 暖機：第一次呼叫會載入手寫模型、建立 Tesseract 引擎池，不列入統計
+        run_case(detector, width, height, 1, opt.questions, opt.batch_size, Path(work_dir) / "warmup")
+        case = run_case(detector, width, height, int(pages), opt.questions, opt.batch_size, work_dir)
+
+    case["load_seconds"] = load_seconds
+    Path(opt.case_json).write_text(json.dumps(case))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# benchmark_login.py
+"""
+登入密碼驗證 (bcrypt) 的吞吐量測試 (不需要資料庫)。
+
+以 security.PasswordHasher 在不同 thread 數下同時驗證 N 筆登入，輸出 logins/sec、
+每筆 p50 / p95 延遲，以及相對於單一 thread 的加速倍數，確認 bcrypt 能分散到多個核心。
+
+    python benchmark_login.py --logins 64 --rounds 12
+    python benchmark_login.py --workers 1,2,4,8 --json login_bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+
+from passlib.context import CryptContext
+
+from security import PasswordHasher
+
+PASSWORD = "correct horse battery staple"
+
+
+def default_workers():
+    """1, 2, 4, ... 到 CPU 核心數"""
+    cpus = os.cpu_count() or 1
+    workers = [1]
+    while workers[-1] * 2 < cpus:
+        workers.append(workers[-1] * 2)
+    if workers[-1] != cpus:
+        workers.append(cpus)
+    return ",".join(str(n) for n in workers)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+async def run_case(context, hashed, workers, logins):
+    """以 workers 個 thread 同時驗證 logins 筆登入，回傳統計結果"""
+    hasher = PasswordHasher(workers=workers, context=context)
+    latencies = []
+
+    async def login():
+        started = time.perf_counter()
+        ok = await hasher.verify(PASSWORD, hashed)
+        latencies.append(time.perf_counter() - started)
+        return ok
+
+    try:
+        # 暖機：建立 thread，不列入統計
+        await asyncio.gather(*(hasher.verify(PASSWORD, hashed) for _ in range(workers)))
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - t0
+    finally:
+        hasher.shutdown()
+
+    assert all(results), "密碼驗證失敗"
+    return {
+        "workers": workers,
+        "logins": logins,
+        "seconds": round(elapsed, 3),
+        "logins_per_sec": round(logins / elapsed, 2) if elapsed else None,
+        "p50": round(percentile(latencies, 50), 4),
+        "p95": round(percentile(latencies, 95), 4),
+    }
+
+
+def print_report(report):
+    print(f"rounds={report['rounds']} cpus={report['cpus']} "
+          f"single_hash_seconds={report['single_hash_seconds']}")
+    print(f"{'workers':>7} {'logins':>6} {'logins/s':>9} {'p50':>7} {'p95':>7} {'speedup':>7}")
+    for case in report["cases"]:
+        print(f"{case['workers']:>7} {case['logins']:>6} {case['logins_per_sec']:>9} {case['p50']:>7} "
+              f"{case['p95']:>7} {case['speedup']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="登入密碼驗證吞吐量測試 (不需資料庫)")
+    parser.add_argument("--workers", type=str, default=default_workers(), help="thread 數，以逗號分隔")
+    parser.add_argument("--logins", type=int, default=32, help="每組測試同時送出的登入數")
+    parser.add_argument("--rounds", type=int, default=int(os.getenv("BCRYPT_ROUNDS", "12")),
+                        help="bcrypt cost factor")
+    parser.add_argument("--json", type=str, default=None, help="將結果另存為 JSON")
+    opt = parser.parse_args()
+
+    context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=opt.rounds)
+    t0 = time.perf_counter()
+    hashed = context.hash(PASSWORD)
+    single_hash_seconds = round(time.perf_counter() - t0, 4)
+
+    cases = [
+        asyncio.run(run_case(context, hashed, int(workers), opt.logins))
+        for workers in opt.workers.split(",")
+    ]
+    baseline = cases[0]["logins_per_sec"] or 0
+    for case in cases:
+        case["speedup"] = round(case["logins_per_sec"] / baseline, 2) if baseline else None
+
+    report = {
+        "rounds": opt.rounds,
+        "cpus": os.cpu_count(),
+        "single_hash_seconds": single_hash_seconds,
+        "cases": cases,
+    }
+    print_report(report)
+    if opt.json:
+        Path(opt.json).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
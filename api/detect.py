@@ -1,25 +1,26 @@
+import logging
+import os
 import time
 from pathlib import Path
 
 import cv2
-import torch
-import torch.backends.cudnn as cudnn
 from numpy import random
 
-from models.experimental import attempt_load
-from utils.datasets import LoadImages
-from utils.general import check_img_size, non_max_suppression, apply_classifier, \
-    scale_coords, xyxy2xywh, set_logging, increment_path
-from utils.plots import plot_one_box
-from utils.torch_utils import select_device, load_classifier, time_synchronized, TracedModel
+# 只 import 不依賴 torch 的工具，onnxruntime 後端的節點不需要載入 torch
+from utils.inference_utils import LoadImageBatches, plot_one_box, scale_boxes
 
-from ocr.handwrite import detect_handwrite
-from view.bbox import BBox
-from view.save import ImageSaver
-from search.questionItemMatcher import QuestionItemMatcher
-from ocr.item import extract_text_from_bbox
+from ocr.handwrite import detect_handwrite, classify_handwrite_crops, HANDWRITE_WEIGHTS
+from view.overlay import write_spec, overlay_paths, get_renderer, OVERLAY_PRERENDER
+from view.detections import Detections
+from search.questionItemMatcher import QuestionItemMatcher, MATCH_NEAREST
+from search.pageLayoutIndex import PageLayoutIndex
 
-from detect_tesseract import TesseractOCRDetector
+from model_registry import MODELS
+from vision_cache import file_sha256
+from metrics import StageTimer
+from logs import log_event
+
+logger = logging.getLogger(__name__)
 
 
 CLASS_TABLE = [
@@ -31,6 +32,27 @@ CLASS_TABLE = [
     "item"
 ]
 
+# 視覺辨識流程 (閾值、前處理、配對規則) 有變動時請調整此版本號，使舊的快取失效
+PIPELINE_VERSION = "3"
+
+# VisionCache 只保存與測驗無關的辨識結果；結果圖描述檔與路徑每次依測驗的資料夾重新產生
+CACHED_FIELDS = ('detections', 'mapped_results', 'links', 'shape')
+
+# 題號 / 作答與 item 的配對模式：nearest (最近) 或 hungarian (全域最佳一對一，需要 scipy)
+MATCH_MODE = os.getenv("MATCH_MODE", MATCH_NEAREST)
+
+def exam_save_dir(exam_id):
+    """測驗的結果圖資料夾 (描述檔與結果圖)，結果圖路徑可由此與原圖路徑推得 (view.overlay.overlay_paths)"""
+    return Path("data") / exam_id
+
+
+def build_model_version(detector):
+    """
+    組合視覺辨識結果快取使用的模型版本：流程版本 + 配對模式 + 推論後端 + YOLO 權重雜湊 + 手寫模型權重雜湊。
+    """
+    return (f"{PIPELINE_VERSION}-{MATCH_MODE}-{detector.backend}-{file_sha256(detector.weights_path)[:16]}"
+            f"-{file_sha256(HANDWRITE_WEIGHTS)[:16]}")
+
 def detect_images(
     source_path, 
     model, # <--- 接收已載入的模型物件
@@ -38,6 +60,14 @@ def detect_images(
     half, # <--- 接收 half precision 狀態
     imgsz, # <--- 接收圖片大小
 ):
+    # 舊版流程 (/test_demo)，直接使用 PyTorch 模型
+    import torch
+    from utils.datasets import LoadImages
+    from utils.general import non_max_suppression, scale_coords, increment_path
+    from view.bbox import BBox
+    from view.save import ImageSaver
+    from ocr.item import extract_text_from_bbox
+
     # Settings (Fixed as per request)
     conf_thres = 0.25
     iou_thres = 0.45
@@ -188,10 +218,9 @@ def detect_images(
                 step3_img.save()
                 cv2.imwrite(save_path, im0)
                 cv2.imwrite(copy_save_path, im0s)
-                print(f"The image with the result is saved in: {save_path}")
+                log_event(logger, logging.INFO, "demo_result_saved", path=save_path)
 
-    print(results)
-    print(f'Done. ({time.time() - t0:.3f}s)')
+    log_event(logger, logging.INFO, "detect_done", results=results, seconds=round(time.time() - t0, 3))
     return True
 
 import re
@@ -249,195 +278,289 @@ def grade_results(mapped_results, correct_answers):
 def detect_images_v2(
     photo_paths,
     page_ids,
-    model,
-    device,
-    half,
-    imgsz,
+    detector,
     exam_id,
-    correct_answers
+    correct_answers,
+    batch_size=8,
+    cache=None,
+    model_version=None,
+    timer=None
 ):
     """
-    V2 版本物件偵測函式，專為 API 呼叫設計。
+    V2 版本物件偵測函式，專為 API 呼叫設計 (analyze_pages + grade_pages)。
     
     Args:
         photo_paths (list): 包含一個或多個圖片路徑的列表。
         page_ids (list): 包含每個圖片對應的 exam_page_id。
-        model: 已載入的 YOLOv7 模型物件。
-        device: 運行的設備 (例如 'cpu' 或 '0')。
-        half (bool): 是否使用半精度浮點數 (FP16)。
-        imgsz (int): 模型輸入圖片的尺寸。
+        detector (Detector): 由 model_loader.initialize_model 建立的偵測後端 (torch / torchscript / onnxruntime)。
         exam_id (str): 考試的唯一ID，用於建立結果儲存資料夾。
         correct_answers (dict): 包含正確答案的字典，用於批改功能。
+        batch_size (int): 每次推論的頁數。所有頁面會 letterbox 成固定大小後疊成一個 batch，
+            每個 batch 只做一次 forward 與一次 NMS。
+        cache (VisionCache): 視覺辨識結果快取 (可選)。照片內容與 model_version 都相同的頁面
+            會直接使用快取的偵測與 OCR 結果，只重新執行 grade_results。
+        model_version (str): 快取使用的模型版本，見 build_model_version()。
+        timer (StageTimer): 整份考卷的計時器 (可選)，所有頁面的各階段耗時會累加進來。
 
     Returns:
-        list: 包含每張圖片處理結果的列表，每個項目包括 page_id、grading_results 和 save_paths。
+        list: 包含每張圖片處理結果的列表，每個項目包括 page_id、grading_results、save_paths
+            與 timings (此頁各階段耗時，batch 階段依頁數平均分攤)。
     """
-    # Settings (固定參數)
-    conf_thres = 0.25
-    iou_thres = 0.45
-    save_img = True
-    save_txt = False
-    save_conf = False
-    augment = False
-    agnostic_nms = False
-    trace = True
-    
-    # 路徑
-    project = 'data/'
-    name = exam_id
-    exist_ok = True
-    
-    # 建立結果儲存的目錄
-    save_dir = Path(increment_path(Path(project) / name, exist_ok=exist_ok))
-    (save_dir / 'labels' if save_txt else save_dir).mkdir(parents=True, exist_ok=True)
-    ImageSaver.set_save_dir(save_dir)
+    t0 = time.perf_counter()
+    page_results, page_timers = analyze_pages(
+        photo_paths, page_ids, detector, exam_id,
+        batch_size=batch_size, cache=cache, model_version=model_version
+    )
+    results = grade_pages(page_ids, page_results, page_timers, correct_answers, exam_id, timer=timer)
+    log_event(logger, logging.INFO, "detect_done", exam_id=exam_id, pages=len(page_ids), graded=len(results),
+              seconds=round(time.perf_counter() - t0, 3))
+    return results
 
-    # 獲取類別名稱和顏色
-    names = model.module.names if hasattr(model, 'module') else model.names
-    colors = [[random.randint(0, 255) for _ in range(3)] for _ in names]
+def analyze_pages(
+    photo_paths,
+    page_ids,
+    detector,
+    exam_id,
+    batch_size=8,
+    cache=None,
+    model_version=None,
+    images=None
+):
+    """
+    視覺辨識 (YOLO、手寫辨識、題號 OCR 與配對、結果圖描述檔)，不含批改。
+    參數與 detect_images_v2 相同；images 為已解碼的 BGR 圖片 (與 photo_paths 同順序，可選，
+    例如推論行程由共享記憶體取得的圖片)，提供時不再從磁碟讀取。
 
-    # 設定資料載入器
-    stride = int(model.stride.max())
-    datasets = [LoadImages(path, img_size=imgsz, stride=stride) for path in photo_paths]
+    Returns:
+        tuple: (page_results, page_timers)
+            page_results: {exam_page_id: {'detections', 'mapped_results', 'links', 'shape', 'overlay', 'save_paths'}}
+                detections 為 Detections.to_compact() 的精簡格式，overlay 為結果圖描述檔，
+                save_paths 為結果圖 (縮圖) 路徑，見 view.overlay
+            page_timers: {exam_page_id: StageTimer}
+    """
+    # 建立結果儲存的目錄
+    # 不使用 ImageSaver 的全域目錄，避免多個批改工作同時執行時互相覆蓋
+    save_dir = exam_save_dir(exam_id)
+    save_dir.mkdir(parents=True, exist_ok=True)
+
+    page_results = {}  # exam_page_id -> 視覺辨識結果 (detections / mapped_results / links / overlay / save_paths)
+    page_timers = {page_id: StageTimer() for page_id in page_ids}
+
+    def write_overlay(page_id, path, shape, page_result):
+        # 結果圖只寫出描述檔 (在此測驗的資料夾)，縮圖在背景 (或第一次被請求時) 才繪製，不佔用批改時間
+        with page_timers[page_id].stage("overlay"):
+            page_result['overlay'] = write_spec(save_dir, path, shape, page_result['detections'],
+                                                page_result['links'])
+            page_result['save_paths'] = overlay_paths(save_dir, path)
+            if OVERLAY_PRERENDER:
+                get_renderer().schedule(page_result['overlay'])
+
+    # 先查快取：照片內容與模型版本都相同的頁面，不需重跑 YOLO / 手寫 / OCR。
+    # 快取只有辨識結果 (可能來自其他測驗的同一張照片)，結果圖描述檔一律寫在此測驗的資料夾
+    use_cache = cache is not None and model_version
+    image_hashes = {}
+    if use_cache:
+        cache_timer = StageTimer()
+        with cache_timer.stage("cache"):
+            image_hashes = {page_id: file_sha256(path) for page_id, path in zip(page_ids, photo_paths)}
+            cached = cache.get_many(list(image_hashes.values()), model_version)
+        _share_timer(cache_timer, [page_timers[page_id] for page_id in page_ids])
+        for page_id, path in zip(page_ids, photo_paths):
+            hit = cached.get(image_hashes[page_id])
+            if hit is None or 'shape' not in hit:
+                continue
+            page_result = {field: hit[field] for field in CACHED_FIELDS}
+            write_overlay(page_id, path, page_result['shape'], page_result)
+            page_results[page_id] = page_result
+        if page_results:
+            log_event(logger, logging.INFO, "vision_cache_hit", exam_id=exam_id,
+                      hits=len(page_results), pages=len(page_ids))
+
+    pending = [n for n, page_id in enumerate(page_ids) if page_id not in page_results]
+    pending_ids = [page_ids[n] for n in pending]
+
+    # 設定資料載入器 (固定大小的批次)
+    pending_images = [images[n] for n in pending] if images is not None else None
+    dataset = LoadImageBatches([photo_paths[n] for n in pending], img_size=detector.imgsz, stride=detector.stride,
+                               batch_size=batch_size, images=pending_images)
+    
+    # 常駐的 Tesseract 引擎池，整個行程共用
+    tesseractOcrEngine = MODELS.get("tesseract")
     
     # 執行推論
+    load_started = time.perf_counter()
+    for indices, paths, img, im0s_batch in dataset:
+        # batch 階段 (讀圖 + letterbox、forward、NMS、手寫辨識) 的耗時平均分攤到此 batch 的每一頁
+        batch_timer = StageTimer()
+        batch_timer.add("load", time.perf_counter() - load_started)
+
+        # 推論 + NMS (整個 batch 一次)，回傳每頁一個 (n,6) numpy 陣列
+        pred = detector.predict(img, timer=batch_timer)
+
+        # 將結果拆回各自的 page_id，座標還原為原圖尺寸並由上而下排序
+        pages = []
+        for page_idx, path, det, im0s in zip(indices, paths, pred, im0s_batch):
+            page_id = pending_ids[page_idx]
+            if not len(det):
+                page_results[page_id] = {'detections': Detections.from_array(det).to_compact(CLASS_TABLE),
+                                         'mapped_results': {}, 'links': [], 'save_paths': []}
+                continue
+            det[:, :4] = scale_boxes(img.shape[2:], det[:, :4], im0s.shape).round()
+            pages.append((page_id, path, Detections.from_array(det).sorted_by_center_y(), im0s))
+
+        # 手寫辨識：整個 batch 所有 answer 框一次送進模型 (結果寫入各頁 Detections 的 text / score)
+        with batch_timer.stage("handwrite"):
+            _classify_answers(pages)
+        _share_timer(batch_timer, [page_timers[pending_ids[page_idx]] for page_idx in indices])
+
+        for page_id, path, dets, im0s in pages:
+            page_result = _analyze_page(dets, im0s, tesseractOcrEngine, timer=page_timers[page_id])
+            page_result['shape'] = list(im0s.shape[:2])
+            write_overlay(page_id, path, im0s.shape, page_result)
+            page_results[page_id] = page_result
+
+        if use_cache:
+            for page_id, _, _, _ in pages:
+                with page_timers[page_id].stage("cache"):
+                    cache.put(image_hashes[page_id], model_version,
+                              {field: page_results[page_id][field] for field in CACHED_FIELDS})
+
+        load_started = time.perf_counter()
+
+    return page_results, page_timers
+
+def grade_pages(page_ids, page_results, page_timers, correct_answers, exam_id, timer=None):
+    """
+    依 analyze_pages 的結果批改，並將各頁耗時記錄到 metrics。
+
+    Returns:
+        list: 同 detect_images_v2 (沒有任何偵測框的頁面不列入結果)。
+    """
+    # 批改：依頁面順序輸出 (沒有任何偵測框的頁面不列入結果)
     results = []
-    t0 = time.time()
-    
-    tesseractOcrEngine = TesseractOCRDetector()
-    
-    for page_id, dataset in zip(page_ids, datasets):
-        for path, img, im0s, vid_cap in dataset:
-            img = torch.from_numpy(img).to(device)
-            img = img.half() if half else img.float()
-            img /= 255.0
-            if img.ndimension() == 3:
-                img = img.unsqueeze(0)
-
-            # 推論
-            with torch.no_grad():
-                pred = model(img, augment=augment)[0]
-
-            # 應用非極大值抑制 (NMS)
-            pred = non_max_suppression(pred, conf_thres, iou_thres, agnostic=agnostic_nms)
-            
-            # 處理偵測結果
-            for i, det in enumerate(pred):
-                p = Path(path)
-                im0 = im0s.copy()
-                original = im0s.copy()
+    for page_id in page_ids:
+        page_result = page_results[page_id]
+        page_timer = page_timers[page_id]
+        if page_result['detections']['cls']:
+            with page_timer.stage("grade"):
+                grading_results = grade_results(page_result['mapped_results'], correct_answers)
+            log_event(logger, logging.DEBUG, "page_graded", exam_id=exam_id, exam_page_id=page_id,
+                      mapped_results=page_result['mapped_results'], grading_results=grading_results)
+            results.append({
+                'exam_page_id': page_id,
+                'grading_results': grading_results,
+                'save_paths': page_result['save_paths'],
+                # 偵測框、辨識文字與配對連線 (精簡格式)，存入 ai_result.detections 供 /ai/overlay 重新繪製
+                'detections': {
+                    'shape': page_result.get('shape'),
+                    'detections': page_result['detections'],
+                    'links': page_result['links'],
+                },
+                'timings': page_timer.as_dict()
+            })
+
+        page_timer.observe()
+        log_event(logger, logging.INFO, "page_done", exam_id=exam_id, exam_page_id=page_id,
+                  detections=len(page_result['detections']['cls']), seconds=round(page_timer.total(), 4),
+                  stages=page_timer.as_dict())
+        if timer is not None:
+            timer.merge(page_timer)
+
+    return results
+
+def _share_timer(batch_timer, page_timers):
+    """將一個 batch 的各階段耗時平均分攤到 batch 內的每一頁"""
+    if not page_timers:
+        return
+    for name, seconds in batch_timer.totals.items():
+        for page_timer in page_timers:
+            page_timer.add(name, seconds / len(page_timers))
+
+def _classify_answers(pages):
+    """
+    收集多個頁面中所有 "answer" 框的 crop，以一次批次呼叫完成手寫辨識。
+
+    Args:
+        pages (list): [(page_id, path, dets, im0s), ...]，dets 為 Detections，座標為原圖尺寸。
+
+    結果直接寫入各頁 dets.text / dets.score，低信心 (UNKNOWN) 的結果 text 為 None。
+    """
+    answer_class = CLASS_TABLE.index("answer")
+    crops = []
+    owners = []
+    for _, _, dets, im0s in pages:
+        for box_n in dets.indices_of(answer_class):
+            x1, y1, x2, y2 = dets.xyxy[box_n]
+            crops.append(im0s[y1:y2, x1:x2])
+            owners.append((dets, box_n))
+
+    for (dets, box_n), (predicted_text, score) in zip(owners, classify_handwrite_crops(crops)):
+        dets.text[box_n] = None if predicted_text == "UNKNOWN" else predicted_text
+        dets.score[box_n] = score
+
+def _analyze_page(dets, im0s, tesseractOcrEngine, timer=None):
+    """
+    處理單一頁面的偵測結果：題號配對與 OCR (不含批改與結果圖，結果可被快取)。
+
+    Args:
+        dets (Detections): 此頁 NMS 後的偵測框，已還原為原圖座標、由上而下排序，並含 _classify_answers 的手寫辨識文字。
+        im0s (ndarray): 原始圖片 (BGR)，不會被修改。
+        timer (StageTimer): 累計此頁 match / ocr 階段的耗時 (可選)。
+
+    Returns:
+        dict: detections (偵測框與辨識文字，Detections.to_compact() 格式)、mapped_results ({題號: 作答})
+            與 links (結果圖的配對連線)。
+    """
+    timer = timer or StageTimer()
+    with timer.stage("match"):
+        # 同一頁的題號與作答配對共用一個空間索引
+        layout = PageLayoutIndex(dets.as_array())
+        matcher = QuestionItemMatcher(None, question_class=0, item_class=5, max_distance=None, mode=MATCH_MODE,
+                                      index=layout)
+        matcher_answer = QuestionItemMatcher(None, question_class=1, item_class=5, max_distance=None,
+                                             mode=MATCH_MODE, index=layout)
+        groups = matcher.match()
+        groups_answer = matcher_answer.match()
+        valid_items = set()
+
+    with timer.stage("ocr"):
+        # 題號 OCR：此頁所有配對到的 item 一次送進 Tesseract 引擎池
+        ocr_indices = sorted({i_idx for item_indices in groups.values() for i_idx in item_indices})
+        ocr_crops = []
+        for i_idx in ocr_indices:
+            x1, y1, x2, y2 = dets.xyxy[i_idx]
+            ocr_crops.append(im0s[y1:y2, x1:x2])
+        item_ocr_results = {
+            i_idx: ocr_text.strip() for i_idx, ocr_text in zip(ocr_indices, tesseractOcrEngine.detect_many(ocr_crops))
+        }
+
+    with timer.stage("match"):
+        # 結果圖 group 上的連線 (題號 → item、作答 → item)，由 view.overlay 延後繪製
+        links = []
+        for q_idx, item_indices in groups.items():
+            for i_idx in item_indices:
+                links.append([q_idx, i_idx])
+                valid_items.add(i_idx)
+
+        final_results = {}
+        for a_idx, i_indices in groups_answer.items():
+            answer = dets[a_idx]
+            for i_idx in i_indices:
+                if i_idx in valid_items:
+                    item_text = item_ocr_results.get(i_idx)
+                    predicted_text = answer.text
                 
-                # Setup ImageSavers and collect paths
-                save_paths = []
-                bounding_box_image = ImageSaver(im0, p, "bounding_box")
-                group_img = ImageSaver(im0, p, "group")
-                step3_img = ImageSaver(im0, p, "step3")
+                    if item_text and predicted_text:
+                        final_results[item_text] = predicted_text
                 
-                if len(det):
-                    det[:, :4] = scale_coords(img.shape[2:], det[:, :4], im0.shape).round()
-                    det_sorted = sorted(det, key=lambda box: (int(box[1]) + int(box[3])) // 2)
+                    links.append([a_idx, i_idx])
+    
+    # 題號 OCR 結果記錄在對應的 item 上 (結果圖的批改標記依此找到題號)
+    for i_idx, item_text in item_ocr_results.items():
+        dets.text[i_idx] = item_text
 
-                    data_list = []
-                    current_image_results = []
-                    
-                    for *xyxy, conf, cls in det_sorted:
-                        x1, y1, x2, y2 = map(int, xyxy)
-                        x_center = (x1 + x2) // 2
-                        y_center = (y1 + y2) // 2
-                        
-                        cls_value = int(cls.item())
-                        cls_name = CLASS_TABLE[cls_value]
-                        
-                        predicted_text = None
-                        if cls_name == "answer":
-                            predicted_text, score = detect_handwrite(original, (x1, y1, x2, y2))
-                            if predicted_text == "UNKNOWN":
-                                predicted_text = None
-                        
-                        data_list.append((x1, y1, x2, y2, conf, cls_value))
-                        current_image_results.append({
-                            'class': cls_name,
-                            'confidence': round(float(conf.item()), 2),
-                            'bbox': (x1, y1, x2, y2),
-                            'text': predicted_text,
-                        })
-
-                        label = f'{names[cls_value]} {conf:.2f}'
-                        plot_one_box(xyxy, im0, label=label, color=colors[cls_value], line_thickness=2)
-                        cv2.circle(im0, (x_center, y_center), radius=5, color=(0, 0, 255), thickness=-1)
-                        cv2.circle(im0, (x1, y1), radius=5, color=(0, 255, 255), thickness=-1)
-                        plot_one_box(xyxy, bounding_box_image(), label=label, color=colors[cls_value], line_thickness=2)
-                        
-                        if cls_name in ["question", "answer", "item"]:
-                            cv2.circle(im0s, (x_center, y_center), radius=5, color=(255, 0, 0), thickness=-1)
-                            cv2.circle(group_img(), (x_center, y_center), radius=5, color=(255, 0, 0), thickness=-1)
-                            plot_one_box(xyxy, im0s, label=label, color=colors[cls_value], line_thickness=2)
-                            plot_one_box(xyxy, step3_img(), label=label, color=colors[cls_value], line_thickness=2)
-                        
-                        if predicted_text:
-                            font = cv2.FONT_HERSHEY_SIMPLEX
-                            font_scale = 2
-                            thickness = 3
-                            text_color = (255, 255, 255)
-                            bg_color = (0, 0, 0)
-                            
-                            (text_w, text_h), baseline = cv2.getTextSize(predicted_text, font, font_scale, thickness)
-                            text_x = x_center - text_w // 2
-                            text_y = y_center + text_h // 2
-                            cv2.rectangle(im0, (text_x - 5, text_y - text_h - 5), (text_x + text_w + 5, text_y + 5), bg_color, -1)
-                            cv2.putText(im0, predicted_text, (text_x, text_y), font, font_scale, text_color, thickness, lineType=cv2.LINE_AA)
-
-                    matcher = QuestionItemMatcher(data_list, question_class=0, item_class=5, max_distance=None)
-                    matcher_answer = QuestionItemMatcher(data_list, question_class=1, item_class=5, max_distance=None)
-                    groups = matcher.match()
-                    groups_answer = matcher_answer.match()
-                    item_ocr_results = {}
-                    valid_items = set()
-
-                    for q_idx, item_indices in groups.items():
-                        question = BBox(data_list[q_idx])
-                        for i_idx in item_indices:
-                            item = BBox(data_list[i_idx])
-                            x1, y1, x2, y2 = map(int, item[:4])
-                            crop = original[y1:y2, x1:x2]
-                            ocr_text = tesseractOcrEngine.detect(crop)
-                            item_ocr_results[i_idx] = ocr_text.strip()
-
-                            cv2.line(im0s, question.center, item.center, (0, 0, 255), 2)
-                            cv2.line(group_img(), question.center, item.center, (0, 0, 255), 2)
-                            valid_items.add(i_idx)
-
-                    final_results = {}
-                    for a_idx, i_indices in groups_answer.items():
-                        answer = BBox(data_list[a_idx])
-                        for i_idx in i_indices:
-                            if i_idx in valid_items:
-                                item_text = item_ocr_results.get(i_idx)
-                                answer_result_dict = current_image_results[a_idx]
-                                predicted_text = answer_result_dict['text']
-                                
-                                if item_text and predicted_text:
-                                    final_results[item_text] = predicted_text
-                                
-                                item = BBox(data_list[i_idx])
-                                cv2.line(im0s, answer.center, item.center, (255, 0, 0), 2)
-                                cv2.line(group_img(), answer.center, item.center, (0, 0, 255), 2)
-                    
-                    # 在這裡呼叫新的批改函式
-                    grading_results = grade_results(final_results, correct_answers)
-                    print("Final Mapped Results:", final_results)
-                    print("Grading Results:", grading_results)
-                    
-                    if save_img:
-                        save_paths.append(bounding_box_image.save())
-                        save_paths.append(group_img.save())
-                        save_paths.append(step3_img.save())
-                    
-                    results.append({
-                        'exam_page_id': page_id,
-                        'grading_results': grading_results,
-                        'save_paths': [p for p in save_paths if p] # Filter out None values
-                    })
-    print(f'Done. ({time.time() - t0:.3f}s)')
-    print(results)
-    return results
+    return {
+        'detections': dets.to_compact(CLASS_TABLE),
+        'mapped_results': final_results,
+        'links': links
+    }
@@ -1,9 +1,25 @@
 import pytesseract
 import numpy as np
 import cv2
+import logging
 import os
+import queue
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 
+try:
+    import tesserocr  # Tesseract C API 綁定，可在同一個行程內重複使用引擎
+except ImportError:
+    tesserocr = None
+
+from logs import log_event
+from model_registry import MODELS
+
+logger = logging.getLogger(__name__)
+
 # 如果你在 Windows 上，可能需要指定 Tesseract 的路徑
 pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
@@ -40,11 +56,10 @@ class TesseractOCRDetector:
         """
         初始化 OCR 引擎。
         """
-        print("初始化 Tesseract OCR 引擎...")
         try:
             # 檢查 Tesseract 是否已安裝並可執行
             pytesseract.get_tesseract_version()
-            print("Tesseract 引擎初始化完成。")
+            log_event(logger, logging.INFO, "tesseract_ready")
         except pytesseract.TesseractNotFoundError:
             raise RuntimeError("Tesseract 引擎未找到。請確認已安裝 Tesseract-OCR。")
             
@@ -86,5 +101,112 @@ class TesseractOCRDetector:
             ).strip()
             return clean_ocr_text(text)
         except pytesseract.TesseractError:
-            print("Tesseract 處理圖片時發生錯誤。")
+            log_event(logger, logging.WARNING, "tesseract_error", exc_info=True)
             return ""
+
+
+class TesseractPoolOCRDetector(TesseractOCRDetector):
+    """
+    以常駐 Tesseract 引擎池執行 OCR，避免每個 crop 都啟動一次 tesseract 行程。
+
+    - 已安裝 tesserocr 時：每個 worker 持有一個 PyTessBaseAPI (C API)，影像直接以記憶體傳入；
+      辨識時會釋放 GIL，因此多個 worker thread 可同時使用多核心。
+    - 未安裝 tesserocr 時：退回 tesseract CLI，但將 crop 分組後每組只啟動一次行程
+      (以檔案清單一次辨識多張圖)，各組並行執行。
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    # psm 11 (sparse text) 與 TesseractOCRDetector.detect 相同
+    PSM = 11
+    # CLI 模式下每個行程一次處理的 crop 數
+    CLI_CHUNK_SIZE = 32
+
+    def __init__(self, workers=None, lang="eng"):
+        super().__init__()
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.lang = lang
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tesseract")
+
+        self._apis = None
+        if tesserocr is not None:
+            self._apis = queue.Queue()
+            for _ in range(self.workers):
+                self._apis.put(tesserocr.PyTessBaseAPI(lang=self.lang, psm=tesserocr.PSM.SPARSE_TEXT))
+            log_event(logger, logging.INFO, "tesseract_pool_ready", mode="capi", workers=self.workers)
+        else:
+            # 未安裝 tesserocr，使用 tesseract CLI 分組批次辨識
+            log_event(logger, logging.INFO, "tesseract_pool_ready", mode="cli", workers=self.workers)
+
+    @classmethod
+    def shared(cls):
+        """取得行程內共用的引擎池 (第一次呼叫時建立)"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def detect(self, cropped_image: np.ndarray) -> str:
+        return self.detect_many([cropped_image])[0]
+
+    def detect_many(self, crops) -> list:
+        """
+        批次辨識多個圖像區塊，回傳與 crops 順序相同的文字列表 (已經過 clean_ocr_text)。
+        """
+        results = [""] * len(crops)
+        valid = [i for i, crop in enumerate(crops) if crop is not None and crop.size > 0]
+        if not valid:
+            return results
+
+        images = [self.preprocess_image(crops[i]) for i in valid]
+
+        if self._apis is not None:
+            texts = list(self._executor.map(self._recognize_api, images))
+        else:
+            chunks = [images[s:s + self.CLI_CHUNK_SIZE] for s in range(0, len(images), self.CLI_CHUNK_SIZE)]
+            texts = [text for chunk in self._executor.map(self._recognize_cli, chunks) for text in chunk]
+
+        for i, text in zip(valid, texts):
+            results[i] = clean_ocr_text(text.strip())
+        return results
+
+    def _recognize_api(self, image: np.ndarray) -> str:
+        api = self._apis.get()
+        try:
+            api.SetImage(Image.fromarray(image))
+            return api.GetUTF8Text()
+        except RuntimeError:
+            log_event(logger, logging.WARNING, "tesseract_error", exc_info=True)
+            return ""
+        finally:
+            self._apis.put(api)
+
+    def _recognize_cli(self, images) -> list:
+        """一個 tesseract 行程辨識一組圖片，輸出以換頁字元 (\\f) 分隔"""
+        with tempfile.TemporaryDirectory(prefix="ocr_") as tmp_dir:
+            paths = []
+            for n, image in enumerate(images):
+                path = os.path.join(tmp_dir, f"{n}.png")
+                cv2.imwrite(path, image)
+                paths.append(path)
+            list_path = os.path.join(tmp_dir, "images.txt")
+            with open(list_path, "w") as f:
+                f.write("\n".join(paths) + "\n")
+
+            try:
+                output = subprocess.run(
+                    [pytesseract.pytesseract.tesseract_cmd, list_path, "stdout",
+                     "-l", self.lang, "--psm", str(self.PSM)],
+                    capture_output=True, check=True
+                ).stdout.decode("utf-8", errors="ignore")
+            except (OSError, subprocess.CalledProcessError):
+                log_event(logger, logging.WARNING, "tesseract_error", exc_info=True)
+                return [""] * len(images)
+
+        pages = output.split("\f")
+        return (pages + [""] * len(images))[:len(images)]
+
+
+# 題號 OCR 引擎池由模型登錄表管理 (第一次使用或背景暖機時建立)
+MODELS.register("tesseract", TesseractPoolOCRDetector.shared)
@@ -0,0 +1,158 @@
+import numpy as np
+
+from batcher import MicroBatcher
+from metrics import StageTimer
+
+
+class Detector:
+    """
+    YOLO 偵測後端的共同介面。
+
+    - names: 類別名稱列表
+    - stride: 模型最大 stride，用於 letterbox
+    - imgsz: 模型輸入尺寸 (正方形)
+    - weights_path: 權重檔路徑 (用於計算快取的模型版本)
+    - predict(img, timer=None): 輸入 letterbox 後的 uint8 批次 (B, 3, H, W, RGB)，
+      回傳每張圖一個 numpy 陣列 (n, 6) [x1, y1, x2, y2, conf, cls]，座標為輸入尺寸。
+      timer (StageTimer) 會累計 forward / nms 階段的耗時 (整個 batch)。
+    """
+    backend = ""
+    names = []
+    stride = 32
+    imgsz = 640
+    weights_path = ""
+
+    def predict(self, img, timer=None):
+        raise NotImplementedError
+
+
+class TorchDetector(Detector):
+    """PyTorch (eager 或 TorchScript TracedModel) 後端，NMS 使用 utils.general.non_max_suppression"""
+
+    def __init__(self, model, device, half, imgsz, weights_path, backend="torch", conf_thres=0.25, iou_thres=0.45):
+        import torch
+        from utils.general import non_max_suppression
+
+        self._torch = torch
+        self._nms = non_max_suppression
+        self.model = model
+        self.device = device
+        self.half = half
+        self.imgsz = imgsz
+        self.weights_path = weights_path
+        self.backend = backend
+        self.conf_thres = conf_thres
+        self.iou_thres = iou_thres
+        self.names = model.module.names if hasattr(model, 'module') else model.names
+        self.stride = int(model.stride.max())
+
+    def predict(self, img, timer=None):
+        torch = self._torch
+        timer = timer or StageTimer()
+        with timer.stage("forward"):
+            img = torch.from_numpy(img).to(self.device)
+            img = img.half() if self.half else img.float()
+            img /= 255.0
+
+            # 推論 (整個 batch 一次 forward)
+            with torch.no_grad():
+                pred = self.model(img, augment=False)[0]
+
+        # 應用非極大值抑制 (NMS)，回傳每張圖一個 (n,6) tensor
+        with timer.stage("nms"):
+            pred = self._nms(pred, self.conf_thres, self.iou_thres, agnostic=False)
+            return [det.float().cpu().numpy() for det in pred]
+
+
+class OnnxRuntimeDetector(Detector):
+    """
+    ONNX Runtime 後端，模型需以 model_loader.export_onnx 匯出 (End2End + ONNX_ORT，NMS 已包含在圖中)。
+    不需要 import torch，適合只有 CPU 的節點。
+
+    圖的輸出為 (N, 7) [batch_index, x1, y1, x2, y2, cls, score]。
+    """
+    backend = "onnxruntime"
+
+    def __init__(self, onnx_path, names=None, providers=None):
+        try:
+            import onnxruntime as ort  # ONNX Runtime 推論後端 (可選)，使用時才 import
+        except ImportError:
+            raise RuntimeError("onnxruntime 未安裝，無法使用 onnxruntime 後端。")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            onnx_path, sess_options=options, providers=providers or ort.get_available_providers()
+        )
+        self.weights_path = onnx_path
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, width = model_input.shape
+        assert height == width, f"ONNX 模型輸入需為正方形，目前為 {height}x{width}"
+        self.imgsz = int(height)
+        # 匯出時未設定 dynamic batch 的模型只能以固定 batch 執行
+        self.fixed_batch = batch if isinstance(batch, int) else None
+
+        # 類別名稱與 stride 由匯出時寫入的 metadata 取得
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.names = meta["names"].split(",") if "names" in meta else list(names or [])
+        self.stride = int(meta.get("stride", 32))
+
+    def predict(self, img, timer=None):
+        # NMS 在 ONNX 圖中執行，整段計入 forward
+        with (timer or StageTimer()).stage("forward"):
+            return self._predict(img)
+
+    def _predict(self, img):
+        img = img.astype(np.float32) / 255.0
+        n = len(img)
+
+        outputs = []
+        step = self.fixed_batch or n
+        for start in range(0, n, step):
+            chunk = img[start:start + step]
+            if self.fixed_batch and len(chunk) < self.fixed_batch:
+                # 固定 batch 的模型：不足的部分補 0 (補上的圖不會有偵測結果)
+                pad = np.zeros((self.fixed_batch - len(chunk), *chunk.shape[1:]), dtype=chunk.dtype)
+                chunk = np.concatenate([chunk, pad])
+            out = self.session.run(None, {self.input_name: chunk})[0]
+            out = out[out[:, 0] < min(step, n - start)]
+            out[:, 0] += start
+            outputs.append(out)
+        out = np.concatenate(outputs) if outputs else np.zeros((0, 7), dtype=np.float32)
+
+        # 拆回每張圖並轉為 [x1, y1, x2, y2, conf, cls]
+        results = []
+        for i in range(n):
+            det = out[out[:, 0] == i]
+            results.append(det[:, [1, 2, 3, 4, 6, 5]].astype(np.float32))
+        return results
+
+
+class BatchedDetector(Detector):
+    """
+    在另一個 Detector 前加上 micro-batching：多個批改工作同時呼叫 predict() 時，
+    各自的頁面會在 max_wait_ms 內合併成一次 forward / NMS，再分回各工作。
+    """
+
+    def __init__(self, detector, max_items=16, max_wait_ms=5.0):
+        self.detector = detector
+        self.backend = detector.backend
+        self.names = detector.names
+        self.stride = detector.stride
+        self.imgsz = detector.imgsz
+        self.weights_path = detector.weights_path
+        self._batcher = MicroBatcher(self._predict_batch, max_items, max_wait_ms, name="detector")
+
+    def _predict_batch(self, images, timer):
+        # letterbox 為固定大小 (LoadImageBatches auto=False)，不同工作的頁面可以直接疊成一個 batch；
+        # 單一請求超過 max_items 時分段 forward，不超過 GPU 記憶體的上限
+        step = self._batcher.max_items
+        results = []
+        for start in range(0, len(images), step):
+            results.extend(self.detector.predict(np.stack(images[start:start + step]), timer=timer))
+        return results
+
+    def predict(self, img, timer=None):
+        return self._batcher.run(list(img), timer)
@@ -0,0 +1,252 @@
+# inference_server.py
+"""
+Model server 模式：固定數量的推論行程持有 YOLO / 手寫 / Tesseract 模型，
+API (uvicorn) 的 worker 透過本機 IPC 佇列送出頁面的視覺辨識工作，圖片以共享記憶體傳遞。
+Web 的並行數與推論佔用的記憶體因此可以分開調整。
+
+    export INFERENCE_AUTHKEY=$(python -c "import secrets; print(secrets.token_hex(32))")
+    python inference_server.py --workers 2
+    INFERENCE_SERVER=127.0.0.1:50055 uvicorn main:app --workers 4
+
+伺服器只負責視覺辨識 (analyze_pages)，批改 (grade_pages) 與寫入資料庫仍在 API 行程執行。
+"""
+import argparse
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from multiprocessing.managers import BaseManager, DictProxy
+from typing import Dict, List, Tuple
+from uuid import uuid4
+
+import cv2
+import numpy as np
+
+from logs import setup_logging, log_event
+from metrics import StageTimer
+
+logger = logging.getLogger(__name__)
+
+# 伺服器位址 (host:port) 與驗證金鑰，API 與推論伺服器需一致。
+# 通過驗證的連線送來的資料會被 unpickle (等同可執行任意程式碼)，因此金鑰沒有預設值、必須自行設定
+INFERENCE_SERVER = os.getenv("INFERENCE_SERVER", "")
+INFERENCE_AUTHKEY = os.getenv("INFERENCE_AUTHKEY", "").encode()
+# 單一請求等待結果的上限 (秒)
+INFERENCE_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "600"))
+
+
+class InferenceError(Exception):
+    """推論行程處理請求時發生錯誤"""
+
+
+class _QueueManager(BaseManager):
+    pass
+
+
+def require_authkey(authkey: bytes) -> bytes:
+    """未設定 INFERENCE_AUTHKEY 時拒絕啟動 (伺服器與客戶端都檢查)"""
+    if not authkey:
+        raise InferenceError("未設定 INFERENCE_AUTHKEY：推論伺服器與 API 需使用相同且保密的驗證金鑰")
+    return authkey
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def _connect(address, authkey, retries=50, delay=0.2) -> _QueueManager:
+    """連線到推論伺服器 (伺服器剛啟動時稍候重試)"""
+    for name in ("get_request_queue", "get_response_queue", "drop_response_queue"):
+        _QueueManager.register(name)
+    _QueueManager.register("get_worker_status", proxytype=DictProxy)
+    for attempt in range(retries):
+        manager = _QueueManager(address=address, authkey=authkey)
+        try:
+            manager.connect()
+            return manager
+        except ConnectionRefusedError:
+            if attempt == retries - 1:
+                raise
+            time.sleep(delay)
+
+
+def _attach_image(page: Dict) -> np.ndarray:
+    """由共享記憶體取得圖片 (複製一份，之後立即釋放共享記憶體的對應)"""
+    shm = shared_memory.SharedMemory(name=page["shm"])
+    try:
+        # 共享記憶體由 API 行程建立與釋放；Python 3.13 以前 attach 也會登記到 resource_tracker，
+        # 推論行程結束時會誤刪仍在使用中的區塊，因此取消登記
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return np.ndarray(page["shape"], dtype=page["dtype"], buffer=shm.buf).copy()
+    finally:
+        shm.close()
+
+
+def _worker_main(address, authkey, worker_id, vision_cache_db):
+    """推論行程：載入模型後持續處理請求佇列"""
+    setup_logging()
+    # 匯入時註冊 YOLO / 手寫 / Tesseract 模型
+    import model_loader  # noqa: F401
+    from detect import analyze_pages
+    from model_registry import MODELS
+    from vision_cache import VisionCache
+
+    manager = _connect(address, authkey)
+    requests = manager.get_request_queue()
+    worker_status = manager.get_worker_status()
+
+    worker_status[worker_id] = MODELS.status()
+    MODELS.warm_up()
+    worker_status[worker_id] = MODELS.status()
+    cache = VisionCache(vision_cache_db) if vision_cache_db else None
+    log_event(logger, logging.INFO, "inference_worker_ready", worker=worker_id, pid=os.getpid())
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        request_id, exam_id, pages, batch_size = request
+        try:
+            yolo = MODELS.get("yolo")
+            page_results, page_timers = analyze_pages(
+                [page["photo_path"] for page in pages],
+                [page["exam_page_id"] for page in pages],
+                yolo["detector"],
+                exam_id,
+                batch_size=batch_size,
+                cache=cache,
+                model_version=yolo["model_version"],
+                images=[_attach_image(page) for page in pages]
+            )
+            reply = (page_results, {page_id: dict(t.totals) for page_id, t in page_timers.items()}, None)
+        except Exception as e:
+            log_event(logger, logging.ERROR, "inference_request_failed", exc_info=True,
+                      worker=worker_id, request_id=request_id, error=str(e))
+            reply = (None, None, str(e))
+        manager.get_response_queue(request_id).put(reply)
+
+
+def serve(address: str, authkey: bytes, workers: int, vision_cache_db: str):
+    """啟動 IPC 佇列伺服器與 workers 個推論行程 (阻塞直到結束)"""
+    require_authkey(authkey)
+    request_queue = queue.Queue()
+    response_queues = {}
+    response_lock = threading.Lock()
+    worker_status = {}
+
+    def get_response_queue(request_id):
+        with response_lock:
+            return response_queues.setdefault(request_id, queue.Queue())
+
+    def drop_response_queue(request_id):
+        with response_lock:
+            response_queues.pop(request_id, None)
+
+    _QueueManager.register("get_request_queue", callable=lambda: request_queue)
+    _QueueManager.register("get_response_queue", callable=get_response_queue)
+    _QueueManager.register("drop_response_queue", callable=drop_response_queue)
+    _QueueManager.register("get_worker_status", callable=lambda: worker_status, proxytype=DictProxy)
+
+    host_port = parse_address(address)
+    server = _QueueManager(address=host_port, authkey=authkey).get_server()
+
+    # spawn：推論行程不繼承父行程的狀態，各自載入模型
+    ctx = mp.get_context("spawn")
+    processes = [
+        ctx.Process(target=_worker_main, args=(host_port, authkey, n, vision_cache_db),
+                    name=f"inference-{n}", daemon=True)
+        for n in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    log_event(logger, logging.INFO, "inference_server_started", address=address, workers=workers)
+    try:
+        server.serve_forever()
+    finally:
+        for _ in processes:
+            request_queue.put(None)
+        for process in processes:
+            process.join(timeout=10)
+
+
+class InferenceClient:
+    """
+    API 行程使用的推論伺服器客戶端 (thread-safe，每個請求使用獨立的回應佇列)。
+    analyze() 的參數與回傳值與 detect.analyze_pages 相同。
+    """
+
+    def __init__(self, address: str = INFERENCE_SERVER, authkey: bytes = INFERENCE_AUTHKEY,
+                 timeout: float = INFERENCE_TIMEOUT):
+        self.address = address
+        self.timeout = timeout
+        self._manager = _connect(parse_address(address), require_authkey(authkey))
+        self._requests = self._manager.get_request_queue()
+
+    def analyze(self, photo_paths: List[str], page_ids: List[str], exam_id: str,
+                batch_size: int = 8) -> Tuple[Dict, Dict[str, StageTimer]]:
+        request_id = uuid4().hex
+        blocks = []
+        try:
+            # 在 API 行程解碼圖片並放入共享記憶體，推論行程直接對應，不經過 IPC 序列化
+            pages = []
+            for photo_path, page_id in zip(photo_paths, page_ids):
+                img = cv2.imread(photo_path)
+                if img is None:
+                    raise InferenceError(f"無法讀取圖片: {photo_path}")
+                shm = shared_memory.SharedMemory(create=True, size=img.nbytes)
+                blocks.append(shm)
+                np.ndarray(img.shape, dtype=img.dtype, buffer=shm.buf)[:] = img
+                pages.append({
+                    "exam_page_id": page_id,
+                    "photo_path": photo_path,
+                    "shm": shm.name,
+                    "shape": img.shape,
+                    "dtype": str(img.dtype),
+                })
+
+            responses = self._manager.get_response_queue(request_id)
+            self._requests.put((request_id, exam_id, pages, batch_size))
+            try:
+                page_results, timings, error = responses.get(timeout=self.timeout)
+            except queue.Empty:
+                raise InferenceError(f"推論伺服器在 {self.timeout} 秒內沒有回應")
+            finally:
+                self._manager.drop_response_queue(request_id)
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+        if error:
+            raise InferenceError(error)
+
+        page_timers = {}
+        for page_id, totals in timings.items():
+            page_timers[page_id] = StageTimer()
+            for name, seconds in totals.items():
+                page_timers[page_id].add(name, seconds)
+        return page_results, page_timers
+
+    def worker_status(self) -> Dict:
+        """各推論行程的模型狀態 ({worker_id: MODELS.status()})"""
+        return dict(self._manager.get_worker_status())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="推論伺服器 (model server 模式)")
+    parser.add_argument("--address", type=str, default=INFERENCE_SERVER or "127.0.0.1:50055")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INFERENCE_WORKERS", "1")))
+    parser.add_argument("--vision-cache", type=str, default=os.getenv("VISION_CACHE_DB", "data/vision_cache.db"))
+    opt = parser.parse_args()
+
+    setup_logging()
+    serve(opt.address, INFERENCE_AUTHKEY, opt.workers, opt.vision_cache)
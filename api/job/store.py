@@ -0,0 +1,222 @@
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# 批改工作的狀態
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# 單一頁面的狀態
+PAGE_PENDING = "pending"
+PAGE_DONE = "done"
+
+
+class JobStore:
+    """
+    以本機 SQLite 檔案保存批改工作 (grading job) 的狀態。
+
+    工作與每一頁的完成狀態都會落地，伺服器重啟後可以只重跑尚未完成的頁面。
+    """
+
+    def __init__(self, db_path: str):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        # 多個 worker thread 共用同一個連線，以 lock 串行化寫入
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._init_schema()
+
+    def _init_schema(self):
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS grading_jobs (
+                    id TEXT PRIMARY KEY,
+                    exam_id TEXT NOT NULL,
+                    teacher_id TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    total_pages INTEGER NOT NULL,
+                    done_pages INTEGER NOT NULL DEFAULT 0,
+                    correct_answer TEXT,
+                    error TEXT,
+                    timings TEXT,
+                    owner TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS grading_job_pages (
+                    job_id TEXT NOT NULL,
+                    exam_page_id TEXT NOT NULL,
+                    photo_path TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    PRIMARY KEY (job_id, exam_page_id)
+                )
+            """)
+            # 舊版資料表沒有 timings 欄位
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(grading_jobs)")}
+            if "timings" not in columns:
+                self._conn.execute("ALTER TABLE grading_jobs ADD COLUMN timings TEXT")
+            # 舊版資料表沒有 owner 欄位 (負責執行工作的行程，見 GradingJobQueue.owner)
+            if "owner" not in columns:
+                self._conn.execute("ALTER TABLE grading_jobs ADD COLUMN owner TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_grading_jobs_status ON grading_jobs (status)")
+
+    def create_job(self, job_id: str, exam_id: str, teacher_id: str, mode: str,
+                   pages: List[Dict], correct_answer: Dict, owner: Optional[str] = None,
+                   max_active: Optional[int] = None, exclusive: bool = False) -> bool:
+        """
+        建立一個新工作，pages 為 [{"exam_page_id": ..., "photo_path": ...}, ...]。
+        檢查與新增在同一個 INSERT ... SELECT 完成 (多個 API 行程共用此檔案時也不會重複建立)：
+        - max_active: 排隊與執行中的工作已達此數量時不建立
+        - exclusive: 同一測驗已有排隊或執行中的工作時不建立
+        回傳是否已建立。
+        """
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                """
+                INSERT INTO grading_jobs (id, exam_id, teacher_id, mode, status, total_pages, done_pages,
+                                          correct_answer, owner, created_at, updated_at)
+                SELECT ?, ?, ?, ?, ?, ?, 0, ?, ?, ?, ?
+                WHERE (? IS NULL OR (SELECT COUNT(*) FROM grading_jobs WHERE status IN (?, ?)) < ?)
+                  AND (? = 0 OR NOT EXISTS (
+                      SELECT 1 FROM grading_jobs WHERE exam_id = ? AND status IN (?, ?)
+                  ))
+                """,
+                (job_id, exam_id, teacher_id, mode, JOB_QUEUED, len(pages), json.dumps(correct_answer), owner,
+                 now, now,
+                 max_active, JOB_QUEUED, JOB_RUNNING, max_active,
+                 int(exclusive), exam_id, JOB_QUEUED, JOB_RUNNING)
+            )
+            if cursor.rowcount == 0:
+                return False
+            self._conn.executemany(
+                "INSERT INTO grading_job_pages (job_id, exam_page_id, photo_path, seq, status) VALUES (?, ?, ?, ?, ?)",
+                [(job_id, p["exam_page_id"], p["photo_path"], seq, PAGE_PENDING) for seq, p in enumerate(pages)]
+            )
+        return True
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM grading_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job_to_dict(row) if row else None
+
+    def list_jobs(self, exam_id: str, teacher_id: str) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM grading_jobs WHERE exam_id = ? AND teacher_id = ? ORDER BY created_at DESC",
+                (exam_id, teacher_id)
+            ).fetchall()
+        return [self._job_to_dict(row) for row in rows]
+
+    def active_job_for_exam(self, exam_id: str) -> Optional[Dict]:
+        """回傳該測驗尚在排隊或執行中的工作 (避免同一份考卷被重複批改)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM grading_jobs WHERE exam_id = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+                (exam_id, JOB_QUEUED, JOB_RUNNING)
+            ).fetchone()
+        return self._job_to_dict(row) if row else None
+
+    def count_active(self) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM grading_jobs WHERE status IN (?, ?)", (JOB_QUEUED, JOB_RUNNING)
+            ).fetchone()
+        return row[0]
+
+    def unfinished_jobs(self) -> List[Dict]:
+        """排隊中或執行到一半的工作 [{"id", "status", "owner"}, ...]"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, status, owner FROM grading_jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (JOB_QUEUED, JOB_RUNNING)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def take_over(self, job_id: str, status: str, old_owner: Optional[str], new_owner: str) -> bool:
+        """
+        接手一個工作 (compare-and-swap)：只有狀態與 owner 仍與讀取時相同才改為 new_owner 並重新排隊。
+        多個行程同時接手同一個工作時只有一個會成功。
+        """
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                """
+                UPDATE grading_jobs SET status = ?, owner = ?, updated_at = ?
+                WHERE id = ? AND status = ? AND owner IS ?
+                """,
+                (JOB_QUEUED, new_owner, now, job_id, status, old_owner)
+            )
+        return cursor.rowcount == 1
+
+    def claim(self, job_id: str, owner: str) -> bool:
+        """開始執行前將自己的排隊中工作改為執行中，工作已被其他行程接手時回傳 False"""
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE grading_jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ? AND owner = ?",
+                (JOB_RUNNING, now, job_id, JOB_QUEUED, owner)
+            )
+        return cursor.rowcount == 1
+
+    def pending_pages(self, job_id: str) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT exam_page_id, photo_path FROM grading_job_pages WHERE job_id = ? AND status = ? ORDER BY seq",
+                (job_id, PAGE_PENDING)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def mark_pages_done(self, job_id: str, page_ids: List[str]) -> None:
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE grading_job_pages SET status = ? WHERE job_id = ? AND exam_page_id = ?",
+                [(PAGE_DONE, job_id, page_id) for page_id in page_ids]
+            )
+            self._conn.execute(
+                """
+                UPDATE grading_jobs
+                SET done_pages = (SELECT COUNT(*) FROM grading_job_pages WHERE job_id = ? AND status = ?),
+                    updated_at = ?
+                WHERE id = ?
+                """,
+                (job_id, PAGE_DONE, now, job_id)
+            )
+
+    def set_status(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE grading_jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, now, job_id)
+            )
+
+    def add_timings(self, job_id: str, timings: Dict[str, float]) -> None:
+        """將各階段耗時 (秒) 累加到工作的 timings (接續執行的工作會與先前的耗時合併)"""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT timings FROM grading_jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            merged = json.loads(row["timings"]) if row["timings"] else {}
+            for name, seconds in timings.items():
+                merged[name] = round(merged.get(name, 0.0) + seconds, 4)
+            self._conn.execute("UPDATE grading_jobs SET timings = ? WHERE id = ?", (json.dumps(merged), job_id))
+
+    @staticmethod
+    def _job_to_dict(row) -> Dict:
+        job = dict(row)
+        job["correct_answer"] = json.loads(job["correct_answer"]) if job["correct_answer"] else {}
+        job["timings"] = json.loads(job["timings"]) if job["timings"] else {}
+        job["progress"] = job["done_pages"] / job["total_pages"] if job["total_pages"] else 1.0
+        return job
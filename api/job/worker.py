@@ -0,0 +1,137 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from uuid import uuid4
+
+from job.store import JobStore, JOB_DONE, JOB_FAILED
+from logs import log_event
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """排隊中的工作數已達上限"""
+
+
+class JobAlreadyActive(Exception):
+    """同一測驗已有排隊或執行中的工作 (job 為該工作)"""
+
+    def __init__(self, job: Dict):
+        super().__init__(f"測驗 {job['exam_id']} 已有批改工作 {job['id']}")
+        self.job = job
+
+
+def _process_alive(owner: Optional[str], current_owner: str) -> bool:
+    """owner ("pid:token") 的行程是否仍在執行 (JobStore 為本機檔案，共用它的行程都在同一台機器)"""
+    if not owner:
+        return False
+    if owner == current_owner:
+        return True
+    pid_text, _, _ = owner.partition(":")
+    try:
+        pid = int(pid_text)
+    except ValueError:
+        return False
+    if pid == os.getpid():
+        # 同一個 pid 但 token 不同：是重啟前的自己 (例如容器內固定為 pid 1)
+        return False
+    if os.name == "nt":
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class GradingJobQueue:
+    """
+    背景批改工作佇列。
+
+    - 工作在獨立的 thread pool 執行，不會卡住 FastAPI 的 event loop。
+    - max_workers 限制同時批改的工作數，max_queued 限制排隊中的工作數。
+    - 工作狀態存在 JobStore，重啟後呼叫 resume() 會接續未完成的頁面。
+    - 每個工作記錄負責的行程 (owner)；多個 API 行程共用同一個 JobStore 時，
+      一個工作只會由一個行程執行，resume() 只接手 owner 已不存在的工作。
+
+    runner(job, pages, on_pages_done) 負責實際批改：
+        job: JobStore.get_job() 回傳的 dict
+        pages: 尚未完成的頁面 [{"exam_page_id", "photo_path"}, ...]
+        on_pages_done(page_ids): 每完成 (並儲存) 一批頁面時呼叫，用來更新進度
+    """
+
+    def __init__(self, store: JobStore, runner: Callable, max_workers: int = 1, max_queued: int = 100):
+        self.store = store
+        self.runner = runner
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="grading")
+        self._submit_lock = threading.Lock()
+        self.owner = f"{os.getpid()}:{uuid4().hex}"
+
+    def submit(self, exam_id: str, teacher_id: str, mode: str, pages: List[Dict], correct_answer: Dict,
+               exclusive: bool = False) -> str:
+        """
+        建立工作並放入佇列，立即回傳 job_id。
+        exclusive=True 時同一測驗已有排隊或執行中的工作則拋出 JobAlreadyActive (檢查與建立為同一個操作)。
+        """
+        with self._submit_lock:
+            job_id = str(uuid4())
+            created = self.store.create_job(
+                job_id, exam_id, teacher_id, mode, pages, correct_answer,
+                owner=self.owner, max_active=self.max_queued, exclusive=exclusive
+            )
+            if not created:
+                active_job = self.store.active_job_for_exam(exam_id) if exclusive else None
+                if active_job:
+                    raise JobAlreadyActive(active_job)
+                raise JobQueueFull(f"已有 {self.max_queued} 個批改工作在排隊")
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def resume(self) -> List[str]:
+        """
+        接手上次關機前尚未完成的工作 (owner 行程已不存在者) 並重新放入佇列，回傳接手的 job_id。
+        以 compare-and-swap 更新 owner，多個行程同時啟動時每個工作只會被一個行程接手。
+        """
+        job_ids = []
+        for job in self.store.unfinished_jobs():
+            if _process_alive(job["owner"], self.owner):
+                continue
+            if self.store.take_over(job["id"], job["status"], job["owner"], self.owner):
+                self._executor.submit(self._run, job["id"])
+                job_ids.append(job["id"])
+        return job_ids
+
+    def shutdown(self, wait: bool = False) -> None:
+        # 執行中的工作保持 running 狀態，下次啟動時由 resume() 接續
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, job_id: str) -> None:
+        job = self.store.get_job(job_id)
+        if job is None:
+            return
+
+        if not self.store.claim(job_id, self.owner):
+            # 已被其他行程接手 (或不再是排隊中)
+            return
+        log_event(logger, logging.INFO, "grading_job_started", job_id=job_id, exam_id=job["exam_id"])
+        try:
+            pages = self.store.pending_pages(job_id)
+            if pages:
+                self.runner(job, pages, lambda page_ids: self.store.mark_pages_done(job_id, page_ids))
+            self.store.set_status(job_id, JOB_DONE)
+            log_event(logger, logging.INFO, "grading_job_done", job_id=job_id, exam_id=job["exam_id"],
+                      pages=len(pages))
+        except Exception as e:
+            log_event(logger, logging.ERROR, "grading_job_failed", exc_info=True, job_id=job_id,
+                      exam_id=job["exam_id"], error=str(e))
+            self.store.set_status(job_id, JOB_FAILED, error=str(e))
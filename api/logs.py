@@ -0,0 +1,58 @@
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+# 日誌等級與格式：LOG_FORMAT=json 輸出一行一個 JSON 物件 (預設)，text 輸出易讀格式
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+
+class JsonFormatter(logging.Formatter):
+    """將 log record 轉為單行 JSON：ts、level、logger、event 與 log_event 附加的欄位"""
+
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        payload.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """開發用的易讀格式：時間 等級 logger event key=value ..."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", {})
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+def setup_logging(level: str = None, fmt: str = None) -> None:
+    """設定 root logger (於應用程式啟動時呼叫一次)"""
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if (fmt or LOG_FORMAT) == "json" else TextFormatter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level or LOG_LEVEL)
+
+
+def log_event(logger: logging.Logger, level: int, event: str, exc_info=None, **fields) -> None:
+    """
+    輸出一筆結構化事件，例如：
+        log_event(logger, logging.INFO, "grading_job_queued", job_id=job_id, pages=3)
+    event 為固定的事件名稱，其餘資料放在 fields，方便日誌系統依欄位查詢。
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
@@ -2,55 +2,128 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI, UploadFile, File,Request, Form,Query
 import time
 from pathlib import Path
-import shutil
+from urllib.parse import quote
 import json
 import os
+import anyio
+import asyncio
+import cv2
 from datetime import datetime
 import mimetypes
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait as futures_wait
 
 # 從你的自訂模組中匯入初始化函數
 # ai
-from model_loader import initialize_model
-from detect import detect_images,detect_images_v2
+from model_loader import DETECT_BACKEND  # 匯入時註冊 YOLO 模型 (MODELS "yolo")
+from detect import detect_images,analyze_pages,grade_pages,exam_save_dir
+from vision_cache import VisionCache
+from model_registry import MODELS, MODEL_WARM
+from inference_server import InferenceClient
+from utils.inference_utils import img_formats  # 不會載入 torch
+from metrics import REGISTRY, JOB_SECONDS, StageTimer
+from view.overlay import (get_renderer, render_view, encode_image, overlay_paths, OverlayCache, OVERLAY_VIEWS,
+                          VIEW_GRADING, OVERLAY_MAX_SIDE, OVERLAY_FORMAT)
+from logs import setup_logging, log_event
 
 
 from schemas import *
 from fastapi import FastAPI, Depends, HTTPException, status, Response
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import text  # 匯入 text 模組
+from sqlalchemy import bindparam, text  # 匯入 text 模組
 from sqlalchemy.exc import SQLAlchemyError
-from sql.database import get_db
+from sql.database import get_db, session_scope, engine
+from sql.schema import ensure_schema
+from sql import summary
 from sql.models import Teacher,Class, Exam, AiResult
-from security import get_password_hash, verify_password, create_session_token, verify_session_token
+from security import get_password_hash_async, verify_password_async, create_session_token
+from auth import get_current_teacher, get_teacher_id, verify_session, invalidate_session, SESSION_COOKIE
+from pagination import ListParams, list_params, list_responses
+from photo_store import (PhotoIndex, PhotoEntry, new_hasher, digest_of, file_digest, photo_url, etag,
+                         is_not_modified, IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, PHOTO_ACCEL_REDIRECT)
 from uuid import uuid4
 from schemas import LoginRequest, TeacherPublic # 從 schemas.py 匯入新的模型
 from typing import Optional, List, Dict
+from job.store import JobStore
+from job.worker import GradingJobQueue, JobQueueFull, JobAlreadyActive
 
 
+# 結構化日誌 (LOG_LEVEL / LOG_FORMAT)
+setup_logging()
+logger = logging.getLogger("api")
+
 # 全域變數來儲存模型和相關配置
 app_state = {}
 UPLOAD_FOLDER = "upload"
+# 批改時每次 YOLO 推論的頁數 (GPU 記憶體不足時可調小)
+DETECT_BATCH_SIZE = int(os.getenv("DETECT_BATCH_SIZE", "8"))
+# 背景批改工作：同時執行的工作數、排隊上限、狀態資料表 (本機 SQLite)
+# 多個工作同時執行時，偵測與手寫辨識會經由 micro-batching 合併 (見 batcher.py)
+GRADING_MAX_JOBS = int(os.getenv("GRADING_MAX_JOBS", "4"))
+GRADING_MAX_QUEUED = int(os.getenv("GRADING_MAX_QUEUED", "100"))
+GRADING_JOB_DB = os.getenv("GRADING_JOB_DB", "data/grading_jobs.db")
+# 上傳時預先辨識 (暖好 VisionCache) 的 thread 數，與批改工作分開，不佔用 GRADING_MAX_JOBS
+PREFETCH_MAX_WORKERS = int(os.getenv("PREFETCH_MAX_WORKERS", "2"))
+# 視覺辨識結果快取 (圖片內容雜湊 + 模型版本)
+VISION_CACHE_DB = os.getenv("VISION_CACHE_DB", "data/vision_cache.db")
+# 上傳：單檔大小上限與每次寫入的 chunk 大小
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# exam_pages.id -> (photo_path, photo_hash)，/photo 重複瀏覽不查資料庫
+PHOTOS = PhotoIndex()
+# 啟動時是否在背景預先載入所有模型 (關閉時各模型在第一次使用時才載入)
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1") == "1"
+# Model server 模式：設定推論伺服器位址 (host:port，見 inference_server.py) 時，
+# 視覺辨識交給推論行程，API 行程不載入任何模型
+INFERENCE_SERVER = os.getenv("INFERENCE_SERVER", "")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 啟動事件
-    print("Application startup...")
-    
-    # 載入並暖機模型
-    weights_file = Path("weights/yolobest.pt")
-    model_data = initialize_model(str(weights_file))
+    log_event(logger, logging.INFO, "startup")
     
-    # 將模型和相關資料儲存到 app_state
-    app_state["model"] = model_data["model"]
-    app_state["device"] = model_data["device"]
-    app_state["half"] = model_data["half"]
-    app_state["imgsz"] = model_data["imgsz"]
+    # 資料庫結構不完整時 upsert / 彙總 / 照片快取都無法正確運作，直接中止啟動
+    try:
+        await run_in_threadpool(ensure_schema, engine)
+    except Exception as e:
+        log_event(logger, logging.ERROR, "schema_migration_failed", exc_info=True, error=str(e))
+        raise
+
+    # 模型 (YOLO / 手寫 / Tesseract) 由 MODELS 延遲載入，不在這裡等待；
+    # 開啟 MODEL_WARMUP 時在背景 thread 預先載入，狀態可由 /ready 查詢
+    if INFERENCE_SERVER:
+        app_state["inference"] = InferenceClient(INFERENCE_SERVER)
+        log_event(logger, logging.INFO, "inference_server_connected", address=INFERENCE_SERVER)
+    elif MODEL_WARMUP:
+        MODELS.start_warm_up()
+    app_state["vision_cache"] = VisionCache(VISION_CACHE_DB)
+    app_state["overlay_cache"] = OverlayCache()
+    app_state["prefetch_executor"] = ThreadPoolExecutor(
+        max_workers=max(1, PREFETCH_MAX_WORKERS), thread_name_prefix="prefetch"
+    )
+
+    # 啟動背景批改工作佇列，並接續上次未完成的工作
+    job_queue = GradingJobQueue(
+        JobStore(GRADING_JOB_DB),
+        run_grading_job,
+        max_workers=GRADING_MAX_JOBS,
+        max_queued=GRADING_MAX_QUEUED
+    )
+    app_state["job_queue"] = job_queue
+    resumed = job_queue.resume()
+    if resumed:
+        log_event(logger, logging.INFO, "grading_jobs_resumed", count=len(resumed), job_ids=resumed)
     
     yield
     
     # 關閉事件
-    print("Application shutdown...")
+    log_event(logger, logging.INFO, "shutdown")
+    job_queue.shutdown(wait=False)
+    app_state["prefetch_executor"].shutdown(wait=False, cancel_futures=True)
+    # security.password_hasher 為模組層級共用的 thread pool，不在這裡關閉 (同一行程可能再次啟動 lifespan)
     # 在這裡可以釋放資源，例如關閉資料庫連線等
 
 # 2. 創建 FastAPI 應用程式，並傳入 lifespan
@@ -60,25 +133,56 @@ app = FastAPI(lifespan=lifespan)
 def root():
     return {"root": "HelloWorld"}
 
+@app.get("/ready")
+def ready():
+    """
+    Readiness：回報各模型是否已載入 (warm)。全部就緒時回傳 200，否則 503。
+    非 AI 的 API 不需等待模型，可在此之前就開始服務。
+    Model server 模式下改為回報各推論行程的模型狀態，至少一個推論行程就緒即可。
+    """
+    client = app_state.get("inference")
+    if client is not None:
+        workers = client.worker_status()
+        is_ready = any(
+            all(model["status"] == MODEL_WARM for model in models.values()) for models in workers.values()
+        )
+        content = {"ready": is_ready, "inference_workers": workers}
+    else:
+        is_ready = MODELS.is_ready()
+        content = {"ready": is_ready, "models": MODELS.status()}
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if is_ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=content
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus 格式的指標 (批改各階段、每頁與每份考卷的耗時 histogram)"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/test_demo")
 def test_demo():
+    yolo = MODELS.get("yolo")
+    if yolo["model"] is None:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=f"{DETECT_BACKEND} 後端不支援 /test_demo。")
     return detect_images(
         "data/demo.jpg",
-        app_state["model"],
-        app_state["device"],
-        app_state["half"],
-        app_state["imgsz"],
+        yolo["model"],
+        yolo["device"],
+        yolo["half"],
+        yolo["imgsz"],
         ""
     )
 # --- 登入 API ---
 @app.post("/login")
-def login(request_data: LoginRequest, response: Response, db: Session = Depends(get_db)):
+async def login(request_data: LoginRequest, response: Response, db: Session = Depends(get_db)):
     """
     驗證使用者帳號和密碼，並建立登入 Session
+    (bcrypt 驗證在 security.password_hasher 的 thread pool 執行，不阻塞其他請求)
     """
     # 1. 使用 SQL 字串依據帳號查詢資料庫
     sql_query = text("SELECT id, name, office, account, password FROM Teachers WHERE account = :account LIMIT 1")
-    result = db.execute(sql_query, {"account": request_data.account}).first()
+    result = await run_in_threadpool(lambda: db.execute(sql_query, {"account": request_data.account}).first())
     
     # 將查詢結果轉換為字典
     if not result:
@@ -100,7 +204,7 @@ def login(request_data: LoginRequest, response: Response, db: Session = Depends(
         )
 
     # 2. 驗證密碼
-    if not verify_password(request_data.password, db_teacher['password']):
+    if not await verify_password_async(request_data.password, db_teacher['password']):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid account or password",
@@ -112,7 +216,7 @@ def login(request_data: LoginRequest, response: Response, db: Session = Depends(
 
     # 4. 將 Session Token 存在瀏覽器的 Cookie 中
     response.set_cookie(
-        key="session_token",
+        key=SESSION_COOKIE,
         value=session_token,
         httponly=True,
         samesite="strict"
@@ -129,60 +233,38 @@ def login(request_data: LoginRequest, response: Response, db: Session = Depends(
 
 
 @app.get("/auth")
-def authenticate_session(request: Request, db: Session = Depends(get_db)):
+def authenticate_session(teacher: dict = Depends(get_current_teacher)):
     """
-    驗證 Session Token，並回傳登入者的公開資訊
+    驗證 Session Token，並回傳登入者的公開資訊 (Token 與老師資料皆經由 auth 的快取)
     """
-    # 1. 從請求的 Cookie 中取得 Session Token
-    session_token = request.cookies.get("session_token")
-    if not session_token:
-        # 如果沒有 Token，表示未登入
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
-
-    # 2. 驗證 Session Token 是否有效且未過期
-    session_data = verify_session_token(session_token)
-    if not session_data:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session expired or invalid")
-
-    # 3. 從 Session Data 取得使用者 ID
-    user_id = session_data.get("user_id")
-    if not user_id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid session data")
-
-    # 4. 使用 SQL 語法查詢資料庫，取得使用者資訊
-    sql_query = text("SELECT id, name, office, account FROM Teachers WHERE id = :user_id LIMIT 1")
-    result = db.execute(sql_query, {"user_id": user_id}).first()
+    return {"message": "Authenticated successfully", "user_info": TeacherPublic(**teacher)}
 
-    if not result:
-        # 如果找不到使用者，表示 Token 雖然有效但使用者不存在
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-    
-    # 將結果轉換為 Pydantic 模型並回傳
-    teacher_public = TeacherPublic(
-        id=result.id,
-        name=result.name,
-        office=result.office,
-        account=result.account
-    )
 
-    return {"message": "Authenticated successfully", "user_info": teacher_public}
+@app.post("/logout")
+def logout(request: Request, response: Response):
+    """
+    登出：清除 Session Cookie，並讓此 Token 的驗證快取立即失效
+    """
+    invalidate_session(request.cookies.get(SESSION_COOKIE))
+    response.delete_cookie(key=SESSION_COOKIE, httponly=True, samesite="strict")
+    return {"message": "Logout successful"}
 
 
 # --- 創建老師帳號 API ---
 @app.post("/register", status_code=status.HTTP_201_CREATED)
-def create_teacher(teacher_data: TeacherCreate, db: Session = Depends(get_db)):
+async def create_teacher(teacher_data: TeacherCreate, db: Session = Depends(get_db)):
     """
     使用 SQL 字串創建老師帳號
     """
     # 1. 使用 SQL 字串檢查帳號是否已存在
     sql_check = text("SELECT account FROM Teachers WHERE account = :account LIMIT 1")
-    result = db.execute(sql_check, {"account": teacher_data.account}).first()
+    result = await run_in_threadpool(lambda: db.execute(sql_check, {"account": teacher_data.account}).first())
     
     if result:
         raise HTTPException(status_code=400, detail="Account already registered")
 
     # 2. 密碼雜湊
-    hashed_password = get_password_hash(teacher_data.password)
+    hashed_password = await get_password_hash_async(teacher_data.password)
 
     # 3. 準備 SQL 插入語法
     new_teacher_id = str(uuid4())
@@ -191,46 +273,32 @@ def create_teacher(teacher_data: TeacherCreate, db: Session = Depends(get_db)):
         VALUES (:id, :name, :office, :account, :password)
     """)
     
-    # 4. 執行 SQL 插入
-    db.execute(sql_insert, {
-        "id": new_teacher_id,
-        "name": teacher_data.name,
-        "office": teacher_data.office,
-        "account": teacher_data.account,
-        "password": hashed_password
-    })
-    
-    # 5. 提交交易
-    db.commit()
+    # 4. 執行 SQL 插入並提交交易
+    def insert_teacher():
+        db.execute(sql_insert, {
+            "id": new_teacher_id,
+            "name": teacher_data.name,
+            "office": teacher_data.office,
+            "account": teacher_data.account,
+            "password": hashed_password
+        })
+        db.commit()
+
+    await run_in_threadpool(insert_teacher)
 
-    # 6. 回傳成功訊息
+    # 5. 回傳成功訊息
     return {"message": "Teacher created successfully", "teacher_id": new_teacher_id}
 
 
 # 定義 POST API 端點來創建一個新班級
 @app.post("/create_class", response_model=Class)
-async def create_class(request: Request, request_data: CreateClassRequest, db: str = Depends(get_db)):
+async def create_class(request_data: CreateClassRequest, teacher_id: str = Depends(get_teacher_id), db: str = Depends(get_db)):
     """
     創建一個新班級。
 
     這個端點接收科目和班級名稱，並自動從 session 中獲取老師 ID。
     """
     try:
-        # 從請求的 Cookie 中取得 Session Token
-        session_token = request.cookies.get("session_token")
-        if not session_token:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
-
-        # 驗證 Session Token 是否有效
-        session_data = verify_session_token(session_token)
-        if not session_data:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session expired or invalid")
-
-        # 從 Session Data 取得使用者 ID
-        teacher_id = session_data.get("user_id")
-        if not teacher_id:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid session data")
-
         # 使用提供的資料和自動生成的 ID 創建一個新的 Class 物件
         new_class = Class(
             teacher_id=teacher_id,
@@ -251,7 +319,7 @@ async def create_class(request: Request, request_data: CreateClassRequest, db: s
         )
         db.commit()
 
-        print(f"新班級已創建: {new_class}")
+        log_event(logger, logging.INFO, "class_created", class_id=new_class.id, teacher_id=new_class.teacher_id)
 
         return new_class
     except Exception as e:
@@ -259,60 +327,46 @@ async def create_class(request: Request, request_data: CreateClassRequest, db: s
         raise HTTPException(status_code=500, detail=str(e))
 
 # 新增 GET API 端點來獲取某位老師的所有班級
-@app.get("/get_my_classes", response_model=List[Class])
-async def get_my_classes(request: Request, db: Session = Depends(get_db)):
+CLASS_FIELDS = ("id", "teacher_id", "subject", "class_name")
+EXAM_FIELDS = ("id", "teacher_id", "class_id", "exam_name", "total_pages", "correct_answer")
+STUDENT_FIELDS = ("id", "student_id", "name", "class_id", "class")
+GALLERY_FIELDS = ("id", "student_id", "name", "class_name", "photos", "photo_urls")
+
+
+@app.get("/get_my_classes", response_class=JSONResponse, responses=list_responses(Class))
+async def get_my_classes(
+    teacher_id: str = Depends(get_teacher_id),
+    page: ListParams = Depends(list_params),
+    db: Session = Depends(get_db)
+):
     """
-    獲取當前登入老師所創建的所有班級。
+    獲取當前登入老師所創建的所有班級 (依 id 排序，可用 limit / cursor 分頁、fields 選擇欄位)。
     """
     try:
-        # 從請求的 Cookie 中取得 Session Token
-        session_token = request.cookies.get("session_token")
-        if not session_token:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
-
-        # 驗證 Session Token 是否有效
-        session_data = verify_session_token(session_token)
-        if not session_data:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session expired or invalid")
-
-        # 從 Session Data 取得使用者 ID
-        teacher_id = session_data.get("user_id")
-        if not teacher_id:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid session data")
-        
+        keys = ("id",)
+        columns = page.select(CLASS_FIELDS, keys)
+        params = {"teacher_id": teacher_id, **(page.after(keys) or {})}
+        where = " AND id > :after_id" if page.cursor else ""
+
         # 使用 SQL 語法查詢資料庫，篩選出該老師的所有班級
-        sql_query = text("SELECT id, teacher_id, subject, class_name FROM classes WHERE teacher_id = :teacher_id")
-        result = db.execute(sql_query, {"teacher_id": teacher_id}).fetchall()
-        
-        # 將資料庫結果轉換為 Class 物件列表
-        teacher_classes = [Class(**row._asdict()) for row in result]
-        
-        return teacher_classes
+        sql_query = text(
+            f"SELECT {', '.join(columns)} FROM classes WHERE teacher_id = :teacher_id{where} ORDER BY id{page.limit_sql}"
+        )
+        result = db.execute(sql_query, params).fetchall()
+
+        return page.response([row._asdict() for row in result], keys)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 # 獲取單一班級的 API 端點
 @app.get("/get_class", response_model=Class)
-async def get_class(id: str, request: Request, db: Session = Depends(get_db)):
+async def get_class(id: str, teacher_id: str = Depends(get_teacher_id), db: Session = Depends(get_db)):
     """
     根據 UUID 獲取單一班級的詳細資料。
     """
     try:
-        # 從請求的 Cookie 中取得 Session Token
-        session_token = request.cookies.get("session_token")
-        if not session_token:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
-
-        # 驗證 Session Token 是否有效
-        session_data = verify_session_token(session_token)
-        if not session_data:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session expired or invalid")
-
-        # 從 Session Data 取得使用者 ID
-        teacher_id = session_data.get("user_id")
-        if not teacher_id:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid session data")
-        
         # 使用 SQL 語法查詢資料庫，同時比對班級ID和老師ID
         sql_query = text("SELECT id, teacher_id, subject, class_name FROM classes WHERE id = :class_id AND teacher_id = :teacher_id LIMIT 1")
         result = db.execute(sql_query, {"class_id": id, "teacher_id": teacher_id}).first()
@@ -328,28 +382,14 @@ async def get_class(id: str, request: Request, db: Session = Depends(get_db)):
 
 @app.post("/add_test")
 async def add_test(
-    request: Request,
     test_data: TestCreate,
+    teacher_id: str = Depends(get_teacher_id),
     db: Session = Depends(get_db)
 ):
     """
     為指定班級新增一個測驗。
     """
     try:
-        # 從請求的 Cookie 中取得 Session Token
-        session_token = request.cookies.get("session_token")
-        if not session_token:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="未驗證")
-
-        # 驗證 Session Token 是否有效
-        session_data = verify_session_token(session_token)
-        if not session_data:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session 過期或無效")
-        
-        teacher_id = session_data.get("user_id")
-        if not teacher_id:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session 資料無效")
-
         new_test_id = str(uuid4())
         # 將新的 correct_answer 字典結構轉換為 JSON 字串
         correct_answer_json = json.dumps({
@@ -382,64 +422,58 @@ async def add_test(
         raise HTTPException(status_code=500, detail=str(e))
     
 # 新增 GET API 端點來獲取某個班級的所有測驗
-@app.get("/get_exams/{class_id}", response_model=List[Exam])
-async def get_exams_by_class(class_id: str, request: Request, db: Session = Depends(get_db)):
+@app.get("/get_exams/{class_id}", response_class=JSONResponse, responses=list_responses(Exam))
+async def get_exams_by_class(
+    class_id: str,
+    teacher_id: str = Depends(get_teacher_id),
+    page: ListParams = Depends(list_params),
+    db: Session = Depends(get_db)
+):
     """
-    根據班級 ID 獲取該班級所有相關的測驗。
+    根據班級 ID 獲取該班級所有相關的測驗 (新到舊，可用 limit / cursor 分頁)。
+    列表頁可用 fields 省略 correct_answer，例如 ?fields=id,exam_name,total_pages。
     """
     try:
-        # 從請求的 Cookie 中取得 Session Token
-        session_token = request.cookies.get("session_token")
-        if not session_token:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="未驗證")
-
-        # 驗證 Session Token 是否有效
-        session_data = verify_session_token(session_token)
-        if not session_data:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session 過期或無效")
-        
-        teacher_id = session_data.get("user_id")
-        if not teacher_id:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session 資料無效")
-
         # 首先，驗證老師對此班級有存取權限
         class_query = text("SELECT id FROM classes WHERE id = :class_id AND teacher_id = :teacher_id LIMIT 1")
         class_result = db.execute(class_query, {"class_id": class_id, "teacher_id": teacher_id}).fetchone()
         if not class_result:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="班級不存在或無權存取。")
 
-        # 獲取該班級的所有測驗
-        sql_query = text("SELECT id, teacher_id, class_id, exam_name, total_pages, correct_answer FROM exams WHERE class_id = :class_id ORDER BY created_at DESC")
-        result = db.execute(sql_query, {"class_id": class_id}).fetchall()
-        
-        exams_list = [Exam(**row._asdict()) for row in result]
-        
-        return exams_list
+        keys = ("created_at", "id")
+        columns = page.select(EXAM_FIELDS, keys)
+        params = {"class_id": class_id, **(page.after(keys) or {})}
+        where = (
+            " AND (created_at < :after_created_at OR (created_at = :after_created_at AND id < :after_id))"
+            if page.cursor else ""
+        )
 
+        # 獲取該班級的測驗 (只讀取需要的欄位)
+        sql_query = text(
+            f"SELECT {', '.join(columns)} FROM exams WHERE class_id = :class_id{where} "
+            f"ORDER BY created_at DESC, id DESC{page.limit_sql}"
+        )
+        exams_list = []
+        for row in db.execute(sql_query, params):
+            exam = row._asdict()
+            if isinstance(exam.get("correct_answer"), str):
+                exam["correct_answer"] = json.loads(exam["correct_answer"])
+            exams_list.append(exam)
+
+        return page.response(exams_list, keys)
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 新增 GET API 端點來獲取單一測驗
 @app.get("/get_exam/{exam_id}", response_model=Exam)
-async def get_exam_by_id(exam_id: str, request: Request, db: Session = Depends(get_db)):
+async def get_exam_by_id(exam_id: str, teacher_id: str = Depends(get_teacher_id), db: Session = Depends(get_db)):
     """
     根據測驗 ID 獲取單一測驗的詳細資料。
     """
     try:
-        # 從請求的 Cookie 中取得 Session Token
-        session_token = request.cookies.get("session_token")
-        if not session_token:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="未驗證")
-
-        # 驗證 Session Token 是否有效
-        session_data = verify_session_token(session_token)
-        if not session_data:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session 過期或無效")
-        
-        teacher_id = session_data.get("user_id")
-        if not teacher_id:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session 資料無效")
-        
         # 查詢資料庫，同時比對測驗 ID 和老師 ID
         sql_query = text("SELECT id, teacher_id, class_id, exam_name, total_pages, correct_answer FROM exams WHERE id = :exam_id AND teacher_id = :teacher_id LIMIT 1")
         result = db.execute(sql_query, {"exam_id": exam_id, "teacher_id": teacher_id}).first()
@@ -494,63 +528,51 @@ async def add_students_bulk(payload: AddStudentsPayload, db: Session = Depends(g
         db.rollback()
         raise HTTPException(status_code=500, detail=f"處理請求時發生錯誤: {str(e)}")
 
-@app.get("/get_students/{class_id}", response_model=List[StudentResponse])
-async def get_students_by_class(class_id: str, request: Request, db: Session = Depends(get_db)):
+@app.get("/get_students/{class_id}", response_class=JSONResponse, responses=list_responses(StudentResponse))
+async def get_students_by_class(
+    class_id: str,
+    teacher_id: str = Depends(get_teacher_id),
+    page: ListParams = Depends(list_params),
+    db: Session = Depends(get_db)
+):
     """
-    根據班級 ID 獲取該班級所有學生的清單。
+    根據班級 ID 獲取該班級所有學生的清單 (依學號排序，可用 limit / cursor 分頁、fields 選擇欄位)。
     """
     try:
-        # 從請求的 Cookie 中取得 Session Token
-        session_token = request.cookies.get("session_token")
-        if not session_token:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="未驗證")
-
-        # 驗證 Session Token 是否有效
-        session_data = verify_session_token(session_token)
-        if not session_data:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session 過期或無效")
-        
-        teacher_id = session_data.get("user_id")
-        if not teacher_id:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session 資料無效")
-
         # 首先，驗證老師對此班級有存取權限
         class_query = text("SELECT id FROM classes WHERE id = :class_id AND teacher_id = :teacher_id LIMIT 1")
         class_result = db.execute(class_query, {"class_id": class_id, "teacher_id": teacher_id}).fetchone()
         if not class_result:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="班級不存在或無權存取。")
 
-        # 獲取該班級的所有學生
-        sql_query = text("SELECT id, student_id, name, class_id, class FROM students WHERE class_id = :class_id ORDER BY student_id ASC")
-        result = db.execute(sql_query, {"class_id": class_id}).fetchall()
-        
-        # 將資料轉換為 Pydantic 模型列表
-        students_list = [StudentResponse(**row._asdict()) for row in result]
-        
-        return students_list
+        keys = ("student_id", "id")
+        columns = page.select(STUDENT_FIELDS, keys)
+        params = {"class_id": class_id, **(page.after(keys) or {})}
+        where = (
+            " AND (student_id > :after_student_id OR (student_id = :after_student_id AND id > :after_id))"
+            if page.cursor else ""
+        )
+
+        # 獲取該班級的學生
+        sql_query = text(
+            f"SELECT {', '.join(columns)} FROM students WHERE class_id = :class_id{where} "
+            f"ORDER BY student_id ASC, id ASC{page.limit_sql}"
+        )
+        result = db.execute(sql_query, params).fetchall()
+
+        return page.response([row._asdict() for row in result], keys)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 @app.get("/get_students_test_data/{class_id}/{exam_id}", response_model=List[StudentTestResponse])
-async def get_students_by_class(class_id: str, exam_id: str, request: Request, db: Session = Depends(get_db)):
+async def get_students_by_class(class_id: str, exam_id: str, teacher_id: str = Depends(get_teacher_id), db: Session = Depends(get_db)):
     """
     根據班級 ID 獲取該班級所有學生的清單，並顯示每位學生已上傳的測驗頁面數量。
+    頁數由 exam_student_summary 以主鍵讀取 (上傳與批改完成時更新)，不再即時 COUNT exam_pages / ai_result。
     """
     try:
-        # 從請求的 Cookie 中取得 Session Token
-        session_token = request.cookies.get("session_token")
-        if not session_token:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="未驗證")
-
-        # 驗證 Session Token 是否有效
-        session_data = verify_session_token(session_token)
-        if not session_data:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session 過期或無效")
-        
-        teacher_id = session_data.get("user_id")
-        if not teacher_id:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session 資料無效")
-
         # 首先，驗證老師對此班級和測驗有存取權限
         class_query = text("SELECT id FROM classes WHERE id = :class_id AND teacher_id = :teacher_id LIMIT 1")
         class_result = db.execute(class_query, {"class_id": class_id, "teacher_id": teacher_id}).fetchone()
@@ -570,15 +592,12 @@ async def get_students_by_class(class_id: str, exam_id: str, request: Request, d
         s.name,
         s.class_id,
         s.class,
-        COUNT(DISTINCT ep.id) AS uploaded_pages_count,
-        COUNT(DISTINCT ar.id) AS ai_result_count
+        COALESCE(ss.uploaded_pages, 0) AS uploaded_pages_count,
+        COALESCE(ss.graded_pages, 0) AS ai_result_count
     FROM students s
-    LEFT JOIN exam_pages ep 
-        ON s.id = ep.student_id AND ep.exam_id = :exam_id
-    LEFT JOIN ai_result ar 
-        ON ar.exam_page_id = ep.id  -- 這裡用 exam_pages.id 連到 ai_result
+    LEFT JOIN exam_student_summary ss
+        ON ss.exam_id = :exam_id AND ss.student_id = s.id
     WHERE s.class_id = :class_id
-    GROUP BY s.id, s.student_id, s.name, s.class_id, s.class
     ORDER BY s.student_id ASC
 """)
 
@@ -594,33 +613,190 @@ async def get_students_by_class(class_id: str, exam_id: str, request: Request, d
 
     
     
+def _validate_image(file_path: str) -> bool:
+    """以縮小 8 倍的灰階模式解碼，快速確認檔案是完整可讀的圖片"""
+    return cv2.imread(file_path, cv2.IMREAD_REDUCED_GRAYSCALE_8) is not None
+
+
+def _insert_exam_pages(db: Session, insert_data: List[dict]):
+    """以單一 executemany 寫入所有頁面，並在同一交易中更新學生的測驗彙總後提交"""
+    sql_query = text("""
+        INSERT INTO exam_pages (id, exam_id, student_id, page_number, photo_path, photo_hash, ai_result)
+        VALUES (:id, :exam_id, :student_id, :page_number, :photo_path, :photo_hash, :ai_result)
+    """)
+    db.execute(sql_query, insert_data)
+    if insert_data:
+        summary.refresh_students(db, insert_data[0]["exam_id"], {d["student_id"] for d in insert_data})
+    db.commit()
+    for d in insert_data:
+        PHOTOS.put(d["id"], d["photo_path"], d["photo_hash"])
+
+
+async def _save_upload(file: UploadFile, file_path: str) -> str:
+    """
+    以固定大小的 chunk 非同步寫入上傳檔案，超過 MAX_UPLOAD_BYTES 時中止並刪除檔案。
+    回傳寫入時一併計算的內容雜湊 (photo_hash，見 photo_store)。
+    """
+    written = 0
+    hasher = new_hasher()
+    async with await anyio.open_file(file_path, "wb") as buffer:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            written += len(chunk)
+            if written > MAX_UPLOAD_BYTES:
+                break
+            hasher.update(chunk)
+            await buffer.write(chunk)
+
+    if written > MAX_UPLOAD_BYTES:
+        os.remove(file_path)
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"檔案 {file.filename} 超過大小上限 ({MAX_UPLOAD_BYTES // (1024 * 1024)} MB)。"
+        )
+    if written == 0:
+        os.remove(file_path)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"檔案 {file.filename} 是空的。")
+    return digest_of(hasher)
+
+
+def prefetch_page_vision(exam_id: str, photo_path: str):
+    """
+    上傳後先對單一頁面執行視覺辨識並寫入 VisionCache，
+    之後的批改工作只需讀取快取並執行 grade_results。
+    """
+    _analyze_pages([photo_path], [photo_path], exam_id, batch_size=1)
+
+
+# 執行中的預先辨識 {photo_path: Future}，批改工作會等這些頁面辨識完再讀取快取
+_prefetches: Dict[str, Future] = {}
+_prefetches_lock = threading.Lock()
+
+
+def _submit_prefetch(exam_id: str, photo_path: str):
+    """頁面驗證完成後立即開始預先辨識；失敗時記錄錯誤 (批改工作會重新辨識該頁)"""
+    future = app_state["prefetch_executor"].submit(prefetch_page_vision, exam_id, photo_path)
+    with _prefetches_lock:
+        _prefetches[photo_path] = future
+    future.add_done_callback(lambda f: _prefetch_done(exam_id, photo_path, f))
+
+
+def _prefetch_done(exam_id: str, photo_path: str, future: Future):
+    with _prefetches_lock:
+        if _prefetches.get(photo_path) is future:
+            del _prefetches[photo_path]
+    if not future.cancelled() and future.exception() is not None:
+        error = future.exception()
+        log_event(logger, logging.WARNING, "vision_prefetch_failed", exam_id=exam_id, photo_path=photo_path,
+                  error=str(error), exc_info=(type(error), error, error.__traceback__))
+
+
+def _wait_for_prefetches(photo_paths: List[str], cancel: bool = False):
+    """
+    等待這些頁面的預先辨識完成 (結果寫入 VisionCache 後，批改時直接命中快取)。
+    cancel=True 時 (上傳失敗、即將刪除檔案) 取消還在排隊的，只等待正在讀取檔案的。
+    """
+    with _prefetches_lock:
+        futures = [_prefetches[path] for path in photo_paths if path in _prefetches]
+    if cancel:
+        futures = [future for future in futures if not future.cancel()]
+    if futures:
+        futures_wait(futures)
+
+
+async def _discard_uploads(paths: List[str]):
+    """上傳失敗時：先停止讀取這些檔案的預先辨識，再刪除檔案"""
+    await run_in_threadpool(_wait_for_prefetches, paths, True)
+    _remove_files(paths)
+
+
+def _analyze_pages(photo_paths: List[str], page_ids: List[str], exam_id: str, batch_size: int):
+    """
+    視覺辨識：model server 模式送到推論伺服器，否則在本行程執行 (使用 VisionCache)。
+    回傳 (page_results, page_timers)，見 detect.analyze_pages。
+    """
+    client = app_state.get("inference")
+    if client is not None:
+        return client.analyze(photo_paths, page_ids, exam_id, batch_size=batch_size)
+
+    yolo = MODELS.get("yolo")
+    return analyze_pages(
+        photo_paths,
+        page_ids,
+        yolo["detector"],
+        exam_id,
+        batch_size=batch_size,
+        cache=app_state["vision_cache"],
+        model_version=yolo["model_version"]
+    )
+
+
 @app.post("/upload_exam_photos")
 async def upload_exam_photos(
+    request: Request,
     exam_id: str = Form(...),
     student_id: str = Form(...),
-    files: List[UploadFile] = Form(...)
+    files: List[UploadFile] = Form(...),
+    grade: bool = Form(False),
+    db: Session = Depends(get_db)
 ):
     """
     上傳學生測驗照片並儲存到資料庫中。
+
+    - 檔案以 chunk 非同步寫入，單檔大小上限為 MAX_UPLOAD_BYTES，寫完後立即解碼驗證。
+    - 所有頁面以單一 executemany 寫入 exam_pages。
+    - grade=true 時，每頁驗證完成後即開始視覺辨識 (不等整批上傳完成)，並建立批改工作 (回傳 job_id)。
     """
-    db = next(get_db())
+    saved_paths = []
     try:
+        teacher_id = None
+        correct_answer = {}
+        if grade:
+            # 建立批改工作需要登入身分與測驗答案
+            session_data = verify_session(request.cookies.get(SESSION_COOKIE))
+            teacher_id = session_data.get("user_id") if session_data else None
+            if not teacher_id:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="未驗證")
+
+            exam_result = await run_in_threadpool(
+                lambda: db.execute(
+                    text("SELECT correct_answer FROM exams WHERE id = :exam_id AND teacher_id = :teacher_id LIMIT 1"),
+                    {"exam_id": exam_id, "teacher_id": teacher_id}
+                ).fetchone()
+            )
+            if not exam_result:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="測驗不存在或您無權存取。")
+            if exam_result.correct_answer:
+                try:
+                    correct_answer = json.loads(exam_result.correct_answer)
+                except Exception:
+                    pass
+
         # 根據 exam_id 和 student_id 建立路徑
         save_dir = os.path.join(UPLOAD_FOLDER, exam_id, student_id)
-        if not os.path.exists(save_dir):
-            os.makedirs(save_dir)
+        os.makedirs(save_dir, exist_ok=True)
 
         # 準備批量插入的資料
         insert_data = []
 
         for i, file in enumerate(files):
-            file_extension = os.path.splitext(file.filename)[1]
+            file_extension = os.path.splitext(file.filename or "")[1].lower()
+            if file_extension.lstrip(".") not in img_formats:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"不支援的檔案格式: {file.filename}")
+
             unique_filename = f"{uuid4()}{file_extension}"
             file_path = os.path.join(save_dir, unique_filename)
             
-            # 將檔案儲存到伺服器
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            # 將檔案以 chunk 非同步儲存到伺服器
+            photo_hash = await _save_upload(file, file_path)
+            saved_paths.append(file_path)
+
+            # 解碼驗證 (在 threadpool 執行，不阻塞 event loop)
+            if not await run_in_threadpool(_validate_image, file_path):
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"無法解析的圖片: {file.filename}")
+
+            # 這一頁先開始視覺辨識；之後上傳失敗時，_discard_uploads 會先等它停止再刪檔
+            if grade:
+                _submit_prefetch(exam_id, file_path)
 
             # 準備插入資料庫的記錄
             record = {
@@ -629,49 +805,127 @@ async def upload_exam_photos(
                 "student_id": student_id,
                 "page_number": i + 1,
                 "photo_path": file_path,
+                "photo_hash": photo_hash,
                 "ai_result": "{}",
             }
             insert_data.append(record)
 
-        # 將資料插入資料庫
-        for record in insert_data:
-            sql_query = text("""
-                INSERT INTO exam_pages (id, exam_id, student_id, page_number, photo_path, ai_result)
-                VALUES (:id, :exam_id, :student_id, :page_number, :photo_path, :ai_result)
-            """)
-            db.execute(sql_query, record)
+        # 將資料一次插入資料庫
+        await run_in_threadpool(_insert_exam_pages, db, insert_data)
 
-        db.commit()
-        return {"message": "檔案上傳成功", "uploaded_files": [d['photo_path'] for d in insert_data]}
+        response = {"message": "檔案上傳成功", "uploaded_files": [d['photo_path'] for d in insert_data]}
+        if grade:
+            pages = [{"exam_page_id": d["id"], "photo_path": d["photo_path"]} for d in insert_data]
+            try:
+                response["job_id"] = app_state["job_queue"].submit(exam_id, teacher_id, "single", pages, correct_answer)
+            except JobQueueFull as e:
+                # 檔案已成功寫入，只是暫時無法排入批改
+                response["grading_error"] = str(e)
+        return response
 
+    except HTTPException:
+        await _discard_uploads(saved_paths)
+        raise
     except SQLAlchemyError as e:
         db.rollback()
+        await _discard_uploads(saved_paths)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"資料庫錯誤: {e}")
     except Exception as e:
+        await _discard_uploads(saved_paths)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"上傳錯誤: {e}")
+
+
+def _remove_files(paths: List[str]):
+    """上傳失敗時清除已寫入的檔案"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
     
+def _lookup_photo(photo_id: str) -> Optional[PhotoEntry]:
+    """
+    由 PHOTOS 取得照片路徑與 photo_hash，沒有時查詢資料庫後記住。
+    舊資料沒有 photo_hash 時計算一次並寫回 exam_pages。
+    """
+    entry = PHOTOS.get(photo_id)
+    if entry is not None:
+        if os.path.isfile(entry.path):
+            return entry
+        # 檔案已被刪除或搬移：移除快取並重新查詢資料庫
+        PHOTOS.discard(photo_id)
+
+    with session_scope() as db:
+        row = db.execute(
+            text("SELECT photo_path, photo_hash FROM exam_pages WHERE id = :id"), {"id": photo_id}
+        ).first()
+        if not row or not os.path.isfile(row.photo_path):
+            return None
+        digest = row.photo_hash
+        if not digest:
+            digest = file_digest(row.photo_path)
+            db.execute(text("UPDATE exam_pages SET photo_hash = :photo_hash WHERE id = :id"),
+                       {"photo_hash": digest, "id": photo_id})
+
+    PHOTOS.put(photo_id, row.photo_path, digest)
+    return PhotoEntry(row.photo_path, digest)
+
+
+def _photo_response(request: Request, entry: PhotoEntry, immutable: bool) -> Response:
+    """
+    回傳照片：If-None-Match 相符時回應 304，
+    設定 PHOTO_ACCEL_REDIRECT 時交給 nginx 送檔，否則以 FileResponse 回傳 (支援 Range)。
+    """
+    headers = {
+        "ETag": etag(entry.digest),
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+    }
+    if is_not_modified(request.headers.get("if-none-match"), entry.digest):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    media_type, _ = mimetypes.guess_type(entry.path)
+    if PHOTO_ACCEL_REDIRECT:
+        try:
+            relative_path = Path(entry.path).resolve().relative_to(Path(UPLOAD_FOLDER).resolve()).as_posix()
+        except ValueError:
+            # 不在 UPLOAD_FOLDER 內的檔案，nginx 的 internal location 無法送出
+            log_event(logger, logging.WARNING, "photo_outside_upload_folder", path=entry.path)
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="找不到對應的圖片。")
+        headers["X-Accel-Redirect"] = PHOTO_ACCEL_REDIRECT.rstrip("/") + "/" + quote(relative_path)
+        return Response(media_type=media_type, headers=headers)
+    return FileResponse(entry.path, media_type=media_type, headers=headers)
+
+
 @app.get("/photo/{id}", response_class=FileResponse)
-async def get_photo_by_id(id: str, db: Session = Depends(get_db)):
+async def get_photo_by_id(id: str, request: Request):
     """
-    根據 exam_pages 的 ID 獲取並回傳圖片檔案。
+    根據 exam_pages 的 ID 獲取並回傳圖片檔案 (每次以 ETag 驗證，未變更時回應 304)。
     """
     try:
-        # 使用 SQL 查詢來尋找 photo_path
-        sql_query = text("SELECT photo_path FROM exam_pages WHERE id = :id")
-        result = db.execute(sql_query, {"id": id}).fetchone()
-
-        if not result:
+        entry = await run_in_threadpool(_lookup_photo, id)
+        if entry is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="找不到對應的圖片。")
+        return _photo_response(request, entry, immutable=False)
 
-        photo_path = result.photo_path
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # 檢查檔案是否存在
-        if not os.path.exists(photo_path):
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="圖片檔案不存在於伺服器。")
 
-        # 回傳圖片檔案
-        return FileResponse(photo_path)
+@app.get("/photo/{id}/{photo_hash}", response_class=FileResponse)
+async def get_photo_by_hash(id: str, photo_hash: str, request: Request):
+    """
+    不可變的照片網址 (見 photo_store.photo_url)：內容不會改變，瀏覽器可長期快取。
+    """
+    try:
+        entry = await run_in_threadpool(_lookup_photo, id)
+        if entry is None or entry.digest != photo_hash:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="找不到對應的圖片。")
+        return _photo_response(request, entry, immutable=True)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -691,6 +945,15 @@ async def serve_image(file_path: str):
     except Exception:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="路徑解析失敗。")
 
+    # 結果圖 (縮圖或 *_full 原尺寸) 尚未產生時，依批改時寫出的描述檔繪製
+    if not resolved_path.exists():
+        try:
+            await asyncio.wrap_future(get_renderer().ensure(resolved_path))
+        except Exception as e:
+            log_event(logger, logging.ERROR, "overlay_render_failed", exc_info=True, path=str(resolved_path),
+                      error=str(e))
+            raise HTTPException(status_code=500, detail="結果圖產生失敗。")
+
     # 檢查檔案是否存在
     if not resolved_path.exists() or not resolved_path.is_file():
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="找不到檔案。")
@@ -728,104 +991,80 @@ async def get_student_photos(exam_id: str, student_id: str, db: Session = Depend
         raise HTTPException(status_code=500, detail=str(e))
     
 # 新增 GET API 端點來獲取特定測驗的學生和照片列表
-@app.get("/get_exam_gallery/{exam_id}", response_model=List[StudentWithPhotos])
-async def get_exam_gallery(exam_id: str, request: Request, db: Session = Depends(get_db)):
+@app.get("/get_exam_gallery/{exam_id}", response_class=JSONResponse, responses=list_responses(StudentWithPhotos))
+async def get_exam_gallery(
+    exam_id: str,
+    teacher_id: str = Depends(get_teacher_id),
+    page: ListParams = Depends(list_params),
+    db: Session = Depends(get_db)
+):
     """
-    根據測驗 ID 獲取所有相關學生的上傳照片列表。
+    根據測驗 ID 獲取所有相關學生的上傳照片列表 (依學生 id 排序，可用 limit / cursor 分頁、fields 選擇欄位)。
     """
     try:
-        # 從請求的 Cookie 中取得 Session Token
-        session_token = request.cookies.get("session_token")
-        if not session_token:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="未驗證")
-
-        # 驗證 Session Token 是否有效
-        session_data = verify_session_token(session_token)
-        if not session_data:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session 過期或無效")
-        
-        teacher_id = session_data.get("user_id")
-        if not teacher_id:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session 資料無效")
-        
         # 1. 首先，驗證老師對此測驗有存取權限
         exam_query = text("SELECT id FROM exams WHERE id = :exam_id AND teacher_id = :teacher_id LIMIT 1")
         exam_result = db.execute(exam_query, {"exam_id": exam_id, "teacher_id": teacher_id}).fetchone()
         if not exam_result:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="測驗不存在或您無權存取。")
-        
-        # 2. 從 exam_pages 中獲取與該測驗相關的所有照片和學生 ID
-        pages_query = text("SELECT student_id, id FROM exam_pages WHERE exam_id = :exam_id")
-        pages_result = db.execute(pages_query, {"exam_id": exam_id}).fetchall()
-        
-        if not pages_result:
-            return []  # 如果沒有照片，直接返回空列表
-
-        # 3. 創建一個字典，將照片按學生分組
-        student_photos: Dict[str, List[str]] = {}
-        unique_student_ids = set()
-        for row in pages_result:
-            student_id = row.student_id
-            photo_id = row.id
-            unique_student_ids.add(student_id)
-            if student_id not in student_photos:
-                student_photos[student_id] = []
-            student_photos[student_id].append(photo_id)
-
-        # 4. 根據學生 ID 列表從 students 表中獲取學生資訊
-        students_query = text("SELECT id, student_id, name, class AS class_name FROM students WHERE id IN :student_id")
-        students_result = db.execute(students_query, {"student_id": list(unique_student_ids)}).fetchall()
-        
-        # 5. 組合最終結果
-        final_gallery: List[StudentWithPhotos] = []
-        for student_row in students_result:
-            student_id = student_row.id
-            final_gallery.append(
-                StudentWithPhotos(
-                    id=student_row.id,
-                    student_id=student_row.student_id,
-                    name=student_row.name,
-                    class_name=student_row.class_name,
-                    photos=student_photos.get(student_id, [])
-                )
-            )
 
-        return final_gallery
+        # 2. 由 exam_student_summary 找出這一頁有上傳照片的學生 (主鍵 (exam_id, student_id) 依序讀取)
+        keys = ("id",)
+        page.select(GALLERY_FIELDS, keys)
+        params = {"exam_id": exam_id, **(page.after(keys) or {})}
+        where = " AND ss.student_id > :after_id" if page.cursor else ""
+        students_query = text(f"""
+            SELECT s.id, s.student_id, s.name, s.class AS class_name
+            FROM exam_student_summary AS ss
+            JOIN students AS s ON s.id = ss.student_id
+            WHERE ss.exam_id = :exam_id AND ss.uploaded_pages > 0{where}
+            ORDER BY ss.student_id{page.limit_sql}
+        """)
+        students = [row._asdict() for row in db.execute(students_query, params)]
+        if not students:
+            return page.response([])  # 如果沒有照片，直接返回空列表
+
+        # 3. 只讀取這些學生的頁面 ID，按學生分組
+        for student in students:
+            student["photos"] = []
+            student["photo_urls"] = []
+        by_student = {student["id"]: student for student in students[:page.limit or None]}
+        if "photos" in page.output or "photo_urls" in page.output:
+            pages_query = text("""
+                SELECT student_id, id, photo_hash FROM exam_pages
+                WHERE exam_id = :exam_id AND student_id IN :student_ids
+                ORDER BY page_number
+            """).bindparams(bindparam("student_ids", expanding=True))
+            for row in db.execute(pages_query, {"exam_id": exam_id, "student_ids": list(by_student)}):
+                by_student[row.student_id]["photos"].append(row.id)
+                # 有 photo_hash 時為不可變網址，瀏覽器不會重新下載
+                by_student[row.student_id]["photo_urls"].append(photo_url(row.id, row.photo_hash))
+
+        return page.response(students, keys)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 
 
 @app.get("/ai/detect_exam/{exam_id}")
-async def detect_exam(
+def detect_exam(
     exam_id: str,
-    request: Request,
+    teacher_id: str = Depends(get_teacher_id),
     db: Session = Depends(get_db),
     mode: str = Query("single", description="模式: single (預設) / all")
 ):
     """
-    根據測驗 ID 獲取所有相關的測驗圖片路徑，並進行 AI 批改，
-    最後將結果儲存到資料庫中。
+    根據測驗 ID 獲取所有相關的測驗圖片路徑，建立背景批改工作並立即回傳 job_id。
+    批改進度可透過 /ai/jobs/{job_id} 查詢，結果會在批改完成後儲存到資料庫中。
     
     Query parameter:
     - mode=single (預設)：已生成的圖片不再重做
     - mode=all：全部圖片都重做
     """
     try:
-        # 驗證 session
-        session_token = request.cookies.get("session_token")
-        if not session_token:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="未驗證")
-
-        session_data = verify_session_token(session_token)
-        if not session_data:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session 過期或無效")
-        
-        teacher_id = session_data.get("user_id")
-        if not teacher_id:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session 資料無效")
-
         # 取 exams 的 id + correct_answer
         exam_query = text("""
             SELECT id, correct_answer 
@@ -841,6 +1080,8 @@ async def detect_exam(
         if not exam_result:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="測驗不存在或您無權存取。")
 
+        job_queue: GradingJobQueue = app_state["job_queue"]
+
         correct_answer = {}
         if exam_result.correct_answer:
             try:
@@ -848,178 +1089,282 @@ async def detect_exam(
             except Exception:
                 pass
 
-        # 獲取與該測驗 ID 相關的所有圖片路徑和 exam_page_id
+        # 獲取與該測驗 ID 相關的所有圖片路徑和 exam_page_id，並一次查出每頁是否已有 ai_result
         sql_query = text("""
-            SELECT id, photo_path 
-            FROM exam_pages 
-            WHERE exam_id = :exam_id 
-            ORDER BY page_number ASC
+            SELECT ep.id, ep.photo_path,
+                EXISTS (SELECT 1 FROM ai_result AS ar WHERE ar.exam_page_id = ep.id) AS has_result
+            FROM exam_pages AS ep
+            WHERE ep.exam_id = :exam_id 
+            ORDER BY ep.page_number ASC
         """)
         result = db.execute(sql_query, {"exam_id": exam_id}).fetchall()
         
-        photo_paths = []
-        page_ids = []
-
-        # 根據模式決定要處理哪些圖片
-        for row in result:
-            page_id = str(row.id)
-            photo_path = row.photo_path
-
-            if mode == "single":
-                # single 模式下，先檢查 ai_result 是否已經存在
-                existing_record = db.execute(
-                    text("SELECT id FROM ai_result WHERE exam_page_id = :page_id LIMIT 1"),
-                    {"page_id": page_id}
-                ).fetchone()
-                if existing_record:
-                    continue  # 已經生成過就跳過
+        # 根據模式決定要處理哪些圖片 (single 模式下，已經生成過的頁面跳過)
+        pages = [
+            {"exam_page_id": str(row.id), "photo_path": row.photo_path}
+            for row in result
+            if mode != "single" or not row.has_result
+        ]
+
+        if not pages:
+            return {"message": "所有圖片已生成結果，無需重新批改。", "paths": [row.photo_path for row in result]}
 
-            # 將需要處理的圖片加入列表
-            photo_paths.append(photo_path)
-            page_ids.append(page_id)
+        # 同一份測驗已有工作在排隊或執行中時 (檢查與建立在 JobStore 中一次完成)，直接回傳該工作
+        try:
+            job_id = job_queue.submit(exam_id, teacher_id, mode, pages, correct_answer or {}, exclusive=True)
+        except JobAlreadyActive as e:
+            return {"message": "此測驗已有批改工作進行中。", "job_id": e.job["id"], "status": e.job["status"]}
+        log_event(logger, logging.INFO, "grading_job_queued", job_id=job_id, exam_id=exam_id, pages=len(pages))
 
-        if not photo_paths:
-            return {"message": "所有圖片已生成結果，無需重新批改。", "paths": [row.photo_path for row in result]}
+        return {
+            "message": "批改工作已建立。",
+            "job_id": job_id,
+            "status": "queued",
+            "total_pages": len(pages)
+        }
+
+    except HTTPException:
+        raise
+    except JobQueueFull as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+    except Exception as e:
+        log_event(logger, logging.ERROR, "request_failed", exc_info=True, error=str(e))
+        raise HTTPException(status_code=500, detail=f"內部伺服器錯誤：{str(e)}")
+
+
+#----------------------------------------
+# 依儲存的偵測結果繪製結果圖
+#----------------------------------------
+@app.get("/ai/overlay/{page_id}")
+async def get_overlay(
+    page_id: str,
+    view: str = Query("bounding_box", description="bounding_box / group / step3 / grading"),
+    max_side: int = Query(OVERLAY_MAX_SIDE, ge=0, le=8192, description="輸出長邊上限 (0 = 原尺寸)"),
+    teacher_id: str = Depends(get_teacher_id),
+    db: Session = Depends(get_db)
+):
+    """
+    由 ai_result.detections 繪製指定頁面的結果圖 (預設 WebP，只限該測驗的老師)，
+    不需要批改時預先寫出的圖檔；繪製結果放在 LRU 快取 (OVERLAY_CACHE_BYTES)。
+    """
+    if view not in OVERLAY_VIEWS and view != VIEW_GRADING:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"未知的 view：{view}")
+
+    row = db.execute(
+        text("""
+            SELECT ar.detections, ar.result, ar.updated_at, ep.photo_path
+            FROM ai_result AS ar
+            JOIN exam_pages AS ep ON ar.exam_page_id = ep.id
+            JOIN exams AS e ON ep.exam_id = e.id
+            WHERE ep.id = :page_id AND e.teacher_id = :teacher_id
+            LIMIT 1
+        """),
+        {"page_id": page_id, "teacher_id": teacher_id}
+    ).fetchone()
+    if not row or not row.detections:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="找不到此頁的偵測結果。")
+
+    cache = app_state["overlay_cache"]
+    key = (page_id, str(row.updated_at), view, max_side)
+    data = cache.get(key)
+    if data is None:
+        spec = json.loads(row.detections)
+        grading = json.loads(row.result) if view == VIEW_GRADING and row.result else None
+        try:
+            img = await run_in_threadpool(
+                render_view, spec, view, max_side, grading=grading, photo_path=row.photo_path
+            )
+            data = await run_in_threadpool(encode_image, img)
+        except FileNotFoundError:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="找不到原始圖片。")
+        cache.put(key, data)
+
+    media_type, _ = mimetypes.guess_type(f"overlay.{OVERLAY_FORMAT}")
+    return Response(content=data, media_type=media_type or "application/octet-stream")
+
+
+def run_grading_job(job: dict, pages: List[dict], on_pages_done):
+    """
+    背景批改工作的執行內容 (在 GradingJobQueue 的 worker thread 中執行)。
+    每次處理 DETECT_BATCH_SIZE 頁並立即寫入資料庫，重啟後只需接續剩下的頁面。
+    各階段耗時累加到工作的 timings，整份工作的耗時記錄到 grading_job_seconds。
+    """
+    t0 = time.perf_counter()
+    store = app_state["job_queue"].store
+    for start in range(0, len(pages), DETECT_BATCH_SIZE):
+        exam_timer = StageTimer()
+        chunk = pages[start:start + DETECT_BATCH_SIZE]
+        page_ids = [p["exam_page_id"] for p in chunk]
 
-        print(f"Detecting images for paths: {photo_paths}")
+        # 上傳時的預先辨識尚未完成的頁面先等它完成，避免重複執行 YOLO / OCR
+        _wait_for_prefetches([p["photo_path"] for p in chunk])
 
         # 呼叫 AI 偵測並批改
-        ai_results = detect_images_v2(
-            photo_paths,
-            page_ids,
-            app_state["model"],
-            app_state["device"],
-            app_state["half"],
-            app_state["imgsz"],
-            exam_id,
-            correct_answer or {}
+        page_results, page_timers = _analyze_pages(
+            [p["photo_path"] for p in chunk], page_ids, job["exam_id"], batch_size=DETECT_BATCH_SIZE
+        )
+        ai_results = grade_pages(
+            page_ids, page_results, page_timers, job["correct_answer"], job["exam_id"], timer=exam_timer
         )
 
-        # 將結果儲存到資料庫
-        for result in ai_results:
-            page_id = result['exam_page_id']
-            grading_result = result['grading_results']
-            save_paths = [str(p) for p in result['save_paths']]  # WindowsPath -> str
-
-            # 檢查是否已存在
-            existing_record = db.execute(
-                text("SELECT id FROM ai_result WHERE exam_page_id = :page_id LIMIT 1"),
-                {"page_id": page_id}
-            ).fetchone()
-
-            params = {
-                "result": json.dumps(grading_result['details']),
-                "score": grading_result['total_score'],
-                "save_path": json.dumps(save_paths),
-                "updated_at": datetime.now()
-            }
+        with exam_timer.stage("db"), session_scope() as db:
+            save_ai_results(db, ai_results)
 
-            if existing_record:
-                db.execute(
-                    text("""
-                        UPDATE ai_result
-                        SET result = :result, score = :score, save_path = :save_path, updated_at = :updated_at
-                        WHERE id = :id
-                    """),
-                    {**params, "id": str(existing_record.id)}
-                )
-            else:
-                db.execute(
-                    text("""
-                        INSERT INTO ai_result (id, exam_page_id, result, score, save_path, created_at, updated_at)
-                        VALUES (:id, :exam_page_id, :result, :score, :save_path, :created_at, :updated_at)
-                    """),
-                    {
-                        **params,
-                        "id": str(uuid4()),
-                        "exam_page_id": page_id,
-                        "created_at": datetime.now()
-                    }
-                )
+        on_pages_done(page_ids)
+        store.add_timings(job["id"], exam_timer.totals)
 
-        db.commit()
-        return {"message": "批改完成，結果已儲存到資料庫。", "paths": photo_paths}
+    JOB_SECONDS.observe(time.perf_counter() - t0)
+
+
+def save_ai_results(db: Session, ai_results: List[dict]):
+    """
+    將 grade_pages 的結果寫入 ai_result (已存在則更新)，並更新所屬學生的測驗彙總，由呼叫端負責 commit。
+    依 exam_page_id 的 unique index 以單一 executemany upsert 寫入，不再逐頁查詢是否存在。
+    """
+    if not ai_results:
+        return
+    now = datetime.now()
+    rows = [
+        {
+            "id": str(uuid4()),
+            "exam_page_id": result['exam_page_id'],
+            "result": json.dumps(result['grading_results']['details']),
+            "score": result['grading_results']['total_score'],
+            "save_path": json.dumps([str(p) for p in result['save_paths']]),  # WindowsPath -> str
+            "detections": json.dumps(result['detections'], ensure_ascii=False),
+            "created_at": now,
+            "updated_at": now,
+        }
+        for result in ai_results
+    ]
+
+    insert = """
+        INSERT INTO ai_result (id, exam_page_id, result, score, save_path, detections, created_at, updated_at)
+        VALUES (:id, :exam_page_id, :result, :score, :save_path, :detections, :created_at, :updated_at)
+    """
+    if db.get_bind().dialect.name == "mysql":
+        upsert = insert + """
+            ON DUPLICATE KEY UPDATE result = VALUES(result), score = VALUES(score), save_path = VALUES(save_path),
+                detections = VALUES(detections), updated_at = VALUES(updated_at)
+        """
+    else:
+        upsert = insert + """
+            ON CONFLICT (exam_page_id) DO UPDATE SET result = excluded.result, score = excluded.score,
+                save_path = excluded.save_path, detections = excluded.detections, updated_at = excluded.updated_at
+        """
+    db.execute(text(upsert), rows)
+    summary.refresh_pages(db, [row["exam_page_id"] for row in rows])
+
+
+def _job_public(job: dict) -> dict:
+    """回傳給前端的工作狀態 (不含答案等內部欄位)"""
+    return {
+        "job_id": job["id"],
+        "exam_id": job["exam_id"],
+        "mode": job["mode"],
+        "status": job["status"],
+        "total_pages": job["total_pages"],
+        "done_pages": job["done_pages"],
+        "progress": round(job["progress"], 4),
+        "error": job["error"],
+        "timings": job["timings"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+
+@app.get("/ai/jobs/{job_id}")
+def get_grading_job(job_id: str, teacher_id: str = Depends(get_teacher_id)):
+    """
+    查詢批改工作的狀態與進度。
+    """
+    job = app_state["job_queue"].store.get_job(job_id)
+    if not job or job["teacher_id"] != teacher_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="批改工作不存在或您無權存取。")
+
+    return _job_public(job)
+
+
+@app.get("/ai/exam_jobs/{exam_id}")
+def get_exam_grading_jobs(exam_id: str, teacher_id: str = Depends(get_teacher_id)):
+    """
+    列出指定測驗的所有批改工作 (新到舊)。
+    """
+    jobs = app_state["job_queue"].store.list_jobs(exam_id, teacher_id)
+    return [_job_public(job) for job in jobs]
 
-    except HTTPException:
-        db.rollback()
-        raise
-    except Exception as e:
-        db.rollback()
-        print(f"Error occurred: {e}")
-        raise HTTPException(status_code=500, detail=f"內部伺服器錯誤：{str(e)}")
 #----------------------------------------
 # 取得 AI 批改結果並進行資料處理
 #----------------------------------------
-@app.get("/ai/get_result/{exam_id}")
+@app.get("/ai/get_result/{exam_id}", dependencies=[Depends(get_teacher_id)])
 async def get_ai_results(
     exam_id: str,
-    request: Request,
     db: Session = Depends(get_db)
 ):
     """
-    獲取指定測驗的所有 AI 批改結果，並按學生分組加總分數。
+    獲取指定測驗的所有 AI 批改結果，並按學生分組。
+    每位學生的總分與已批改頁數由 exam_student_summary 讀取 (批改完成時更新)，不再逐頁加總；
+    結果圖路徑由原圖路徑推得 (與批改時相同的規則)，不再逐筆解析 ai_result.save_path。
     """
     try:
-        # 從請求的 Cookie 中取得 Session Token
-        session_token = request.cookies.get("session_token")
-        if not session_token:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="未驗證")
-
-        # 驗證 Session Token 是否有效
-        session_data = verify_session_token(session_token)
-        if not session_data:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session 過期或無效")
-        
-        teacher_id = session_data.get("user_id")
-        if not teacher_id:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session 資料無效")
-
-        # 查詢所有相關資料
-        sql_query = text("""
+        # 已有批改結果的學生與總分
+        students_query = text("""
             SELECT
-                ar.id AS ai_result_id,
-                ar.score,
-                ar.save_path,
-                ep.student_id,
-                ep.page_number,
+                ss.student_id,
+                ss.total_score,
+                ss.graded_pages,
                 s.name AS student_name,
                 s.student_id AS student_student_id,
                 c.class_name
-            FROM ai_result AS ar
-            JOIN exam_pages AS ep ON ar.exam_page_id = ep.id
-            JOIN students AS s ON ep.student_id = s.id
+            FROM exam_student_summary AS ss
+            JOIN students AS s ON ss.student_id = s.id
             JOIN classes AS c ON s.class_id = c.id
+            WHERE ss.exam_id = :exam_id AND ss.graded_pages > 0
+        """)
+        # 已批改的頁面 (ai_result 只讀取 id，以 exam_page_id 的唯一索引查詢)
+        pages_query = text("""
+            SELECT
+                ar.id AS ai_result_id,
+                ep.id AS exam_page_id,
+                ep.student_id,
+                ep.photo_path
+            FROM exam_pages AS ep
+            JOIN ai_result AS ar ON ar.exam_page_id = ep.id
             WHERE ep.exam_id = :exam_id
             ORDER BY ep.page_number ASC
         """)
 
-        db_results = db.execute(sql_query, {"exam_id": exam_id}).fetchall()
-
-        if not db_results:
+        student_rows = db.execute(students_query, {"exam_id": exam_id}).fetchall()
+        if not student_rows:
             return []
 
         # 將結果整理成字典，以 student_id 為鍵
-        student_results = {}
-        for row in db_results:
-            student_id = str(row.student_id)
-            if student_id not in student_results:
-                student_results[student_id] = {
-                    "id": student_id,
-                    "student_id": row.student_student_id,
-                    "name": row.student_name,
-                    "class_name": row.class_name,
-                    "score": 0,
-                    "result_images": []
-                }
-            
-            # 將分數加總
-            student_results[student_id]["score"] += row.score
-            
-            # 建立圖片資料
-            save_path_list = json.loads(row.save_path) if row.save_path else []
-            student_results[student_id]["result_images"].append({
+        student_results = {
+            str(row.student_id): {
+                "id": str(row.student_id),
+                "student_id": row.student_student_id,
+                "name": row.student_name,
+                "class_name": row.class_name,
+                "score": row.total_score,
+                "graded_pages": row.graded_pages,
+                "result_images": []
+            }
+            for row in student_rows
+        }
+
+        save_dir = exam_save_dir(exam_id)
+        for row in db.execute(pages_query, {"exam_id": exam_id}):
+            student = student_results.get(str(row.student_id))
+            if student is None:
+                continue
+
+            # 建立圖片資料 (縮圖不存在時由 /data 依描述檔產生)
+            student["result_images"].append({
                 "ai_result_id": str(row.ai_result_id),
-                "save_paths": save_path_list
+                "exam_page_id": str(row.exam_page_id),
+                "save_paths": overlay_paths(save_dir, row.photo_path),
+                # 依儲存的偵測結果即時繪製 (可加上 ?view=&max_side=)
+                "overlay_url": f"/ai/overlay/{row.exam_page_id}"
             })
 
         # 將字典轉換回列表
@@ -1032,5 +1377,5 @@ async def get_ai_results(
         raise
     except Exception as e:
         db.rollback()
-        print(f"Error occurred: {e}")
+        log_event(logger, logging.ERROR, "request_failed", exc_info=True, error=str(e))
         raise HTTPException(status_code=500, detail=f"內部伺服器錯誤：{str(e)}")
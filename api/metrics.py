@@ -0,0 +1,148 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple, Union
+
+# 預設的 histogram bucket 上界 (秒)，涵蓋單一階段的毫秒級到整份考卷的數分鐘
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class Histogram:
+    """
+    執行緒安全的 Prometheus 風格 histogram (累積 bucket + sum + count)。
+    labelnames 為 label 名稱，observe() 時以關鍵字參數帶入對應的值。
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # {label 值 tuple: [各 bucket 次數..., +Inf 次數, sum]}
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        """輸出 Prometheus text exposition format"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for key, series in sorted(snapshot.items()):
+            labels = [f'{name}="{value}"' for name, value in zip(self.labelnames, key)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = ",".join(labels + [f'le="{le}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = "{" + ",".join(labels) + "}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {series[-1]}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """在 /metrics 被讀取時才呼叫 fn() 取得目前值的 gauge (例如連線池使用量)"""
+
+    def __init__(self, name: str, documentation: str, fn: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        try:
+            value = float(self.fn())
+        except Exception:
+            value = float("nan")
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Union[Histogram, Gauge]] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        """取得 (或建立) 指定名稱的 histogram，重複呼叫回傳同一個物件"""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, documentation, labelnames, buckets)
+            return self._metrics[name]
+
+    def gauge(self, name: str, documentation: str, fn: Callable[[], float]) -> Gauge:
+        """登記 (或取代) 指定名稱的 gauge"""
+        with self._lock:
+            self._metrics[name] = Gauge(name, documentation, fn)
+            return self._metrics[name]
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# 批改流程的 histogram
+STAGE_SECONDS = REGISTRY.histogram(
+    "grading_stage_seconds", "Per-page time spent in each grading pipeline stage", labelnames=("stage",)
+)
+PAGE_SECONDS = REGISTRY.histogram("grading_page_seconds", "Total vision + grading time per page")
+JOB_SECONDS = REGISTRY.histogram("grading_job_seconds", "Wall time of one grading job (one exam run)")
+OVERLAY_SECONDS = REGISTRY.histogram("overlay_render_seconds", "Time to render one page's overlay images",
+                                     ("size",))
+
+
+class StageTimer:
+    """
+    累計各階段耗時 (秒)。
+
+        timer = StageTimer()
+        with timer.stage("forward"):
+            ...
+        timer.as_dict()  # {"forward": 0.123}
+    """
+
+    def __init__(self):
+        self.totals: Dict[str, float] = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.totals[name] += seconds
+
+    def merge(self, other: "StageTimer") -> None:
+        for name, seconds in other.totals.items():
+            self.add(name, seconds)
+
+    def total(self) -> float:
+        return sum(self.totals.values())
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: round(seconds, 4) for name, seconds in self.totals.items()}
+
+    def observe(self) -> None:
+        """將此計時器 (一頁) 的各階段耗時記錄到 histogram"""
+        for name, seconds in self.totals.items():
+            STAGE_SECONDS.observe(seconds, stage=name)
+        PAGE_SECONDS.observe(self.total())
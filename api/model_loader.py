@@ -1,20 +1,66 @@
 # model_loader.py
-import torch
+import argparse
+import logging
+import os
+import time
 from pathlib import Path
 
-from models.experimental import attempt_load
-from utils.torch_utils import select_device, TracedModel
-from utils.general import check_img_size
+from batcher import MICRO_BATCH_WAIT_MS, MICRO_BATCH_MAX_PAGES
+from detector import TorchDetector, OnnxRuntimeDetector, BatchedDetector
+from logs import log_event
+from model_registry import MODELS
+
+logger = logging.getLogger(__name__)
+
+# YOLO 權重與推論後端：torch / torchscript / onnxruntime (onnxruntime 需先以 model_loader.py 匯出 ONNX)
+YOLO_WEIGHTS = os.getenv("YOLO_WEIGHTS", "weights/yolobest.pt")
+DETECT_BACKEND = os.getenv("DETECT_BACKEND", "torchscript")
+DETECT_ONNX_PATH = os.getenv("DETECT_ONNX_PATH", "weights/yolobest.onnx")
+# torchscript 追蹤結果快取目錄 (多個 worker 共用，避免每次啟動都重新 trace)
+TRACE_CACHE_DIR = os.getenv("TRACE_CACHE_DIR", "weights/traced")
+
+# 支援的推論後端
+BACKENDS = ("torch", "torchscript", "onnxruntime")
+
 
 # 這是你從程式碼中提取出來的初始化邏輯
-def initialize_model(weights_path: str):
+def initialize_model(weights_path: str, backend: str = "torchscript", onnx_path: str = None,
+                     trace_cache_dir: str = "weights/traced"):
     """
     載入並暖機模型，返回模型物件。
+
+    backend:
+    - torch: PyTorch eager 模型
+    - torchscript: 以 TracedModel 追蹤後的模型 (預設，與過去行為相同)
+    - onnxruntime: 以 ONNX Runtime 執行含 NMS 的 ONNX 模型 (onnx_path，見 export_onnx)，不需 import torch
+
+    trace_cache_dir: torchscript 追蹤結果的快取目錄 (依權重雜湊、輸入尺寸、設備與 torch 版本區分)，
+    暖啟動時直接載入，不需重新 trace；設為 None 則每次重新 trace。
     """
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的推論後端: {backend}，可用: {BACKENDS}")
+
+    if backend == "onnxruntime":
+        onnx_path = onnx_path or str(Path(weights_path).with_suffix(".onnx"))
+        detector = OnnxRuntimeDetector(onnx_path)
+        log_event(logger, logging.INFO, "model_loaded", backend=backend, path=onnx_path, imgsz=detector.imgsz)
+        return {
+            "detector": detector,
+            "model": None,
+            "device": "cpu",
+            "half": False,
+            "imgsz": detector.imgsz
+        }
+
+    import torch
+    from models.experimental import attempt_load
+    from utils.torch_utils import select_device, TracedModel
+    from utils.general import check_img_size
+
     device_str = ''
     imgsz = 640
-    trace = True
-    
+    trace = backend == "torchscript"
+
     # 選擇設備
     device = select_device(device_str)
     half = device.type != 'cpu'
@@ -25,22 +71,97 @@ def initialize_model(weights_path: str):
     imgsz = check_img_size(imgsz, s=stride)
 
     if trace:
-        model = TracedModel(model, device, imgsz)
+        model = TracedModel(model, device, imgsz, weights=weights_path, cache_dir=trace_cache_dir)
 
     if half:
         model.half()
 
     # 模型暖機
-    print("Executing model warm-up...")
+    t0 = time.perf_counter()
     if device.type != 'cpu':
         dummy_input = torch.zeros(1, 3, imgsz, imgsz).to(device).type_as(next(model.parameters()))
         with torch.no_grad():
             model(dummy_input)
-    print("Model warm-up complete!")
-    
+    log_event(logger, logging.INFO, "model_loaded", backend=backend, path=weights_path, device=str(device),
+              imgsz=imgsz, warmup_seconds=round(time.perf_counter() - t0, 3))
+
     return {
+        "detector": TorchDetector(model, device, half, imgsz, weights_path, backend=backend),
         "model": model,
         "device": device,
         "half": half,
         "imgsz": imgsz
-    }
\ No newline at end of file
+    }
+
+
+def load_yolo():
+    """
+    載入 YOLO 偵測後端 (由 MODELS 延遲呼叫，API 行程與推論行程共用)。
+    回傳 initialize_model 的結果，並加上視覺辨識快取使用的 model_version。
+    """
+    from detect import build_model_version
+
+    model_data = initialize_model(
+        YOLO_WEIGHTS, backend=DETECT_BACKEND, onnx_path=DETECT_ONNX_PATH, trace_cache_dir=TRACE_CACHE_DIR
+    )
+    # model 在 onnxruntime 後端時為 None (/test_demo 無法使用)
+    model_data["model_version"] = build_model_version(model_data["detector"])
+    if MICRO_BATCH_WAIT_MS > 0:
+        # 同時進行的批改工作共用 forward，見 batcher.MicroBatcher
+        model_data["detector"] = BatchedDetector(
+            model_data["detector"], max_items=MICRO_BATCH_MAX_PAGES, max_wait_ms=MICRO_BATCH_WAIT_MS
+        )
+    return model_data
+
+
+MODELS.register("yolo", load_yolo)
+
+
+def export_onnx(weights_path: str, output_path: str = None, imgsz: int = 640, max_det: int = 300,
+                conf_thres: float = 0.25, iou_thres: float = 0.45, opset: int = 12):
+    """
+    將 YOLO 權重匯出為含 NMS 的 ONNX 模型 (End2End + ONNX_ORT)，供 onnxruntime 後端使用。
+    閾值與 detect_images_v2 相同，batch 維度為動態，類別名稱與 stride 寫入 metadata。
+    """
+    import onnx
+    import torch
+    from models.experimental import attempt_load, End2End
+    from utils.general import check_img_size
+
+    output_path = output_path or str(Path(weights_path).with_suffix(".onnx"))
+    model = attempt_load(weights_path, map_location=torch.device("cpu"))
+    stride = int(model.stride.max())
+    imgsz = check_img_size(imgsz, s=stride)
+    names = model.module.names if hasattr(model, 'module') else model.names
+
+    model.model[-1].export = False
+    model = End2End(model, max_obj=max_det, iou_thres=iou_thres, score_thres=conf_thres,
+                    max_wh=imgsz, device=torch.device("cpu"), n_classes=len(names))
+    model.eval()
+
+    dummy_input = torch.zeros(1, 3, imgsz, imgsz)
+    torch.onnx.export(
+        model, dummy_input, output_path,
+        opset_version=opset,
+        input_names=["images"],
+        output_names=["output"],
+        dynamic_axes={"images": {0: "batch"}, "output": {0: "num_dets"}}
+    )
+
+    onnx_model = onnx.load(output_path)
+    for key, value in {"names": ",".join(names), "stride": str(stride)}.items():
+        meta = onnx_model.metadata_props.add()
+        meta.key, meta.value = key, value
+    onnx.save(onnx_model, output_path)
+    log_event(logger, logging.INFO, "onnx_exported", path=output_path)
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="匯出含 NMS 的 ONNX 模型 (onnxruntime 後端)")
+    parser.add_argument("--weights", type=str, default="weights/yolobest.pt")
+    parser.add_argument("--output", type=str, default=None)
+    parser.add_argument("--img-size", type=int, default=640)
+    parser.add_argument("--max-det", type=int, default=300)
+    opt = parser.parse_args()
+    export_onnx(opt.weights, opt.output, imgsz=opt.img_size, max_det=opt.max_det)
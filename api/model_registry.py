@@ -0,0 +1,96 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from logs import log_event
+
+logger = logging.getLogger(__name__)
+
+# 模型狀態
+MODEL_COLD = "cold"
+MODEL_LOADING = "loading"
+MODEL_WARM = "warm"
+MODEL_FAILED = "failed"
+
+
+class ModelRegistry:
+    """
+    延遲載入的模型登錄表。
+
+    - register(name, loader) 只記錄載入函式，不會 import TensorFlow / Torch。
+    - get(name) 第一次呼叫時才執行 loader (同一模型只會載入一次，其他 thread 會等待)。
+    - start_warm_up() 在背景 thread 依序載入所有模型，API 不必等模型就緒即可開始服務。
+    """
+
+    def __init__(self):
+        self._loaders: Dict[str, Callable] = {}
+        self._models: Dict[str, object] = {}
+        self._status: Dict[str, str] = {}
+        self._errors: Dict[str, str] = {}
+        self._load_seconds: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable) -> None:
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks.setdefault(name, threading.Lock())
+            self._status.setdefault(name, MODEL_COLD)
+
+    def get(self, name: str):
+        """取得模型，尚未載入時在目前的 thread 載入 (失敗時拋出例外，下次呼叫會重試)"""
+        if name in self._models:
+            return self._models[name]
+        if name not in self._loaders:
+            raise KeyError(f"未註冊的模型: {name}")
+
+        with self._locks[name]:
+            if name in self._models:
+                return self._models[name]
+            self._status[name] = MODEL_LOADING
+            t0 = time.perf_counter()
+            try:
+                model = self._loaders[name]()
+            except Exception as e:
+                self._status[name] = MODEL_FAILED
+                self._errors[name] = str(e)
+                log_event(logger, logging.ERROR, "model_load_failed", exc_info=True, model=name, error=str(e))
+                raise
+            self._load_seconds[name] = round(time.perf_counter() - t0, 3)
+            self._models[name] = model
+            self._status[name] = MODEL_WARM
+            self._errors.pop(name, None)
+            log_event(logger, logging.INFO, "model_warm", model=name, seconds=self._load_seconds[name])
+            return model
+
+    def is_ready(self, names: Optional[List[str]] = None) -> bool:
+        return all(self._status.get(name) == MODEL_WARM for name in (names or list(self._loaders)))
+
+    def status(self) -> Dict[str, Dict]:
+        """{name: {"status", "load_seconds", "error"}}，供 readiness endpoint 使用"""
+        return {
+            name: {
+                "status": self._status[name],
+                "load_seconds": self._load_seconds.get(name),
+                "error": self._errors.get(name),
+            }
+            for name in self._loaders
+        }
+
+    def warm_up(self, names: Optional[List[str]] = None) -> None:
+        """依序載入模型，單一模型失敗不影響其他模型 (錯誤記錄在 status)"""
+        for name in names or list(self._loaders):
+            try:
+                self.get(name)
+            except Exception:
+                pass
+
+    def start_warm_up(self, names: Optional[List[str]] = None) -> threading.Thread:
+        thread = threading.Thread(target=self.warm_up, args=(names,), name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+
+# 整個行程共用的模型登錄表
+MODELS = ModelRegistry()
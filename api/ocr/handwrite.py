@@ -1,69 +1,155 @@
-from tensorflow.keras.models import load_model
 import numpy as np
-import os 
+import logging
+import os
+import threading
 import cv2
 
+from batcher import MicroBatcher, MICRO_BATCH_WAIT_MS, MICRO_BATCH_MAX_CROPS
+from logs import log_event
+from model_registry import MODELS
+
+logger = logging.getLogger(__name__)
+
 
 HANDWRITE_MAP = ["A","B","C","D","E","F","O","X"]
 
-handwrite_model = load_model("weights/ocr_best.keras")
-handwrite_model.summary()
-input_shape = handwrite_model.input_shape  # 例如 (None, 32, 32, 1)
-print("模型輸入形狀:", input_shape)
+HANDWRITE_WEIGHTS = "weights/ocr_best.keras"
+
+
+def _load_handwrite_model():
+    # TensorFlow 在第一次使用 (或背景暖機) 時才 import，API 啟動不需等待
+    from tensorflow.keras.models import load_model
+
+    handwrite_model = load_model(HANDWRITE_WEIGHTS)
+    handwrite_model.summary(print_fn=lambda line, **kwargs: logger.debug(line))
+    input_shape = handwrite_model.input_shape  # 例如 (None, 32, 32, 1)
+    log_event(logger, logging.INFO, "model_loaded", backend="keras", path=HANDWRITE_WEIGHTS, input_shape=input_shape)
+    return handwrite_model
+
+
+MODELS.register("handwrite", _load_handwrite_model)
 
 confidence_threshold = 0.85
 
-def detect_handwrite(img, bbox):
-    """
-    從圖片 bbox 區域裁切影像，並使用模型進行預測。
-    - bbox: (x1, y1, x2, y2) 表示 BBox 範圍
-    - img: 原始輸入圖像 (BGR)
-    - model: 已加載的 Keras 模型
-    - confidence_threshold: 設定信心分數閾值，低於該值則回傳 UNKNOWN
-    """
-    x1, y1, x2, y2 = map(int, bbox)  # 取得 BBox 座標
-    roi = img[y1:y2, x1:x2]  # 裁切該區域
+# 單次送進模型的最大張數，避免整份考卷的 crop 一次佔用過多記憶體
+MAX_BATCH_SIZE = 256
 
-    # **確保 ROI 不為空**
-    if roi.size == 0:
-        return "EMPTY", 0.0
+# 是否將前處理後的 crop 存到 runs/output 以便除錯 (預設關閉)
+DEBUG_SAVE = os.getenv("HANDWRITE_DEBUG_SAVE", "0") == "1"
+DEBUG_DIR = "runs/output"
 
-    os.makedirs("runs/output", exist_ok=True)
+# 多個批改工作同時辨識時共用的 micro-batcher (第一次使用時建立)
+_batcher = None
+_batcher_lock = threading.Lock()
 
+
+def preprocess_crop(roi):
+    """
+    將裁切出的 ROI 轉為模型輸入：灰階、縮放到模型尺寸、標準化到 0~1。
+    回傳 shape 為 (H, W) 的 float32 陣列。
+    """
     # **轉換為灰階**
     gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY) if len(roi.shape) == 3 else roi
 
     # **獲取模型預期的輸入尺寸**
-    target_size = handwrite_model.input_shape[1:3]  # 例如 (64, 64)
-    
+    target_size = MODELS.get("handwrite").input_shape[1:3]  # 例如 (64, 64)
+
     # **調整大小**
     resized = cv2.resize(gray, target_size, interpolation=cv2.INTER_LINEAR)
 
-    # **標準化 (0~1) 並轉換形狀**
-    normalized = resized.astype("float32") / 255.0
-    input_data = np.expand_dims(normalized, axis=(0, -1))  # 增加 batch 軸 & channel 軸
+    # **標準化 (0~1)**
+    return resized.astype("float32") / 255.0
+
+
+def classify_handwrite_crops(crops, save_debug=None, debug_names=None):
+    """
+    批次辨識多個手寫作答區塊，所有 crop 只需一次 (或數次，依 MAX_BATCH_SIZE) 模型呼叫。
+    - crops: 已裁切的影像列表 (BGR 或灰階)，可來自同一頁或整份考卷
+    - save_debug: 是否儲存前處理後的影像，None 表示依 HANDWRITE_DEBUG_SAVE 設定
+    - debug_names: 儲存除錯影像時使用的檔名 (可選，需與 crops 等長)
+    回傳與 crops 順序相同的 [(label, confidence), ...]：
+    - 空的 crop 回傳 ("EMPTY", 0.0)
+    - 信心分數低於閾值或類別超出範圍回傳 ("UNKNOWN", confidence)
+    """
+    if save_debug is None:
+        save_debug = DEBUG_SAVE
+
+    results = [("EMPTY", 0.0)] * len(crops)
+    valid = [i for i, roi in enumerate(crops) if roi is not None and roi.size > 0]
+    if not valid:
+        return results
+
+    inputs = np.stack([preprocess_crop(crops[i]) for i in valid])[..., np.newaxis]  # (N, H, W, 1)
 
     # **儲存處理後的影像**
-    save_path = os.path.join("runs/output", f"bbox_{x1}_{y1}_{x2}_{y2}.png")
-    cv2.imwrite(save_path, (normalized * 255).astype("uint8"))  # 轉回 0~255 並存檔
-    print(f"Saved cropped image: {save_path}")
+    if save_debug:
+        os.makedirs(DEBUG_DIR, exist_ok=True)
+        for n, i in enumerate(valid):
+            name = debug_names[i] if debug_names else f"crop_{i}"
+            cv2.imwrite(os.path.join(DEBUG_DIR, f"{name}.png"), (inputs[n, ..., 0] * 255).astype("uint8"))
 
     # **執行模型預測**
-    prediction = handwrite_model.predict(input_data)  # 輸出 shape: (1, num_classes)
-    prediction = prediction[0]  # 取出 batch 維度，變成 (num_classes,)
+    predictions = _predict(inputs)  # (N, num_classes)
 
     # **取得最大機率的類別索引與信心值**
-    predicted_class = np.argmax(prediction)  # 取得最可能的類別索引
-    confidence_score = float(np.max(prediction))  # 取得對應的機率（信心分數）
+    predicted_classes = np.argmax(predictions, axis=1)
+    confidence_scores = np.max(predictions, axis=1)
+
+    for n, i in enumerate(valid):
+        predicted_class = int(predicted_classes[n])
+        confidence_score = float(confidence_scores[n])
+
+        # **確保索引不超過類別數量，且信心分數高於設定閾值**
+        if predicted_class >= len(HANDWRITE_MAP) or confidence_score < confidence_threshold:
+            results[i] = ("UNKNOWN", confidence_score)
+        else:
+            results[i] = (HANDWRITE_MAP[predicted_class], confidence_score)
+
+    return results
+
+
+def _predict_on_batch(inputs, timer=None):
+    """predict_on_batch 不經過 predict() 的 callback / data adapter，適合小批次；依 MAX_BATCH_SIZE 分段"""
+    handwrite_model = MODELS.get("handwrite")
+    inputs = np.asarray(inputs)
+    return np.concatenate([
+        np.asarray(handwrite_model.predict_on_batch(inputs[s:s + MAX_BATCH_SIZE]))
+        for s in range(0, len(inputs), MAX_BATCH_SIZE)
+    ])
+
+
+def _predict(inputs):
+    """開啟 micro-batching 時，與其他同時進行的工作的 crop 合併成一次模型呼叫"""
+    global _batcher
+    if MICRO_BATCH_WAIT_MS <= 0:
+        return _predict_on_batch(inputs)
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = MicroBatcher(_predict_on_batch, MICRO_BATCH_MAX_CROPS, MICRO_BATCH_WAIT_MS, name="handwrite")
+    return np.stack(_batcher.run(list(inputs)))
 
-    # **確保索引不超過類別數量**
-    if predicted_class >= len(HANDWRITE_MAP):
-        return "UNKNOWN", confidence_score
-    
-    predicted_label = HANDWRITE_MAP[predicted_class]  # 取得對應類別名稱
 
-    # **如果信心分數低於設定閾值，則回傳 UNKNOWN**
-    if confidence_score < confidence_threshold:
-        return "UNKNOWN", confidence_score
+def detect_handwrite_batch(img, bboxes, save_debug=None):
+    """
+    從同一張圖片裁切多個 bbox 區域，並以單次模型呼叫進行預測。
+    - img: 原始輸入圖像 (BGR)
+    - bboxes: [(x1, y1, x2, y2), ...]
+    回傳與 bboxes 順序相同的 [(label, confidence), ...]
+    """
+    crops = []
+    names = []
+    for bbox in bboxes:
+        x1, y1, x2, y2 = map(int, bbox)  # 取得 BBox 座標
+        crops.append(img[y1:y2, x1:x2])  # 裁切該區域
+        names.append(f"bbox_{x1}_{y1}_{x2}_{y2}")
+    return classify_handwrite_crops(crops, save_debug=save_debug, debug_names=names)
 
-    return predicted_label, confidence_score  # 回傳類別名稱 + 信心分數
+
+def detect_handwrite(img, bbox):
+    """
+    從圖片 bbox 區域裁切影像，並使用模型進行預測。
+    - bbox: (x1, y1, x2, y2) 表示 BBox 範圍
+    - img: 原始輸入圖像 (BGR)
+    多個 bbox 請改用 detect_handwrite_batch，以避免每個框都呼叫一次模型。
+    """
+    return detect_handwrite_batch(img, [bbox])[0]  # 回傳類別名稱 + 信心分數
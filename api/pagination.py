@@ -0,0 +1,139 @@
+# pagination.py
+"""
+列表 API 共用的 keyset (cursor) 分頁與欄位選擇。
+
+    @app.get("/get_exams/{class_id}", response_class=JSONResponse, responses=list_responses(Exam))
+    async def get_exams_by_class(class_id: str, page: ListParams = Depends(list_params), ...):
+        columns = page.select(EXAM_FIELDS, keys=("created_at", "id"))
+        after = page.after(("created_at", "id"))  # 第一頁為 None
+        rows = db.execute(text(f"SELECT ... ORDER BY created_at DESC, id DESC{page.limit_sql}"), ...)
+        return page.response([row._asdict() for row in rows], keys=("created_at", "id"))
+
+- ?limit=50：每頁筆數，回應標頭 X-Next-Cursor 為下一頁的 cursor (最後一頁沒有此標頭)
+- ?cursor=...：接續上一頁；以排序欄位比較 (WHERE key > 上一頁最後一筆)，不使用 OFFSET，
+  越後面的頁面也只讀取一頁的資料
+- ?fields=id,exam_name：只回傳指定欄位 (例如列表頁不需要 correct_answer)
+- 未指定 limit 時使用 LIST_DEFAULT_LIMIT (預設 0 = 不分頁，與既有前端相容)
+"""
+import base64
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Iterable, List, Optional, Sequence
+
+from fastapi import HTTPException, Query, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+LIST_DEFAULT_LIMIT = int(os.getenv("LIST_DEFAULT_LIMIT", "0"))
+LIST_MAX_LIMIT = int(os.getenv("LIST_MAX_LIMIT", "500"))
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# cursor 中的 datetime 以此前綴標記，解碼時還原
+_DATETIME_PREFIX = "dt:"
+
+
+def encode_cursor(values: Sequence) -> str:
+    """排序欄位的值 -> 不透明的 URL-safe 字串"""
+    payload = [_DATETIME_PREFIX + v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """encode_cursor 的反向操作，格式錯誤時回應 400"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError(cursor)
+        return [
+            datetime.fromisoformat(v[len(_DATETIME_PREFIX):])
+            if isinstance(v, str) and v.startswith(_DATETIME_PREFIX) else v
+            for v in values
+        ]
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="無效的 cursor")
+
+
+@dataclass
+class ListParams:
+    limit: int  # 0 = 不分頁
+    cursor: Optional[str]
+    fields: Optional[List[str]]
+    output: Optional[List[str]] = None  # select() 決定的輸出欄位
+
+    @property
+    def limit_sql(self) -> str:
+        """SQL 的 LIMIT 子句：多讀一筆以判斷是否還有下一頁，不分頁時為空字串"""
+        return f" LIMIT {self.limit + 1}" if self.limit else ""
+
+    def after(self, keys: Sequence[str]) -> Optional[dict]:
+        """上一頁最後一筆的排序欄位值 ({"after_<key>": value})，第一頁為 None"""
+        if not self.cursor:
+            return None
+        return {f"after_{key}": value for key, value in zip(keys, decode_cursor(self.cursor, len(keys)))}
+
+    def select(self, allowed: Iterable[str], keys: Sequence[str] = ()) -> List[str]:
+        """要從資料庫讀取的欄位：指定的欄位 (預設全部) 加上排序欄位；有不支援的欄位時回應 400"""
+        allowed = list(allowed)
+        if self.fields is None:
+            selected = allowed
+        else:
+            unknown = [field for field in self.fields if field not in allowed]
+            if unknown:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"不支援的欄位: {', '.join(unknown)} (可用: {', '.join(allowed)})"
+                )
+            selected = [field for field in allowed if field in self.fields]
+        self.output = selected
+        return selected + [key for key in keys if key not in selected]
+
+    def response(self, items: List[dict], keys: Sequence[str] = ()) -> JSONResponse:
+        """
+        截掉多讀的一筆並設定下一頁 cursor，只輸出 select() 決定的欄位 (不含額外讀取的排序欄位)。
+        直接回傳 JSONResponse (不再經過 response_model 驗證)，只序列化需要的欄位。
+        """
+        headers = {}
+        if self.limit and len(items) > self.limit:
+            items = items[:self.limit]
+            headers[NEXT_CURSOR_HEADER] = encode_cursor([items[-1][key] for key in keys])
+        if self.output is not None:
+            items = [{field: item[field] for field in self.output} for item in items]
+        return JSONResponse(content=jsonable_encoder(items), headers=headers)
+
+
+def list_params(
+    limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_LIMIT, description="每頁筆數 (省略 = LIST_DEFAULT_LIMIT)"),
+    cursor: Optional[str] = Query(None, description="上一頁回應標頭 X-Next-Cursor 的值"),
+    fields: Optional[str] = Query(None, description="只回傳的欄位，以逗號分隔"),
+) -> ListParams:
+    """Dependency：列表 API 的分頁與欄位選擇參數"""
+    if limit is None:
+        limit = min(LIST_DEFAULT_LIMIT, LIST_MAX_LIMIT) if LIST_DEFAULT_LIMIT > 0 else 0
+    if cursor and not limit:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="使用 cursor 時需指定 limit")
+    field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    return ListParams(limit=limit, cursor=cursor, fields=field_list)
+
+
+def list_responses(model: Any) -> dict:
+    """
+    列表 API 的 OpenAPI 回應說明 (搭配 response_class=JSONResponse)。
+    ListParams.response() 不經過 response_model 驗證；指定 fields 時每筆只包含指定的欄位。
+    """
+    return {
+        200: {
+            "model": List[model],
+            "description": f"{getattr(model, '__name__', model)} 列表；指定 fields 時每筆只包含指定的欄位",
+            "headers": {
+                NEXT_CURSOR_HEADER: {
+                    "description": "下一頁的 cursor (最後一頁沒有此標頭)",
+                    "schema": {"type": "string"},
+                },
+            },
+        },
+    }
@@ -0,0 +1,106 @@
+# photo_store.py
+"""
+學生上傳照片的快取與 HTTP 快取設定。
+
+- 照片上傳後不會再修改，以內容雜湊 (photo_hash) 作為版本：
+  /photo/{id}/{photo_hash} 為不可變的網址 (Cache-Control: immutable，瀏覽器不再回來要)，
+  /photo/{id} 每次回來驗證，ETag 相同時回應 304 (不讀檔)。
+- PhotoIndex：exam_pages.id -> (photo_path, photo_hash) 的記憶體 LRU，重複瀏覽不查資料庫。
+- 檔案本體以 FileResponse 回傳 (支援 Range；ASGI 伺服器支援 pathsend 時由伺服器直接送檔)。
+  設定 PHOTO_ACCEL_REDIRECT (例如 /_upload/) 時改回應 X-Accel-Redirect，由前端的 nginx 以 sendfile 送出。
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+# 記憶體中保留的照片筆數上限
+PHOTO_INDEX_SIZE = int(os.getenv("PHOTO_INDEX_SIZE", "100000"))
+# 不可變網址的快取時間 (秒)
+PHOTO_CACHE_MAX_AGE = int(os.getenv("PHOTO_CACHE_MAX_AGE", str(365 * 24 * 3600)))
+# nginx internal location 的前綴，對應到 UPLOAD_FOLDER；空字串表示由本服務直接送檔
+PHOTO_ACCEL_REDIRECT = os.getenv("PHOTO_ACCEL_REDIRECT", "")
+
+# photo_hash 保留的 sha256 hex 長度
+DIGEST_CHARS = 16
+HASH_CHUNK_SIZE = 1024 * 1024
+
+IMMUTABLE_CACHE_CONTROL = f"private, max-age={PHOTO_CACHE_MAX_AGE}, immutable"
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+class PhotoEntry(NamedTuple):
+    path: str
+    digest: str
+
+
+def new_hasher():
+    """上傳時邊寫入邊計算雜湊，完成後以 digest_of() 取得 photo_hash"""
+    return hashlib.sha256()
+
+
+def digest_of(hasher) -> str:
+    return hasher.hexdigest()[:DIGEST_CHARS]
+
+
+def file_digest(path: str) -> str:
+    """計算既有檔案的 photo_hash (舊資料沒有 photo_hash 時使用)"""
+    hasher = new_hasher()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            hasher.update(chunk)
+    return digest_of(hasher)
+
+
+def photo_url(photo_id: str, digest: Optional[str]) -> str:
+    """照片的網址：有 photo_hash 時為不可變網址"""
+    return f"/photo/{photo_id}/{digest}" if digest else f"/photo/{photo_id}"
+
+
+def etag(digest: str) -> str:
+    return f'"{digest}"'
+
+
+def is_not_modified(if_none_match: Optional[str], digest: str) -> bool:
+    """If-None-Match 是否包含此版本 (支援多個值、W/ 前綴與 *)"""
+    if not if_none_match:
+        return False
+    for value in if_none_match.split(","):
+        value = value.strip()
+        if value == "*" or value.removeprefix("W/") == etag(digest):
+            return True
+    return False
+
+
+class PhotoIndex:
+    """exam_pages.id -> PhotoEntry 的 thread-safe LRU (照片不會修改，不需要過期時間)"""
+
+    def __init__(self, max_items: int = PHOTO_INDEX_SIZE):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, photo_id: str) -> Optional[PhotoEntry]:
+        with self._lock:
+            entry = self._items.get(photo_id)
+            if entry is not None:
+                self._items.move_to_end(photo_id)
+            return entry
+
+    def put(self, photo_id: str, path: str, digest: str):
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._items[photo_id] = PhotoEntry(path, digest)
+            self._items.move_to_end(photo_id)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def discard(self, photo_id: str):
+        """移除一筆 (檔案已不存在時)"""
+        with self._lock:
+            self._items.pop(photo_id, None)
+
+    def __len__(self):
+        return len(self._items)
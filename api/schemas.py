@@ -80,4 +80,5 @@ class StudentWithPhotos(BaseModel):
     name: str  # students table name
     class_name: str  # students table class
     photos: List[str]  # photo_id list from exam_pages table
+    photo_urls: List[str] = []  # /photo/{id}/{photo_hash}，與 photos 順序相同
     
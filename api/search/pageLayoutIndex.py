@@ -0,0 +1,107 @@
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree  # KD-tree (可選)，未安裝時以向量化的距離矩陣查詢
+except ImportError:
+    cKDTree = None
+
+# 查詢時使用的 bbox 參考點
+ANCHOR_TOP_LEFT = "top_left"
+ANCHOR_CENTER = "center"
+
+
+class PageLayoutIndex:
+    """
+    一頁偵測結果的空間索引，每頁只建立一次，供題號 / 作答與 item 的配對共用。
+
+    - 依 class 分組，每個 (class, 參考點) 第一次查詢時才建立 KD-tree 並快取
+    - nearest(): 每個查詢點最近的物件；within(): 半徑內的所有物件
+    - 回傳的索引皆為 data_list 中的原始索引
+    """
+
+    def __init__(self, data_list):
+        """
+        :param data_list: 物件偵測的結果 [(x1, y1, x2, y2, conf, cls), ...]
+        """
+        self.data = np.array(data_list, dtype=np.float32).reshape(-1, 6)
+        self.cls = self.data[:, 5].astype(np.int64)
+        self._indices = {}
+        self._points = {}
+        self._trees = {}
+
+    def indices(self, cls):
+        """此類別物件在 data_list 中的索引"""
+        if cls not in self._indices:
+            self._indices[cls] = np.flatnonzero(self.cls == cls)
+        return self._indices[cls]
+
+    def points(self, cls, anchor=ANCHOR_CENTER):
+        """此類別物件的參考點座標 shape=(n, 2)"""
+        key = (cls, anchor)
+        if key not in self._points:
+            boxes = self.data[self.indices(cls), :4]
+            if anchor == ANCHOR_TOP_LEFT:
+                self._points[key] = boxes[:, :2]
+            else:
+                self._points[key] = (boxes[:, :2] + boxes[:, 2:4]) / 2
+        return self._points[key]
+
+    def _tree(self, cls, anchor):
+        key = (cls, anchor)
+        if key not in self._trees:
+            self._trees[key] = cKDTree(self.points(cls, anchor))
+        return self._trees[key]
+
+    def distance_matrix(self, query_points, cls, anchor=ANCHOR_CENTER):
+        """查詢點到此類別所有物件的距離矩陣 shape=(len(query_points), n)"""
+        diff = np.asarray(query_points, dtype=np.float32)[:, None, :] - self.points(cls, anchor)[None, :, :]
+        return np.sqrt((diff ** 2).sum(axis=2))
+
+    def nearest(self, query_points, cls, anchor=ANCHOR_CENTER, max_distance=None):
+        """
+        每個查詢點最近的此類別物件
+        :return: (索引, 距離)，找不到 (沒有物件或超過 max_distance) 時索引為 -1、距離為 inf
+        """
+        query_points = np.asarray(query_points, dtype=np.float32).reshape(-1, 2)
+        candidates = self.indices(cls)
+        found = np.full(len(query_points), -1, dtype=np.int64)
+        dist = np.full(len(query_points), np.inf, dtype=np.float32)
+        if not len(query_points) or not len(candidates):
+            return found, dist
+
+        if cKDTree is not None:
+            # KD-tree 只用來縮小候選範圍：距離以 float64 計算，同距離時選到的物件也不固定，
+            # 因此在最近距離附近的候選中，以與 distance_matrix 相同的 float32 距離重新挑選，
+            # 同距離時取 data_list 中較前面的物件 (與 argmin 相同)
+            bound = np.inf if max_distance is None else max_distance * (1 + 1e-6)
+            tree = self._tree(cls, anchor)
+            points = self.points(cls, anchor)
+            nearest = np.zeros(len(query_points), dtype=np.int64)
+            tree_dist, _ = tree.query(query_points, distance_upper_bound=bound)
+            for i in np.flatnonzero(np.isfinite(tree_dist)):
+                near = np.sort(tree.query_ball_point(query_points[i], tree_dist[i] * (1 + 1e-6) + 1e-6))
+                diff = query_points[i][None, :] - points[near]
+                near_dist = np.sqrt((diff ** 2).sum(axis=1))
+                best = near_dist.argmin()
+                nearest[i], dist[i] = near[best], near_dist[best]
+        else:
+            matrix = self.distance_matrix(query_points, cls, anchor)
+            nearest = matrix.argmin(axis=1)
+            dist = matrix[np.arange(len(query_points)), nearest]
+
+        hit = np.isfinite(dist) if max_distance is None else dist <= max_distance
+        found[hit] = candidates[nearest[hit]]
+        dist = np.where(hit, dist, np.inf)
+        return found, dist
+
+    def within(self, point, cls, radius, anchor=ANCHOR_CENTER):
+        """半徑 radius 內的此類別物件索引 (依距離由近到遠)"""
+        candidates = self.indices(cls)
+        if not len(candidates):
+            return []
+        if cKDTree is not None:
+            hits = self._tree(cls, anchor).query_ball_point(point, radius)
+        else:
+            hits = np.flatnonzero(self.distance_matrix([point], cls, anchor)[0] <= radius)
+        dist = np.linalg.norm(self.points(cls, anchor)[hits] - np.asarray(point, dtype=np.float32), axis=1)
+        return [int(candidates[h]) for h in np.asarray(hits)[np.argsort(dist, kind="stable")]]
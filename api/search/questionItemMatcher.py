@@ -1,50 +1,73 @@
-import torch
+import numpy as np
+
+from search.pageLayoutIndex import PageLayoutIndex, ANCHOR_TOP_LEFT, ANCHOR_CENTER
+
+try:
+    from scipy.optimize import linear_sum_assignment  # Hungarian 演算法 (可選)
+except ImportError:
+    linear_sum_assignment = None
+
+# 配對模式
+MATCH_NEAREST = "nearest"      # 每個 Question 取最近的 Item (不同 Question 可能配到同一個 Item)
+MATCH_HUNGARIAN = "hungarian"  # 全域最佳的一對一配對 (總距離最小)
+
 
 class QuestionItemMatcher:
-    def __init__(self, data_list, question_class, item_class, max_distance=None):
+    def __init__(self, data_list, question_class, item_class, max_distance=None, mode=MATCH_NEAREST, index=None):
         """
         初始化
-        :param data_list: 物件偵測的結果 (完整 bbox)
+        :param data_list: 物件偵測的結果 (完整 bbox)，已提供 index 時可為 None
         :param question_class: Question 的 class 值
         :param item_class: Item 的 class 值
         :param max_distance: 最大匹配距離 (可選)
+        :param mode: 配對模式，MATCH_NEAREST (預設) 或 MATCH_HUNGARIAN (需要 scipy)
+        :param index: 同一頁共用的 PageLayoutIndex (可選)，多個 matcher 不必重複建立索引
         """
-        self.data = torch.tensor(data_list, dtype=torch.float32)  # 轉換為 Tensor
+        self.index = index if index is not None else PageLayoutIndex(data_list)
         self.question_class = question_class
         self.item_class = item_class
         self.max_distance = max_distance  # None = 不限制距離
+        self.mode = mode
+
+    def distance_matrix(self):
+        """
+        計算所有 Question → Item 的距離矩陣 (一次向量化運算)
+        :return: (question 索引, item 索引, 距離矩陣 shape=(Q, I))
+        """
+        q_idx = self.index.indices(self.question_class)
+        i_idx = self.index.indices(self.item_class)
+        # Question 使用左上角 (x1, y1)，Item 使用中心點，歐式距離
+        q_points = self.index.points(self.question_class, ANCHOR_TOP_LEFT)
+        return q_idx, i_idx, self.index.distance_matrix(q_points, self.item_class, ANCHOR_CENTER)
 
     def match(self):
         """
-        找出最近的 Question → Item 配對
-        :return: {question_idx: item_idx} 的對應關係
+        找出 Question → Item 配對
+        :return: {question_idx: [item_idx]} 的對應關係
         """
-        questions = []
-        items = []
-
-        # 分類 Question 和 Item
-        for idx, (x1, y1, x2, y2, conf, cls) in enumerate(self.data):
-            if int(cls) == self.question_class:
-                questions.append((idx, x1, y1, x2, y2))  # 使用左上角 (x1, y1)
-            elif int(cls) == self.item_class:
-                cx, cy = (x1 + x2) / 2, (y1 + y2) / 2  # Item 使用中心點
-                items.append((idx, cx, cy))
-
-        # 建立最近匹配
-        matched_pairs = {}
-        for q_idx, q_x1, q_y1, _, _ in questions:
-            min_dist = float("inf")
-            best_match = None
-
-            for i_idx, i_cx, i_cy in items:
-                dist = ((q_x1 - i_cx) ** 2 + (q_y1 - i_cy) ** 2) ** 0.5  # 計算歐式距離
-                
-                if self.max_distance is None or dist <= self.max_distance:
-                    if dist < min_dist:
-                        min_dist = dist
-                        best_match = i_idx  # 只保留最近的一個 Item
-
-            if best_match is not None:
-                matched_pairs[q_idx] = [best_match]  # 一對一關係
-
-        return matched_pairs
+        if self.mode == MATCH_HUNGARIAN:
+            q_idx, i_idx, dist = self.distance_matrix()
+            if not len(q_idx) or not len(i_idx):
+                return {}
+            return self._match_hungarian(q_idx, i_idx, dist)
+
+        # 每個 Question 只保留最近的一個 Item (由空間索引查詢)
+        q_idx = self.index.indices(self.question_class)
+        q_points = self.index.points(self.question_class, ANCHOR_TOP_LEFT)
+        best, _ = self.index.nearest(q_points, self.item_class, ANCHOR_CENTER, max_distance=self.max_distance)
+        return {int(q): [int(i)] for q, i in zip(q_idx, best) if i >= 0}
+
+    def _match_hungarian(self, q_idx, i_idx, dist):
+        if linear_sum_assignment is None:
+            raise RuntimeError("scipy 未安裝，無法使用 hungarian 配對模式。")
+
+        cost = dist
+        if self.max_distance is not None:
+            # 超過距離上限的組合給予極大成本，配對後再排除
+            cost = np.where(dist <= self.max_distance, dist, dist.max() * len(dist) + 1e6)
+        rows, cols = linear_sum_assignment(cost)
+        return {
+            int(q_idx[q]): [int(i_idx[i])]
+            for q, i in zip(rows, cols)
+            if self.max_distance is None or dist[q, i] <= self.max_distance
+        }
@@ -1,10 +1,19 @@
+import asyncio
+import calendar
+import os
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 from itsdangerous import URLSafeTimedSerializer
-from typing import Optional
+from typing import Optional, Tuple
 from datetime import datetime, timedelta
 
+# bcrypt 的 cost factor (2^rounds 次運算，每 +1 耗時加倍)，只影響新產生的雜湊
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# 同時進行密碼雜湊 / 驗證的 thread 數 (bcrypt 執行時會釋放 GIL，預設為 CPU 核心數)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+
 # 設定密碼加密演算法
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=BCRYPT_ROUNDS)
 
 # 密碼雜湊與驗證
 def get_password_hash(password: str) -> str:
@@ -15,10 +24,46 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """驗證明文密碼是否與雜湊密碼相符"""
     return pwd_context.verify(plain_password, hashed_password)
 
+
+class PasswordHasher:
+    """
+    在固定大小的 thread pool 執行 bcrypt，不佔用 event loop 與 FastAPI 的 threadpool。
+    大量登入同時湧入時最多 workers 個同時運算，其餘在 pool 的佇列中等待。
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, context: CryptContext = pwd_context):
+        self.workers = max(1, workers)
+        self.context = context
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.context.hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self.context.verify, plain_password, hashed_password
+        )
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+password_hasher = PasswordHasher()
+
+async def get_password_hash_async(password: str) -> str:
+    """同 get_password_hash，在 password_hasher 的 thread pool 執行"""
+    return await password_hasher.hash(password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """同 verify_password，在 password_hasher 的 thread pool 執行"""
+    return await password_hasher.verify(plain_password, hashed_password)
+
 # Session 相關設定
 # 請務必更改此 SECRET_KEY，它用於簽名，確保 Session 資料安全
 SECRET_KEY = "rex&happy_alisa"
 serializer = URLSafeTimedSerializer(SECRET_KEY)
+# Session Token 的最長有效期限（秒）
+SESSION_MAX_AGE = 3600
 
 # 創建 Session Token
 def create_session_token(data: dict) -> str:
@@ -26,7 +71,7 @@ def create_session_token(data: dict) -> str:
     return serializer.dumps(data)
 
 # 驗證 Session Token
-def verify_session_token(token: str, max_age: Optional[int] = 3600) -> Optional[dict]:
+def verify_session_token(token: str, max_age: Optional[int] = SESSION_MAX_AGE) -> Optional[dict]:
     """驗證 Session Token，如果有效則回傳資料，否則回傳 None"""
     try:
         # max_age 參數設定 Token 的最長有效期限（秒）
@@ -34,4 +79,12 @@ def verify_session_token(token: str, max_age: Optional[int] = 3600) -> Optional[
         return data
     except Exception:
         # Token 無效或過期時會拋出異常
-        return None
\ No newline at end of file
+        return None
+
+def load_session_token(token: str, max_age: int = SESSION_MAX_AGE) -> Optional[Tuple[dict, float]]:
+    """同 verify_session_token，另外回傳 Token 的過期時間 (epoch 秒)，無效時回傳 None"""
+    try:
+        data, issued_at = serializer.loads(token, max_age=max_age, return_timestamp=True)
+        return data, calendar.timegm(issued_at.utctimetuple()) + max_age
+    except Exception:
+        return None
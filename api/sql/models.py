@@ -69,4 +69,15 @@ class AiResult:
     save_path: List[str] = field(default_factory=list)
     created_at: datetime = field(default_factory=datetime.utcnow)
     updated_at: datetime = field(default_factory=datetime.utcnow)
-    id: str = field(default_factory=lambda: str(uuid.uuid4()))
\ No newline at end of file
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+# Exam_Student_Summary (學生測驗彙總)
+@dataclass
+class ExamStudentSummary:
+    """Per-student, per-exam totals maintained on upload and grading (see sql/summary.py)."""
+    __tablename__ = 'exam_student_summary'
+    exam_id: str
+    student_id: str
+    uploaded_pages: int = 0
+    graded_pages: int = 0
+    total_score: int = 0
+    updated_at: Optional[datetime] = None
@@ -0,0 +1,197 @@
+import argparse
+import logging
+
+from sqlalchemy import inspect, text
+
+from logs import log_event
+from sql import summary
+
+logger = logging.getLogger(__name__)
+
+# SQLite 模式 (DATABASE_URL=sqlite:///...) 使用的資料表，欄位與正式環境的 MySQL 相同
+SQLITE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS Teachers (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        office TEXT,
+        account TEXT NOT NULL UNIQUE,
+        password TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS classes (
+        id TEXT PRIMARY KEY,
+        teacher_id TEXT NOT NULL REFERENCES Teachers (id),
+        subject TEXT,
+        class_name TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS students (
+        id TEXT PRIMARY KEY,
+        student_id TEXT NOT NULL,
+        name TEXT NOT NULL,
+        class_id TEXT NOT NULL REFERENCES classes (id),
+        class TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS exams (
+        id TEXT PRIMARY KEY,
+        teacher_id TEXT NOT NULL REFERENCES Teachers (id),
+        class_id TEXT NOT NULL REFERENCES classes (id),
+        exam_name TEXT NOT NULL,
+        total_pages INTEGER,
+        correct_answer TEXT,
+        created_at TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS exam_pages (
+        id TEXT PRIMARY KEY,
+        exam_id TEXT NOT NULL REFERENCES exams (id),
+        student_id TEXT NOT NULL REFERENCES students (id),
+        page_number INTEGER,
+        photo_path TEXT NOT NULL,
+        photo_hash TEXT,
+        ai_result TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ai_result (
+        id TEXT PRIMARY KEY,
+        exam_page_id TEXT NOT NULL REFERENCES exam_pages (id),
+        result TEXT,
+        score INTEGER,
+        save_path TEXT,
+        detections TEXT,
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_classes_teacher_id ON classes (teacher_id)",
+    "CREATE INDEX IF NOT EXISTS idx_students_class_id ON students (class_id)",
+    "CREATE INDEX IF NOT EXISTS idx_exams_class_id ON exams (class_id)",
+    "CREATE INDEX IF NOT EXISTS idx_exam_pages_exam_id ON exam_pages (exam_id, page_number)",
+]
+
+AI_RESULT_PAGE_INDEX = "uq_ai_result_exam_page_id"
+
+# 列表 API 的 keyset 分頁 (見 pagination.py) 依這些欄位排序與比較
+LIST_INDEXES = {
+    "classes": ("idx_classes_teacher_keyset", "teacher_id, id"),
+    "exams": ("idx_exams_class_keyset", "class_id, created_at, id"),
+    "students": ("idx_students_class_keyset", "class_id, student_id, id"),
+}
+
+
+class SchemaError(RuntimeError):
+    """資料庫結構無法自動補齊 (需要人工執行 migration)，API 不應在此狀態下啟動"""
+
+
+def count_duplicate_ai_results(conn) -> int:
+    """同一頁有多筆 ai_result 的頁數 (舊版逐筆寫入留下的資料)"""
+    return conn.execute(text("""
+        SELECT COUNT(*) FROM (
+            SELECT exam_page_id FROM ai_result GROUP BY exam_page_id HAVING COUNT(*) > 1
+        ) AS duplicated
+    """)).scalar()
+
+
+def dedupe_ai_results(engine) -> int:
+    """
+    刪除同一頁重複的 ai_result，只保留最後更新的一筆，回傳刪除筆數。
+    會刪除資料，只由 migration 指令執行 (python -m sql.schema --dedupe-ai-results)，不在 API 啟動時執行。
+    """
+    with engine.begin() as conn:
+        if engine.dialect.name == "mysql":
+            removed = conn.execute(text("""
+                DELETE older FROM ai_result AS older
+                JOIN ai_result AS newer
+                    ON older.exam_page_id = newer.exam_page_id
+                    AND (older.updated_at < newer.updated_at
+                         OR (older.updated_at = newer.updated_at AND older.id < newer.id))
+            """)).rowcount
+        else:
+            removed = conn.execute(text("""
+                DELETE FROM ai_result
+                WHERE rowid NOT IN (SELECT MAX(rowid) FROM ai_result GROUP BY exam_page_id)
+            """)).rowcount
+    log_event(logger, logging.INFO, "ai_result_deduplicated", removed=removed)
+    return removed
+
+
+def ensure_schema(engine):
+    """
+    啟動時補上程式需要、但既有資料庫可能還沒有的欄位與索引 (可重複執行，只新增、不刪除資料)。
+    無法完成時拋出例外，呼叫端 (lifespan) 應中止啟動。
+    - SQLite 模式：建立所有資料表
+    - exam_pages.photo_hash: 照片內容雜湊，作為 /photo 的 ETag 與不可變網址 (見 photo_store)
+    - ai_result.detections: 每頁的偵測框、辨識文字與配對連線 (JSON，見 view.detections.Detections.to_compact)
+    - ai_result.exam_page_id 的 unique index：save_ai_results 以 upsert 批次寫入；
+      已有重複資料時拋出 SchemaError，需先執行 python -m sql.schema --dedupe-ai-results
+    - exam_student_summary：每位學生每份測驗的彙總 (見 sql.summary)，第一次建立時由既有資料回填
+    - LIST_INDEXES：列表 API 分頁用的複合索引
+    """
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            for statement in SQLITE_TABLES:
+                conn.execute(text(statement))
+
+    inspector = inspect(engine)
+    has_summary = inspector.has_table(summary.SUMMARY_TABLE)
+    missing_list_indexes = [
+        (table, name, columns) for table, (name, columns) in LIST_INDEXES.items()
+        if name not in {index["name"] for index in inspector.get_indexes(table)}
+    ]
+    columns = {column["name"] for column in inspector.get_columns("ai_result")}
+    page_columns = {column["name"] for column in inspector.get_columns("exam_pages")}
+    indexes = {index["name"] for index in inspector.get_indexes("ai_result")}
+    with engine.begin() as conn:
+        if "photo_hash" not in page_columns:
+            conn.execute(text("ALTER TABLE exam_pages ADD COLUMN photo_hash VARCHAR(64) NULL"))
+            log_event(logger, logging.INFO, "schema_migrated", table="exam_pages", column="photo_hash")
+
+        if "detections" not in columns:
+            conn.execute(text("ALTER TABLE ai_result ADD COLUMN detections LONGTEXT NULL"))
+            log_event(logger, logging.INFO, "schema_migrated", table="ai_result", column="detections")
+
+        if AI_RESULT_PAGE_INDEX not in indexes:
+            # 舊版逐筆寫入可能留下同一頁的多筆結果，刪除資料需由 migration 指令明確執行
+            duplicated = count_duplicate_ai_results(conn)
+            if duplicated:
+                raise SchemaError(
+                    f"ai_result 有 {duplicated} 頁重複的結果，無法建立 {AI_RESULT_PAGE_INDEX}；"
+                    "請先執行 python -m sql.schema --dedupe-ai-results"
+                )
+            conn.execute(text(f"CREATE UNIQUE INDEX {AI_RESULT_PAGE_INDEX} ON ai_result (exam_page_id)"))
+            log_event(logger, logging.INFO, "schema_migrated", table="ai_result", index=AI_RESULT_PAGE_INDEX)
+
+        if not has_summary:
+            conn.execute(text(summary.SUMMARY_DDL))
+            rows = summary.backfill(conn)
+            log_event(logger, logging.INFO, "schema_migrated", table=summary.SUMMARY_TABLE, backfilled=rows)
+
+        for table, name, columns in missing_list_indexes:
+            conn.execute(text(f"CREATE INDEX {name} ON {table} ({columns})"))
+            log_event(logger, logging.INFO, "schema_migrated", table=table, index=name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="資料庫 migration (API 啟動時會自動執行不刪除資料的部分)")
+    parser.add_argument("--dedupe-ai-results", action="store_true",
+                        help="刪除同一頁重複的 ai_result (只保留最後更新的一筆) 後再建立 unique index")
+    opt = parser.parse_args()
+
+    from logs import setup_logging
+    from sql.database import engine
+
+    setup_logging()
+    if opt.dedupe_ai_results:
+        dedupe_ai_results(engine)
+    ensure_schema(engine)
+
+
+if __name__ == "__main__":
+    main()
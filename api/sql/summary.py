@@ -0,0 +1,82 @@
+from datetime import datetime
+from typing import Iterable
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+# 每位學生每份測驗的彙總 (已上傳頁數、已批改頁數、總分)，儀表板直接以主鍵讀取
+SUMMARY_TABLE = "exam_student_summary"
+
+SUMMARY_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {SUMMARY_TABLE} (
+        exam_id VARCHAR(36) NOT NULL,
+        student_id VARCHAR(36) NOT NULL,
+        uploaded_pages INTEGER NOT NULL DEFAULT 0,
+        graded_pages INTEGER NOT NULL DEFAULT 0,
+        total_score INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP NULL,
+        PRIMARY KEY (exam_id, student_id)
+    )
+"""
+
+# 由 exam_pages / ai_result 重新計算彙總，WHERE 條件由呼叫端補上
+_AGGREGATE = f"""
+    INSERT INTO {SUMMARY_TABLE} (exam_id, student_id, uploaded_pages, graded_pages, total_score, updated_at)
+    SELECT ep.exam_id, ep.student_id, COUNT(ep.id), COUNT(ar.id), COALESCE(SUM(ar.score), 0), :now
+    FROM exam_pages AS ep
+    LEFT JOIN ai_result AS ar ON ar.exam_page_id = ep.id
+    WHERE {{where}}
+    GROUP BY ep.exam_id, ep.student_id
+"""
+
+_UPSERT = {
+    "mysql": """
+        ON DUPLICATE KEY UPDATE uploaded_pages = VALUES(uploaded_pages), graded_pages = VALUES(graded_pages),
+            total_score = VALUES(total_score), updated_at = VALUES(updated_at)
+    """,
+    "sqlite": """
+        ON CONFLICT (exam_id, student_id) DO UPDATE SET uploaded_pages = excluded.uploaded_pages,
+            graded_pages = excluded.graded_pages, total_score = excluded.total_score, updated_at = excluded.updated_at
+    """,
+}
+
+
+def _aggregate_sql(dialect: str, where: str):
+    return _AGGREGATE.format(where=where) + _UPSERT.get(dialect, _UPSERT["sqlite"])
+
+
+def refresh_students(db: Session, exam_id: str, student_ids: Iterable[str]):
+    """
+    上傳完成後：重新計算這些學生在此測驗的彙總 (只讀取他們自己的頁面)，由呼叫端負責 commit。
+    """
+    student_ids = sorted(set(student_ids))
+    if not student_ids:
+        return
+    sql = text(_aggregate_sql(
+        db.get_bind().dialect.name, "ep.exam_id = :exam_id AND ep.student_id IN :student_ids"
+    )).bindparams(bindparam("student_ids", expanding=True))
+    db.execute(sql, {"exam_id": exam_id, "student_ids": student_ids, "now": datetime.now()})
+
+
+def refresh_pages(db: Session, exam_page_ids: Iterable[str]):
+    """
+    批改結果寫入後：重新計算這些頁面所屬學生的彙總，由呼叫端負責 commit。
+    以重新計算 (而非累加) 更新分數，重新批改同一頁時不會重複計入。
+    """
+    exam_page_ids = sorted(set(exam_page_ids))
+    if not exam_page_ids:
+        return
+    sql = text(_aggregate_sql(
+        db.get_bind().dialect.name,
+        """(ep.exam_id, ep.student_id) IN (
+            SELECT exam_id, student_id FROM exam_pages WHERE id IN :exam_page_ids
+        )"""
+    )).bindparams(bindparam("exam_page_ids", expanding=True))
+    db.execute(sql, {"exam_page_ids": exam_page_ids, "now": datetime.now()})
+
+
+def backfill(conn):
+    """建立彙總表後，由既有的 exam_pages / ai_result 產生所有彙總"""
+    return conn.execute(
+        text(_aggregate_sql(conn.dialect.name, "1 = 1")), {"now": datetime.now()}
+    ).rowcount
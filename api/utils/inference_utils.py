@@ -0,0 +1,119 @@
+# Torch-free inference utils
+# Everything here only needs numpy + OpenCV so that ONNX Runtime nodes can run the grading pipeline
+# without importing torch. utils.datasets / utils.plots re-export these for backwards compatibility.
+
+import math
+import random
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+img_formats = ['bmp', 'jpg', 'jpeg', 'png', 'tif', 'tiff', 'dng', 'webp', 'mpo']  # acceptable image suffixes
+
+
+def letterbox(img, new_shape=(640, 640), color=(114, 114, 114), auto=True, scaleFill=False, scaleup=True, stride=32):
+    # Resize and pad image while meeting stride-multiple constraints
+    shape = img.shape[:2]  # current shape [height, width]
+    if isinstance(new_shape, int):
+        new_shape = (new_shape, new_shape)
+
+    # Scale ratio (new / old)
+    r = min(new_shape[0] / shape[0], new_shape[1] / shape[1])
+    if not scaleup:  # only scale down, do not scale up (for better test mAP)
+        r = min(r, 1.0)
+
+    # Compute padding
+    ratio = r, r  # width, height ratios
+    new_unpad = int(round(shape[1] * r)), int(round(shape[0] * r))
+    dw, dh = new_shape[1] - new_unpad[0], new_shape[0] - new_unpad[1]  # wh padding
+    if auto:  # minimum rectangle
+        dw, dh = np.mod(dw, stride), np.mod(dh, stride)  # wh padding
+    elif scaleFill:  # stretch
+        dw, dh = 0.0, 0.0
+        new_unpad = (new_shape[1], new_shape[0])
+        ratio = new_shape[1] / shape[1], new_shape[0] / shape[0]  # width, height ratios
+
+    dw /= 2  # divide padding into 2 sides
+    dh /= 2
+
+    if shape[::-1] != new_unpad:  # resize
+        img = cv2.resize(img, new_unpad, interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)  # add border
+    return img, ratio, (dw, dh)
+
+
+
+class LoadImageBatches:  # for batched inference
+    def __init__(self, paths, img_size=640, stride=32, batch_size=8, workers=4, images=None):
+        # Every page is letterboxed to the same fixed shape (auto=False) so the batch can be stacked
+        self.files = [str(Path(p).absolute()) for p in paths]
+        self.images = images  # optional already-decoded BGR images (same order as paths), skips cv2.imread
+        self.img_size = img_size  # must be a multiple of stride, see check_img_size()
+        self.stride = stride
+        self.batch_size = max(1, int(batch_size))
+        self.workers = max(1, min(int(workers), self.batch_size))
+        self.nf = len(self.files)
+        self.nb = math.ceil(self.nf / self.batch_size)  # number of batches
+
+    def __iter__(self):
+        self.count = 0
+        return self
+
+    def __next__(self):
+        if self.count >= self.nf:
+            raise StopIteration
+        indices = list(range(self.count, min(self.count + self.batch_size, self.nf)))
+        self.count = indices[-1] + 1
+
+        # Read + letterbox in a thread pool (cv2 releases the GIL)
+        with ThreadPool(self.workers) as pool:
+            loaded = pool.map(self._load, indices)
+
+        img = np.ascontiguousarray(np.stack([x[0] for x in loaded], 0))  # B x 3 x H x W
+        im0s = [x[1] for x in loaded]
+        return indices, [self.files[i] for i in indices], img, im0s
+
+    def _load(self, i):
+        path = self.files[i]
+        img0 = self.images[i] if self.images is not None else cv2.imread(path)  # BGR
+        assert img0 is not None, 'Image Not Found ' + path
+
+        # Padded resize (fixed shape)
+        img = letterbox(img0, self.img_size, auto=False, stride=self.stride)[0]
+
+        # Convert
+        img = img[:, :, ::-1].transpose(2, 0, 1)  # BGR to RGB, to 3xHxW
+        return img, img0
+
+    def __len__(self):
+        return self.nb  # number of batches
+
+
+def plot_one_box(x, img, color=None, label=None, line_thickness=3):
+    # Plots one bounding box on image img
+    tl = line_thickness or round(0.002 * (img.shape[0] + img.shape[1]) / 2) + 1  # line/font thickness
+    color = color or [random.randint(0, 255) for _ in range(3)]
+    c1, c2 = (int(x[0]), int(x[1])), (int(x[2]), int(x[3]))
+    cv2.rectangle(img, c1, c2, color, thickness=tl, lineType=cv2.LINE_AA)
+    if label:
+        tf = max(tl - 1, 1)  # font thickness
+        t_size = cv2.getTextSize(label, 0, fontScale=tl / 3, thickness=tf)[0]
+        c2 = c1[0] + t_size[0], c1[1] - t_size[1] - 3
+        cv2.rectangle(img, c1, c2, color, -1, cv2.LINE_AA)  # filled
+        cv2.putText(img, label, (c1[0], c1[1] - 2), 0, tl / 3, [225, 255, 255], thickness=tf, lineType=cv2.LINE_AA)
+
+
+def scale_boxes(img1_shape, boxes, img0_shape):
+    # Rescale xyxy boxes (numpy, n x >=4) from letterboxed img1_shape back to img0_shape, see utils.general.scale_coords
+    gain = min(img1_shape[0] / img0_shape[0], img1_shape[1] / img0_shape[1])  # gain  = old / new
+    pad = (img1_shape[1] - img0_shape[1] * gain) / 2, (img1_shape[0] - img0_shape[0] * gain) / 2  # wh padding
+    boxes[:, [0, 2]] -= pad[0]  # x padding
+    boxes[:, [1, 3]] -= pad[1]  # y padding
+    boxes[:, :4] /= gain
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, img0_shape[1])  # x1, x2
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, img0_shape[0])  # y1, y2
+    return boxes
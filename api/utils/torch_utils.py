@@ -1,11 +1,14 @@
 # YOLOR PyTorch utils
 
 import datetime
+import hashlib
 import logging
 import math
 import os
 import platform
+import re
 import subprocess
+import tempfile
 import time
 from contextlib import contextmanager
 from copy import deepcopy
@@ -17,10 +20,13 @@ import torch.nn as nn
 import torch.nn.functional as F
 import torchvision
 
+from logs import log_event
+
 try:
     import thop  # for FLOPS computation
 except ImportError:
     thop = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -340,12 +346,36 @@ def revert_sync_batchnorm(module):
     return module_output
 
 
+def traced_model_cache_key(weights, img_size, device):
+    # Traced artifacts are only valid for the same weights, input size, device and torch build
+    h = hashlib.sha256()
+    with open(weights, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    device = re.sub(r'[^0-9A-Za-z]+', '-', str(device or 'cpu'))
+    torch_version = re.sub(r'[^0-9A-Za-z.]+', '-', torch.__version__)
+    return f'{h.hexdigest()[:16]}_{img_size}_{device}_torch{torch_version}'
+
+
+def save_jit_atomic(module, path):
+    # Write to a temp file in the same directory, then rename, so concurrent workers never read a partial file
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=path.name + '.', suffix='.tmp', dir=path.parent)
+    os.close(fd)
+    try:
+        torch.jit.save(module, tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
 class TracedModel(nn.Module):
 
-    def __init__(self, model=None, device=None, img_size=(640,640)): 
+    def __init__(self, model=None, device=None, img_size=(640,640), weights=None, cache_dir=None):
         super(TracedModel, self).__init__()
         
-        print(" Convert model to Traced-model... ") 
         self.stride = model.stride
         self.names = model.names
         self.model = model
@@ -356,17 +386,35 @@ class TracedModel(nn.Module):
 
         self.detect_layer = self.model.model[-1]
         self.model.traced = True
-        
-        rand_example = torch.rand(1, 3, img_size, img_size)
-        
-        traced_script_module = torch.jit.trace(self.model, rand_example, strict=False)
-        #traced_script_module = torch.jit.script(self.model)
-        traced_script_module.save("traced_model.pt")
-        print(" traced_script_module saved! ")
+
+        # With weights + cache_dir, reuse a previously traced artifact instead of re-tracing
+        cache_file = None
+        if weights and cache_dir:
+            cache_file = Path(cache_dir) / f'traced_{traced_model_cache_key(weights, img_size, device)}.pt'
+
+        if cache_file is not None and cache_file.exists():
+            try:
+                traced_script_module = torch.jit.load(str(cache_file), map_location='cpu')
+                log_event(logger, logging.INFO, "traced_model_cache_hit", path=str(cache_file))
+            except Exception as e:
+                log_event(logger, logging.WARNING, "traced_model_cache_unreadable", path=str(cache_file), error=str(e))
+                traced_script_module = None
+        else:
+            traced_script_module = None
+
+        if traced_script_module is None:
+            log_event(logger, logging.INFO, "model_tracing", img_size=img_size)
+            rand_example = torch.rand(1, 3, img_size, img_size)
+            
+            traced_script_module = torch.jit.trace(self.model, rand_example, strict=False)
+            #traced_script_module = torch.jit.script(self.model)
+            save_jit_atomic(traced_script_module, cache_file or "traced_model.pt")
+            log_event(logger, logging.INFO, "traced_model_saved", path=str(cache_file or "traced_model.pt"))
+
         self.model = traced_script_module
         self.model.to(device)
         self.detect_layer.to(device)
-        print(" model is traced! \n") 
+        log_event(logger, logging.INFO, "model_traced", device=str(device))
 
     def forward(self, x, augment=False, profile=False):
         out = self.model(x)
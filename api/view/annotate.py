@@ -0,0 +1,62 @@
+import cv2
+
+from utils.inference_utils import plot_one_box
+
+# 繪圖操作種類
+OP_BOX = "box"
+OP_CIRCLE = "circle"
+OP_LINE = "line"
+
+
+class PageAnnotator:
+    """
+    一頁結果圖的繪圖記錄：只保留一份原圖 (不複製) 與各輸出圖 (view) 的繪圖操作列表，
+    到 render() 時才複製原圖並依序畫上，每個 view 只光柵化一次。
+    取代每頁 copy() 多份全解析度影像、再分別在每份 ImageSaver 上繪圖的做法。
+    """
+
+    def __init__(self, img=None):
+        """
+        - img: 原始影像 (numpy array，不會被修改)；只記錄操作、render() 時才提供影像的話可為 None
+        """
+        self.img = img
+        self.ops = {}  # {view: [(op, args), ...]}
+
+    def _add(self, view, op, *args):
+        self.ops.setdefault(view, []).append((op, args))
+
+    def box(self, view, xyxy, label=None, color=None, line_thickness=2):
+        self._add(view, OP_BOX, tuple(int(v) for v in xyxy), label, color, line_thickness)
+
+    def circle(self, view, center, radius, color, thickness=-1):
+        self._add(view, OP_CIRCLE, (int(center[0]), int(center[1])), radius, color, thickness)
+
+    def line(self, view, pt1, pt2, color, thickness=2):
+        self._add(view, OP_LINE, (int(pt1[0]), int(pt1[1])), (int(pt2[0]), int(pt2[1])), color, thickness)
+
+    def views(self):
+        return list(self.ops)
+
+    def render(self, view, img=None, scale=1.0):
+        """
+        複製影像並畫上此 view 的所有操作
+        - img: 要繪製的影像 (可選，預設為建構時的原圖)，例如已縮小的原圖
+        - scale: img 相對於原圖的縮放比例，座標依此換算 (半徑、線寬與字型大小不變)
+        """
+        canvas = (self.img if img is None else img).copy()
+
+        def pt(x, y):
+            return int(round(x * scale)), int(round(y * scale))
+
+        for op, args in self.ops.get(view, []):
+            if op == OP_BOX:
+                (x1, y1, x2, y2), label, color, line_thickness = args
+                plot_one_box((*pt(x1, y1), *pt(x2, y2)), canvas, label=label, color=color,
+                             line_thickness=line_thickness)
+            elif op == OP_CIRCLE:
+                center, radius, color, thickness = args
+                cv2.circle(canvas, pt(*center), radius=radius, color=color, thickness=thickness)
+            elif op == OP_LINE:
+                pt1, pt2, color, thickness = args
+                cv2.line(canvas, pt(*pt1), pt(*pt2), color, thickness)
+        return canvas
@@ -0,0 +1,132 @@
+import numpy as np
+
+
+class Detection:
+    """
+    Detections 中單一偵測框的輕量 view (不複製資料，只記錄所屬的 Detections 與索引)。
+    """
+    __slots__ = ("_dets", "index")
+
+    def __init__(self, dets, index):
+        self._dets = dets
+        self.index = index
+
+    @property
+    def xyxy(self):
+        return self._dets.xyxy[self.index]
+
+    @property
+    def x1(self):
+        return int(self._dets.xyxy[self.index, 0])
+
+    @property
+    def y1(self):
+        return int(self._dets.xyxy[self.index, 1])
+
+    @property
+    def x2(self):
+        return int(self._dets.xyxy[self.index, 2])
+
+    @property
+    def y2(self):
+        return int(self._dets.xyxy[self.index, 3])
+
+    @property
+    def top_left(self):
+        return (self.x1, self.y1)
+
+    @property
+    def center(self):
+        """中心點座標"""
+        return (int(self._dets.centers[self.index, 0]), int(self._dets.centers[self.index, 1]))
+
+    @property
+    def conf(self):
+        return float(self._dets.conf[self.index])
+
+    @property
+    def cls(self):
+        return int(self._dets.cls[self.index])
+
+    @property
+    def text(self):
+        return self._dets.text[self.index]
+
+    @property
+    def score(self):
+        return float(self._dets.score[self.index])
+
+    def __repr__(self):
+        return (f"Detection(xyxy={self.xyxy.tolist()}, conf={self.conf:.2f}, cls={self.cls}, "
+                f"text={self.text!r})")
+
+
+class Detections:
+    """
+    以欄位陣列 (columnar) 保存一頁的偵測結果，取代逐框的 tuple / dict / BBox：
+    - xyxy: (n, 4) int32，原圖座標
+    - conf: (n,) float32，偵測信心分數
+    - cls: (n,) int64，類別
+    - text: (n,) object，辨識文字 (手寫作答 / 題號 OCR)，沒有時為 None
+    - score: (n,) float32，辨識文字的信心分數
+    索引與迭代回傳 Detection view。
+    """
+    __slots__ = ("xyxy", "conf", "cls", "text", "score", "centers")
+
+    def __init__(self, xyxy, conf, cls, text=None, score=None):
+        self.xyxy = np.asarray(xyxy, dtype=np.int32).reshape(-1, 4)
+        n = len(self.xyxy)
+        self.conf = np.asarray(conf, dtype=np.float32).reshape(n)
+        self.cls = np.asarray(cls, dtype=np.int64).reshape(n)
+        self.text = np.array(text if text is not None else [None] * n, dtype=object).reshape(n)
+        self.score = np.asarray(score if score is not None else np.zeros(n), dtype=np.float32).reshape(n)
+        self.centers = (self.xyxy[:, :2] + self.xyxy[:, 2:]) // 2
+
+    @classmethod
+    def from_array(cls, det):
+        """由 NMS 輸出 (n, 6) [x1, y1, x2, y2, conf, cls] 建立"""
+        det = np.asarray(det, dtype=np.float32).reshape(-1, 6)
+        return cls(det[:, :4], det[:, 4], det[:, 5])
+
+    def __len__(self):
+        return len(self.xyxy)
+
+    def __getitem__(self, index):
+        return Detection(self, index)
+
+    def __iter__(self):
+        return (Detection(self, i) for i in range(len(self)))
+
+    def take(self, order):
+        """依索引陣列取出 (或重新排列) 子集合"""
+        return Detections(self.xyxy[order], self.conf[order], self.cls[order], self.text[order], self.score[order])
+
+    def sorted_by_center_y(self):
+        """由上而下排序 (依中心點 y，相同時維持原順序)"""
+        return self.take(np.argsort(self.centers[:, 1], kind="stable"))
+
+    def indices_of(self, class_id):
+        return np.flatnonzero(self.cls == class_id)
+
+    def as_array(self):
+        """(n, 6) [x1, y1, x2, y2, conf, cls]，供 PageLayoutIndex / QuestionItemMatcher 使用"""
+        return np.column_stack([self.xyxy, self.conf, self.cls]).astype(np.float32)
+
+    def to_compact(self, class_table):
+        """
+        精簡的欄位格式 (JSON)，存入 ai_result.detections 與結果圖描述檔：
+        {"classes": [...], "xyxy": [x1, y1, x2, y2, ...], "conf": [...], "cls": [...], "text": [...], "score": [...]}
+        """
+        return {
+            "classes": list(class_table),
+            "xyxy": self.xyxy.ravel().tolist(),
+            "conf": np.round(self.conf.astype(np.float64), 3).tolist(),
+            "cls": self.cls.tolist(),
+            "text": self.text.tolist(),
+            "score": np.round(self.score.astype(np.float64), 3).tolist(),
+        }
+
+    @classmethod
+    def from_compact(cls, data):
+        """由 to_compact() 的結果還原"""
+        return cls(data["xyxy"], data["conf"], data["cls"], text=data["text"], score=data["score"])
@@ -0,0 +1,368 @@
+"""
+結果圖 (overlay) 的延後產生：
+
+- 視覺辨識時只寫出一個小的描述檔 overlay_<stem>.json (原圖路徑、偵測框、配對連線)，不在批改迴圈中繪圖與編碼
+- 背景 thread 依描述檔產生縮圖 (預設 WebP，長邊 OVERLAY_MAX_SIDE)：<view>_<stem>.webp
+- 原尺寸版本 <view>_<stem>_full.webp 以及尚未產生的縮圖，都在第一次被請求時才繪製 (ensure())
+- /ai/overlay 由 ai_result.detections (與描述檔相同的內容) 直接繪製指定 view 與尺寸，結果放在 OverlayCache
+"""
+import json
+import logging
+import mimetypes
+import os
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from collections import OrderedDict
+from random import Random
+from uuid import uuid4
+
+import cv2
+
+from logs import log_event
+from metrics import OVERLAY_SECONDS
+from view.annotate import PageAnnotator
+from view.detections import Detections
+
+logger = logging.getLogger(__name__)
+
+# 輸出格式 (webp / jpg / png)、縮圖長邊 (像素，0 = 原尺寸) 與壓縮品質
+OVERLAY_FORMAT = os.getenv("OVERLAY_FORMAT", "webp").lower().lstrip(".")
+OVERLAY_MAX_SIDE = int(os.getenv("OVERLAY_MAX_SIDE", "1280"))
+OVERLAY_QUALITY = int(os.getenv("OVERLAY_QUALITY", "80"))
+# 批改後是否在背景預先產生縮圖 (關閉時全部在第一次請求時才產生)
+OVERLAY_PRERENDER = os.getenv("OVERLAY_PRERENDER", "1") == "1"
+OVERLAY_WORKERS = int(os.getenv("OVERLAY_WORKERS", "1"))
+# /ai/overlay 已編碼結果圖的 LRU 快取上限 (bytes)
+OVERLAY_CACHE_BYTES = int(os.getenv("OVERLAY_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+# 每頁輸出的結果圖
+VIEW_BOUNDING_BOX = "bounding_box"  # 所有偵測框
+VIEW_GROUP = "group"                # 題號 / 作答與 item 的配對連線
+VIEW_STEP3 = "step3"                # question / answer / item 的偵測框
+OVERLAY_VIEWS = (VIEW_BOUNDING_BOX, VIEW_GROUP, VIEW_STEP3)
+VIEW_GRADING = "grading"            # 作答框依批改結果標示對錯 (只由 /ai/overlay 產生)
+
+SIZE_THUMB = "thumb"
+SIZE_FULL = "full"
+
+_GROUP_CLASSES = ("question", "answer", "item")
+
+# 部分 Python 版本的 mimetypes 沒有 webp
+mimetypes.add_type("image/webp", ".webp")
+
+
+def class_color(name):
+    """類別的固定顏色 (BGR)，延後繪製或重新繪製時顏色都一致"""
+    rng = Random(zlib.crc32(name.encode()))
+    return [rng.randint(0, 255) for _ in range(3)]
+
+
+def spec_path(save_dir, photo_path):
+    return Path(save_dir) / f"overlay_{Path(photo_path).stem}.json"
+
+
+def overlay_path(save_dir, photo_path, view, size=SIZE_THUMB):
+    return _overlay_file(save_dir, Path(photo_path).stem, view, size)
+
+
+def _overlay_file(save_dir, stem, view, size):
+    suffix = "_full" if size == SIZE_FULL else ""
+    return Path(save_dir) / f"{view}_{stem}{suffix}.{OVERLAY_FORMAT}"
+
+
+def overlay_paths(save_dir, photo_path, size=SIZE_THUMB):
+    return [str(overlay_path(save_dir, photo_path, view, size)) for view in OVERLAY_VIEWS]
+
+
+def parse_overlay_path(path):
+    """
+    由結果圖路徑反查描述檔
+    :return: (描述檔路徑, view, size)，不是結果圖的路徑時回傳 None
+    """
+    path = Path(path)
+    if path.suffix.lstrip(".").lower() != OVERLAY_FORMAT:
+        return None
+    name = path.stem
+    size = SIZE_THUMB
+    if name.endswith("_full"):
+        name, size = name[:-len("_full")], SIZE_FULL
+    for view in OVERLAY_VIEWS:
+        if name.startswith(view + "_"):
+            return path.parent / f"overlay_{name[len(view) + 1:]}.json", view, size
+    return None
+
+
+def write_spec(save_dir, photo_path, shape, detections, links):
+    """
+    寫出一頁的結果圖描述檔 (先寫暫存檔再 rename)，並刪除依舊描述檔產生的結果圖 (重新批改後不會顯示舊的偵測框)
+    - shape: 原圖尺寸 (h, w)
+    - detections: Detections.to_compact() 的結果
+    - links: 配對連線 [[起點 det 索引, 終點 det 索引], ...]
+    """
+    path = spec_path(save_dir, photo_path)
+    spec = {"photo_path": str(photo_path), "shape": list(shape[:2]), "detections": detections, "links": links}
+    tmp = path.with_name(f".{uuid4().hex}.tmp")
+    tmp.write_text(json.dumps(spec, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+    for size in (SIZE_THUMB, SIZE_FULL):
+        for view in OVERLAY_VIEWS:
+            try:
+                os.remove(overlay_path(save_dir, photo_path, view, size))
+            except FileNotFoundError:
+                pass
+    return str(path)
+
+
+def build_annotator(spec, grading=None):
+    """
+    依描述檔記錄各 view 的繪圖操作 (座標為原圖尺寸)
+    - grading: ai_result.result 的批改細節 {題號: {is_correct, score_awarded, ...}} (可選)，提供時加上 grading view
+    """
+    annotator = PageAnnotator()
+    dets = Detections.from_compact(spec["detections"])
+    classes = spec["detections"]["classes"]
+    for box in dets:
+        name = classes[box.cls]
+        label = f'{name} {box.conf:.2f}'
+        color = class_color(name)
+        annotator.box(VIEW_BOUNDING_BOX, box.xyxy, label=label, color=color, line_thickness=2)
+        if name in _GROUP_CLASSES:
+            annotator.circle(VIEW_GROUP, box.center, radius=5, color=(255, 0, 0), thickness=-1)
+            annotator.box(VIEW_STEP3, box.xyxy, label=label, color=color, line_thickness=2)
+    for start, end in spec["links"]:
+        annotator.line(VIEW_GROUP, dets[start].center, dets[end].center, (0, 0, 255), 2)
+
+    if grading is not None:
+        # 作答 → item 的連線：item 的 OCR 文字即題號 (與 detect.grade_results 相同的清理方式)
+        for start, end in spec["links"]:
+            if classes[dets[start].cls] != "answer":
+                continue
+            detail = grading.get(re.sub(r'\D', '', dets[end].text or ''))
+            if detail is None:
+                continue
+            color = (0, 200, 0) if detail.get('is_correct') else (0, 0, 255)
+            annotator.box(VIEW_GRADING, dets[start].xyxy, label=f"{dets[start].text} +{detail.get('score_awarded', 0)}",
+                          color=color, line_thickness=3)
+    return annotator
+
+
+def _load_source(photo_path, shape, max_side):
+    """
+    讀取原圖並縮小到長邊不超過 max_side。JPEG 以 IMREAD_REDUCED_* 直接在解碼時縮小 (1/2、1/4、1/8)，
+    不必先解碼完整的 12MP 影像 (需要知道原圖尺寸 shape；未知時解碼完整影像後再縮小)。
+    :return: (影像, 相對於原圖的縮放比例)
+    """
+    flag = cv2.IMREAD_COLOR
+    if max_side and shape:
+        for factor, reduced in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if max(shape) / factor >= max_side:
+                flag = reduced
+                break
+    img = cv2.imread(str(photo_path), flag)
+    if img is None:
+        raise FileNotFoundError(f"無法讀取圖片: {photo_path}")
+    full_height = shape[0] if shape else img.shape[0]
+    if max_side and max(img.shape[:2]) > max_side:
+        ratio = max_side / max(img.shape[:2])
+        img = cv2.resize(img, (round(img.shape[1] * ratio), round(img.shape[0] * ratio)),
+                         interpolation=cv2.INTER_AREA)
+    return img, img.shape[0] / full_height
+
+
+def encode_image(img, fmt=None):
+    """將影像編碼為 OVERLAY_FORMAT (或指定格式) 的 bytes"""
+    fmt = (fmt or OVERLAY_FORMAT).lower().lstrip(".")
+    ok, buf = cv2.imencode(f".{fmt}", img, _encode_params(fmt))
+    if not ok:
+        raise RuntimeError(f"結果圖編碼失敗 ({fmt})")
+    return buf.tobytes()
+
+
+def render_view(spec, view, max_side=0, grading=None, photo_path=None):
+    """
+    繪製單一 view
+    - spec: 描述檔內容 (或 ai_result.detections)
+    - max_side: 輸出長邊上限 (0 = 原尺寸)
+    - photo_path: 原圖路徑 (可選，預設為 spec["photo_path"])
+    """
+    annotator = build_annotator(spec, grading=grading)
+    img, scale = _load_source(photo_path or spec["photo_path"], spec.get("shape"), max_side)
+    return annotator.render(view, img=img, scale=scale)
+
+
+def _encode_params(fmt=OVERLAY_FORMAT):
+    if fmt == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, OVERLAY_QUALITY]
+    if fmt in ("jpg", "jpeg"):
+        return [cv2.IMWRITE_JPEG_QUALITY, OVERLAY_QUALITY]
+    return []
+
+
+def render_overlays(spec_file, views=OVERLAY_VIEWS, size=SIZE_THUMB):
+    """依描述檔繪製並寫出指定的結果圖 (原圖只讀取一次)，回傳寫出的路徑"""
+    started = time.perf_counter()
+    spec_file = Path(spec_file)
+    spec = json.loads(spec_file.read_text(encoding="utf-8"))
+    annotator = build_annotator(spec)
+    img, scale = _load_source(spec["photo_path"], spec.get("shape"), OVERLAY_MAX_SIDE if size == SIZE_THUMB else 0)
+
+    written = []
+    for view in views:
+        data = encode_image(annotator.render(view, img=img, scale=scale))
+        path = overlay_path(spec_file.parent, spec["photo_path"], view, size)
+        tmp = path.with_name(f".{uuid4().hex}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        written.append(str(path))
+
+    seconds = time.perf_counter() - started
+    OVERLAY_SECONDS.observe(seconds, size=size)
+    log_event(logger, logging.DEBUG, "overlay_rendered", spec=str(spec_file), size=size, views=list(views),
+              seconds=round(seconds, 4))
+    return written
+
+
+class OverlayRenderer:
+    """
+    背景產生結果圖的 thread pool。同一張結果圖同時只會繪製一次：
+    背景預先產生與使用者請求 (ensure) 撞在一起時，請求端等待同一個工作完成。
+    """
+
+    def __init__(self, workers=OVERLAY_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="overlay")
+        self._lock = threading.Lock()
+        self._inflight = {}  # 結果圖路徑 -> Future
+
+    def _submit(self, spec_file, views, size):
+        """只繪製尚未在繪製中的 view，回傳所有 view 都完成時才完成的 Future"""
+        # 描述檔名為 overlay_<stem>.json
+        stem = Path(spec_file).stem[len("overlay_"):]
+        futures = []
+        with self._lock:
+            pending = {}
+            for view in views:
+                path = str(_overlay_file(Path(spec_file).parent, stem, view, size))
+                if path in self._inflight:
+                    futures.append(self._inflight[path])
+                else:
+                    pending[view] = path
+            if pending:
+                future = self._executor.submit(render_overlays, spec_file, tuple(pending), size)
+                for path in pending.values():
+                    self._inflight[path] = future
+                futures.append(future)
+
+        if pending:
+            def done(f, paths=list(pending.values())):
+                with self._lock:
+                    for path in paths:
+                        if self._inflight.get(path) is f:
+                            del self._inflight[path]
+                if f.exception() is not None:
+                    log_event(logger, logging.ERROR, "overlay_render_failed", spec=str(spec_file),
+                              error=str(f.exception()))
+
+            future.add_done_callback(done)
+        return futures[0] if len(futures) == 1 else _gather(futures)
+
+    def schedule(self, spec_file):
+        """批改後在背景產生此頁所有縮圖"""
+        return self._submit(spec_file, OVERLAY_VIEWS, SIZE_THUMB)
+
+    def ensure(self, path) -> Future:
+        """
+        確保結果圖存在：不存在時依描述檔繪製。
+        :return: 完成時結果為檔案路徑的 Future；不是結果圖或描述檔不存在時結果為 None
+        """
+        path = Path(path)
+        if path.exists():
+            return _done(str(path))
+        parsed = parse_overlay_path(path)
+        if parsed is None or not parsed[0].exists():
+            return _done(None)
+        spec_file, view, size = parsed
+        result = Future()
+        inner = self._submit(spec_file, (view,), size)
+        inner.add_done_callback(
+            lambda f: result.set_exception(f.exception()) if f.exception() else result.set_result(str(path))
+        )
+        return result
+
+
+def _done(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def _gather(futures):
+    """所有 Future 都完成時才完成 (結果為各自結果的 list)，任一失敗時以第一個例外結束"""
+    result = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        error = next((f.exception() for f in futures if f.exception() is not None), None)
+        if error is not None:
+            result.set_exception(error)
+        else:
+            result.set_result([f.result() for f in futures])
+
+    for future in futures:
+        future.add_done_callback(done)
+    return result
+
+
+class OverlayCache:
+    """
+    已編碼結果圖的 LRU 快取 (以總 bytes 為上限)。
+    key 應包含資料的版本 (例如 ai_result.updated_at)，重新批改後自然不會命中舊的圖。
+    """
+
+    def __init__(self, max_bytes=OVERLAY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._items[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer() -> OverlayRenderer:
+    """行程內共用的 OverlayRenderer (第一次使用時建立)"""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = OverlayRenderer()
+        return _renderer
@@ -1,6 +1,11 @@
+import logging
 from pathlib import Path
 import cv2
 
+from logs import log_event
+
+logger = logging.getLogger(__name__)
+
 class ImageSaver:
     global_save_dir = None  # 靜態變數，所有實例共用
 
@@ -9,21 +14,22 @@ class ImageSaver:
         """設定全域存儲目錄，所有實例都會使用此目錄"""
         ImageSaver.global_save_dir = Path(directory)
         ImageSaver.global_save_dir.mkdir(parents=True, exist_ok=True)  # 確保目錄存在
-        print(f"🌍 全域儲存目錄設定為：{ImageSaver.global_save_dir}")
+        log_event(logger, logging.INFO, "image_saver_dir_set", directory=str(ImageSaver.global_save_dir))
 
-    def __init__(self, img, p, prefix="copy"):
+    def __init__(self, img, p, prefix="copy", save_dir=None):
         """
         初始化 ImageSaver，準備影像存儲
         - img: 影像 (numpy array)
         - p: 原始檔案路徑 (Path 物件)
         - prefix: 儲存影像的前綴
+        - save_dir: 指定存儲目錄 (可選)，未指定時使用全域目錄；多個批改工作同時執行時應明確指定
         """
-        if ImageSaver.global_save_dir is None:
+        if save_dir is None and ImageSaver.global_save_dir is None:
             raise ValueError("❌ 請先使用 ImageSaver.set_save_dir() 設定存儲目錄！")
 
         self.im1 = img.copy()  # 儲存影像副本
         self.img_name = p.name  # 提取檔案名稱
-        self.save_path = ImageSaver.global_save_dir / f"{prefix}_{self.img_name}"
+        self.save_path = Path(save_dir or ImageSaver.global_save_dir) / f"{prefix}_{self.img_name}"
 
     def __call__(self):
         """當物件被呼叫時，回傳影像陣列 (im1)"""
@@ -32,5 +38,5 @@ class ImageSaver:
     def save(self):
         """儲存影像到指定目錄"""
         cv2.imwrite(str(self.save_path), self.im1)
-        print(f"✅ 影像已儲存： {self.save_path}")
+        log_event(logger, logging.DEBUG, "image_saved", path=str(self.save_path))
         return str(self.save_path)
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+def file_sha256(path, chunk_size: int = 1 << 20) -> str:
+    """計算檔案內容的 SHA-256 (十六進位字串)"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class VisionCache:
+    """
+    以「圖片內容雜湊 + 模型版本」為 key，快取一頁的視覺辨識結果
+    (YOLO 偵測框、手寫辨識、題號 OCR 與題號→作答配對)。
+
+    照片與模型都沒有變時，重新批改 (例如老師修改答案) 只需要重跑 grade_results。
+    資料存在本機 SQLite 檔案。
+    """
+
+    def __init__(self, db_path: str):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS vision_cache (
+                    image_hash TEXT NOT NULL,
+                    model_version TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    PRIMARY KEY (image_hash, model_version)
+                )
+            """)
+
+    def get_many(self, image_hashes: List[str], model_version: str) -> Dict[str, Dict]:
+        """一次查詢多個雜湊，回傳 {image_hash: result}，未命中的不會出現在結果中"""
+        hits = {}
+        unique = list(dict.fromkeys(image_hashes))
+        # SQLite 預設最多 999 個參數，分段查詢
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT image_hash, result FROM vision_cache "
+                    f"WHERE model_version = ? AND image_hash IN ({placeholders})",
+                    [model_version, *chunk]
+                ).fetchall()
+            hits.update({image_hash: json.loads(result) for image_hash, result in rows})
+        return hits
+
+    def get(self, image_hash: str, model_version: str) -> Optional[Dict]:
+        return self.get_many([image_hash], model_version).get(image_hash)
+
+    def put(self, image_hash: str, model_version: str, result: Dict) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO vision_cache (image_hash, model_version, result, created_at) VALUES (?, ?, ?, ?)",
+                (image_hash, model_version, json.dumps(result), datetime.now().isoformat())
+            )
+
+    def purge_other_versions(self, model_version: str) -> int:
+        """刪除其他模型版本的快取 (模型更新後可呼叫以回收空間)"""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM vision_cache WHERE model_version != ?", (model_version,)
+            ).rowcount
@@ -11,6 +11,7 @@ interface StudentWithPhotos {
     name: string;
     class_name: string;
     photos: string[];
+    photo_urls?: string[];
 }
 
 const Gallery: React.FC = () => {
@@ -56,8 +57,8 @@ const Gallery: React.FC = () => {
 
             <ul className="space-y-2 flex gap-1 overflow-x-scroll overflow-y-hidden">
                 <div className="flex gap-1">
-                    {student.photos.map((photoId) => (
-                        <Photo key={photoId} src={`/photo/${photoId}`} />
+                    {student.photos.map((photoId, index) => (
+                        <Photo key={photoId} src={student.photo_urls?.[index] ?? `/photo/${photoId}`} />
                     ))}
                 </div>
             </ul>
@@ -6,6 +6,21 @@ import { useParams, useRouter } from 'next/navigation';
 import Button from '../../_components/button';
 import { useExam } from '../_context/ExamContext';
 
+// 批改工作狀態輪詢：間隔由 1 秒逐步拉長到 10 秒，最多等待 30 分鐘
+const JOB_POLL_INITIAL_MS = 1000;
+const JOB_POLL_MAX_INTERVAL_MS = 10000;
+const JOB_POLL_TIMEOUT_MS = 30 * 60 * 1000;
+
+// 可被 AbortSignal 中斷的等待
+const sleep = (ms: number, signal: AbortSignal) =>
+    new Promise<void>((resolve, reject) => {
+        const timer = setTimeout(resolve, ms);
+        signal.addEventListener("abort", () => {
+            clearTimeout(timer);
+            reject(new DOMException("Aborted", "AbortError"));
+        }, { once: true });
+    });
+
 // 使用 window.location.pathname 來獲取路徑
 const usePathname = () => {
     if (typeof window !== 'undefined') {
@@ -233,6 +248,10 @@ const ExamPage: React.FC = () => {
     const [isModalOpen, setIsModalOpen] = useState<boolean>(false);
     const [uploadData, setUploadData] = useState<UploadData | null>(null);
 
+    // 批改工作輪詢，離開頁面時中止
+    const pollAbortRef = useRef<AbortController | null>(null);
+    useEffect(() => () => pollAbortRef.current?.abort(), []);
+
     useEffect(() => {
         const fetchStudents = async () => {
             // 只有在測驗資訊載入完成且沒有錯誤時才獲取學生名單
@@ -276,9 +295,15 @@ const ExamPage: React.FC = () => {
     };
 
     const handleClick = async () => {
+        pollAbortRef.current?.abort();
+        const controller = new AbortController();
+        pollAbortRef.current = controller;
+        const { signal } = controller;
+
         try {
             const response = await fetch(`/api/ai/detect_exam/${examId}`, {
                 method: "GET",
+                signal,
             });
 
             if (!response.ok) {
@@ -286,13 +311,41 @@ const ExamPage: React.FC = () => {
             }
 
             const data = await response.json();
-            console.log("AI 批改結果：", data);
+            console.log("AI 批改工作：", data);
+
+            // 批改在背景執行，輪詢工作狀態直到完成 (間隔逐步拉長，超過 JOB_POLL_TIMEOUT_MS 放棄)
+            if (data.job_id) {
+                const deadline = Date.now() + JOB_POLL_TIMEOUT_MS;
+                let interval = JOB_POLL_INITIAL_MS;
+                while (true) {
+                    if (Date.now() > deadline) {
+                        throw new Error("AI 批改逾時");
+                    }
+                    await sleep(interval, signal);
+                    interval = Math.min(interval * 1.5, JOB_POLL_MAX_INTERVAL_MS);
+                    const jobResponse = await fetch(`/api/ai/jobs/${data.job_id}`, { signal });
+                    if (!jobResponse.ok) {
+                        throw new Error("API 呼叫失敗");
+                    }
+                    const job = await jobResponse.json();
+                    if (job.status === "done") break;
+                    if (job.status === "failed") {
+                        throw new Error(job.error || "AI 批改失敗");
+                    }
+                }
+            }
 
             // 導到 /answer 頁面
             router.push(`/dashboard/exam/${examId}/answer`);
         } catch (error) {
+            // 離開頁面或重新送出時中止輪詢，不顯示錯誤
+            if (signal.aborted) return;
             console.error(error);
             alert("AI 批改失敗");
+        } finally {
+            if (pollAbortRef.current === controller) {
+                pollAbortRef.current = null;
+            }
         }
     };
 